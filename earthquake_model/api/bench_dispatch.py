@@ -0,0 +1,173 @@
+"""Benchmark delivering one alert to many stub IoT devices on localhost.
+
+    python -m api.bench_dispatch --devices 10000 --concurrency 200
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import time
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from api.dispatcher import AlertDispatcher, Device, DeviceRegistry, DispatchConfig
+
+_OK = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nContent-Type: text/plain\r\n\r\nok"
+_UNAVAILABLE = b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n"
+
+
+class StubDeviceServer:
+    """
+    Minimal keep-alive HTTP responder standing in for a fleet of devices.
+
+    Every device gets its own path. Devices listed in ``flaky`` answer 503 to
+    their first request so the retry path is exercised.
+    """
+
+    def __init__(self, flaky: Optional[Set[str]] = None, delay_s: float = 0.0) -> None:
+        self.flaky = set(flaky or ())
+        self.delay_s = delay_s
+        self.received = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.port = 0
+
+    async def start(self, host: str = "127.0.0.1") -> None:
+        self._server = await asyncio.start_server(self._handle, host, 0, backlog=4096)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *headers = head.decode("latin-1").split("\r\n")
+                length = 0
+                for header in headers:
+                    name, _, value = header.partition(":")
+                    if name.lower() == "content-length":
+                        length = int(value.strip())
+                if length:
+                    await reader.readexactly(length)
+                path = request_line.split(" ")[1]
+                if self.delay_s:
+                    await asyncio.sleep(self.delay_s)
+                if path in self.flaky:
+                    self.flaky.discard(path)
+                    writer.write(_UNAVAILABLE)
+                else:
+                    self.received += 1
+                    writer.write(_OK)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def _serve_stub(flaky: Set[str], delay_s: float, port_queue, stop_event) -> None:
+    async def serve() -> None:
+        server = StubDeviceServer(flaky=flaky, delay_s=delay_s)
+        await server.start()
+        port_queue.put(server.port)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, stop_event.wait)
+        await server.stop()
+
+    asyncio.run(serve())
+
+
+async def run_benchmark(
+    devices: int,
+    concurrency: int,
+    flaky_fraction: float = 0.01,
+    delay_s: float = 0.0,
+    seed: int = 42,
+) -> Dict:
+    rng = random.Random(seed)
+    flaky = {f"/devices/{i}/alert" for i in range(devices) if rng.random() < flaky_fraction}
+    # The stub fleet runs in its own process so it does not compete with the
+    # dispatcher for the event loop being measured.
+    ctx = multiprocessing.get_context("spawn")
+    port_queue = ctx.Queue()
+    stop_event = ctx.Event()
+    server = ctx.Process(target=_serve_stub, args=(flaky, delay_s, port_queue, stop_event), daemon=True)
+    server.start()
+    port = port_queue.get(timeout=30)
+
+    registry = DeviceRegistry()
+    registry.upsert_many(
+        [
+            Device(device_id=f"device-{i}", url=f"http://127.0.0.1:{port}/devices/{i}/alert")
+            for i in range(devices)
+        ],
+        persist=False,
+    )
+    config = DispatchConfig(max_concurrency=concurrency, backoff_base_s=0.05, receipts_kept=devices)
+    dispatcher = AlertDispatcher(registry, config)
+    alert = {
+        "alert_level": "HIGH",
+        "predicted_magnitude": 6.1,
+        "location": "Benchmark",
+        "latitude": 23.24,
+        "longitude": 69.67,
+        "timestamp": "2026-01-01T00:00:00Z",
+    }
+    try:
+        summary = await dispatcher.dispatch(alert)
+    finally:
+        await dispatcher.close()
+        stop_event.set()
+        server.join(timeout=10)
+
+    latencies = sorted(r["latency_ms"] for r in dispatcher.receipts)
+    retried = sum(1 for r in dispatcher.receipts if r["attempts"] > 1)
+
+    def pct(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] if latencies else 0.0
+
+    return {
+        "devices": devices,
+        "concurrency": concurrency,
+        "delivered": summary["delivered"],
+        "failed": summary["failed"],
+        "retried": retried,
+        "duration_s": summary["duration_s"],
+        "deliveries_per_s": summary["delivered"] / summary["duration_s"] if summary["duration_s"] else 0.0,
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark IoT alert fan-out against local stub devices")
+    parser.add_argument("--devices", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--flaky-fraction", type=float, default=0.01)
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="Simulated device processing time")
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = asyncio.run(
+        run_benchmark(args.devices, args.concurrency, args.flaky_fraction, args.delay_ms / 1000)
+    )
+    result["wall_s"] = time.perf_counter() - start
+    print(
+        f"Delivered {result['delivered']}/{result['devices']} in {result['duration_s']:.2f}s "
+        f"({result['deliveries_per_s']:.0f}/s), {result['retried']} retried, {result['failed']} failed"
+    )
+    print(f"   per-device latency p50 {result['p50_ms']:.1f} ms  p95 {result['p95_ms']:.1f} ms  p99 {result['p99_ms']:.1f} ms")
+    if args.output:
+        args.output.write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Per-endpoint response serialization cost: FastAPI's generic path vs pre-encoded orjson.
+
+The "generic" variants repeat what the handlers did before api.serialization:
+build the pydantic model and dump it, walk the result with jsonable_encoder,
+then json.dumps it in a JSONResponse (and, for /explain, rebuild the label
+and threshold tables and the importance ranking per request). Model inference
+is excluded; it is the same on both paths.
+
+    python -m api.bench_serialization --repeat 2000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from api import main as api_main
+from api.schemas import PredictResponse
+from api.serialization import AlertFeed, FastJSONResponse
+from src.predict import _load_xgb
+
+
+def _alert(i: int) -> Dict:
+    return {
+        "predicted_magnitude": 4.3 + i % 10 / 10,
+        "alert_level": "MID",
+        "confidence": 0.8,
+        "location": "Nāngloi Jāt, India",
+        "timestamp": datetime.now(timezone.utc),
+        "recommendation": "Precautionary alert — monitor updates",
+        "latitude": 28.6,
+        "longitude": 77.2,
+        "depth_km": 10.0,
+        "seismic_zone": 4,
+        "shaking_radius_km": 14.1,
+        "affected_devices": 12,
+        "affected_population": 1_250_000,
+        "model_version": "20261019T065318Z-ac042d",
+        "mode": "full",
+    }
+
+
+def _generic_explain_tables(model) -> List:
+    # What every /explain request used to rebuild.
+    readable_labels = dict(api_main.FEATURE_LABELS)
+    thresholds = {feature: list(bands) for feature, bands in api_main.FEATURE_RISK_THRESHOLDS.items()}
+    importance_dict = model.get_booster().get_score(importance_type="gain")
+    total = sum(importance_dict.values()) or 1
+    ranking = sorted(
+        ((k, round(v / total * 100, 1)) for k, v in importance_dict.items()), key=lambda x: x[1], reverse=True
+    )
+    return [(feat, pct, readable_labels.get(feat, feat), thresholds.get(feat)) for feat, pct in ranking]
+
+
+def _explain_body(ranking: List) -> Dict:
+    features = [
+        {
+            "feature": feat,
+            "label": api_main.FEATURE_LABELS.get(feat, feat),
+            "importance_pct": pct,
+            "actual_value": 3.0,
+            "risk_level": api_main._classify_feature_risk(feat, 3.0),
+        }
+        for feat, pct, *_ in ranking
+    ]
+    return {
+        "predicted_magnitude": 4.3,
+        "alert_level": "MID",
+        "confidence": 0.8,
+        "model_version": "20261019T065318Z-ac042d",
+        "features": features[:6],
+        "historical_avg": {"avg_magnitude": 3.9, "avg_depth_km": 24.1, "event_count": 812},
+        "plain_english": ["The model predicted a magnitude 4.30 event."] * 5,
+    }
+
+
+def _time(fn: Callable[[], object], repeat: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def run(repeat: int) -> Dict[str, Dict[str, float]]:
+    alerts = [_alert(i) for i in range(50)]
+    feed = AlertFeed(maxlen=50)
+    for alert in reversed(alerts):
+        feed.appendleft(alert)
+
+    def generic_predict() -> bytes:
+        response = PredictResponse(**alerts[0])
+        response.model_dump()  # published copy
+        return JSONResponse(jsonable_encoder(response)).body
+
+    def fast_predict() -> bytes:
+        return FastJSONResponse(AlertFeed(maxlen=1).appendleft(alerts[0])).body
+
+    cases = {
+        "/predict": (generic_predict, fast_predict),
+        "/latest-alerts": (
+            lambda: JSONResponse(jsonable_encoder(list(alerts))).body,
+            lambda: FastJSONResponse(feed.body()).body,
+        ),
+    }
+    model = _load_xgb()
+    if model is not None:
+        cases["/explain"] = (
+            lambda: JSONResponse(jsonable_encoder(_explain_body(_generic_explain_tables(model)))).body,
+            lambda: FastJSONResponse(_explain_body(api_main._importance_ranking(model))).body,
+        )
+    else:
+        print("No XGBoost model loaded; skipping /explain (run python -m src.train_xgboost)")
+
+    results = {}
+    for endpoint, (generic, fast) in cases.items():
+        before, after = _time(generic, repeat), _time(fast, repeat)
+        results[endpoint] = {
+            "generic_us": round(before, 1),
+            "orjson_us": round(after, 1),
+            "speedup": round(before / after, 1),
+        }
+        print(f"{endpoint:<15} generic {before:8.1f} us   orjson {after:7.1f} us   {before / after:5.1f}x")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark response serialization per endpoint")
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+    results = run(args.repeat)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""Backend fan-out of MID/HIGH alerts to registered IoT devices."""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional
+
+import aiohttp
+
+from src import instrumentation
+from src.alert_classifier import ALERT_LEVELS
+from src.targeting import GeoGridIndex, shaking_radius_km
+
+DEVICES_PATH = Path("data/devices.json")
+DISPATCH_LEVELS = ("MID", "HIGH")
+JSON_HEADERS = {"Content-Type": "application/json"}
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Device:
+    device_id: str
+    url: str
+    min_level: str = "MID"
+    timeout_s: float = 5.0
+    enabled: bool = True
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+    def accepts(self, level: str) -> bool:
+        return self.enabled and ALERT_LEVELS.index(level) >= ALERT_LEVELS.index(self.min_level)
+
+
+class DeviceRegistry:
+    """
+    Registered devices, optionally persisted as JSON.
+
+    Devices with a location are also kept in a ``GeoGridIndex`` so an alert
+    only fans out to devices inside its shaking radius; devices without a
+    location receive every alert they accept.
+    """
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        self.path = path
+        self.devices: Dict[str, Device] = {}
+        self.index = GeoGridIndex()
+        self._unlocated: Dict[str, Device] = {}
+        self._lock = threading.Lock()
+        if path is not None and path.exists():
+            devices = [Device(**item) for item in json.loads(path.read_text())]
+            self.upsert_many(devices, persist=False)
+
+    def __len__(self) -> int:
+        return len(self.devices)
+
+    def upsert(self, device: Device, persist: bool = True) -> Device:
+        self.upsert_many([device], persist=persist)
+        return device
+
+    def upsert_many(self, devices: List[Device], persist: bool = True) -> int:
+        """Register or update many devices with a single index update."""
+        with self._lock:
+            located = []
+            for device in devices:
+                self.devices[device.device_id] = device
+                if device.latitude is None or device.longitude is None:
+                    self._unlocated[device.device_id] = device
+                    self.index.remove(device.device_id)
+                else:
+                    self._unlocated.pop(device.device_id, None)
+                    located.append(device)
+            self.index.upsert_many(
+                [d.device_id for d in located],
+                [d.latitude for d in located],
+                [d.longitude for d in located],
+            )
+        if persist:
+            self.save()
+        return len(devices)
+
+    def remove(self, device_id: str, persist: bool = True) -> bool:
+        with self._lock:
+            removed = self.devices.pop(device_id, None) is not None
+            self._unlocated.pop(device_id, None)
+            self.index.remove(device_id)
+        if removed and persist:
+            self.save()
+        return removed
+
+    def get(self, device_id: str) -> Optional[Device]:
+        return self.devices.get(device_id)
+
+    def all(self) -> List[Device]:
+        return list(self.devices.values())
+
+    def within(self, latitude: float, longitude: float, radius_km: float) -> List[Device]:
+        """Devices located within ``radius_km`` plus every unlocated device."""
+        with self._lock:
+            nearby = [self.devices[i] for i in self.index.query(latitude, longitude, radius_km)]
+            return nearby + list(self._unlocated.values())
+
+    def count_within(self, latitude: float, longitude: float, radius_km: float) -> int:
+        """Number of located devices within ``radius_km`` (unlocated ones excluded)."""
+        return self.index.count(latitude, longitude, radius_km)
+
+    def targets_for(self, alert: Dict) -> List[Device]:
+        """Devices an alert should reach, by its location and shaking radius."""
+        latitude, longitude = alert.get("latitude"), alert.get("longitude")
+        if latitude is None or longitude is None:
+            return self.all()
+        radius = alert.get("shaking_radius_km") or shaking_radius_km(alert["predicted_magnitude"])
+        return self.within(latitude, longitude, radius)
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            payload = [asdict(device) for device in self.devices.values()]
+        self.path.write_text(json.dumps(payload, indent=2))
+
+
+@dataclass
+class DispatchConfig:
+    max_concurrency: int = 200
+    max_retries: int = 3
+    backoff_base_s: float = 0.2
+    backoff_max_s: float = 5.0
+    queue_size: int = 1000
+    receipts_kept: int = 10000
+
+
+@dataclass
+class DeliveryReceipt:
+    alert_id: str
+    device_id: str
+    delivered: bool
+    attempts: int
+    latency_ms: float
+    status_code: Optional[int] = None
+    error: Optional[str] = None
+    completed_at: str = field(
+        default_factory=lambda: datetime.now(timezone.utc).isoformat()
+    )
+
+
+def _iso(timestamp) -> Optional[str]:
+    # /predict alerts carry datetimes, whose str() separates date and time with a space.
+    return timestamp.isoformat() if hasattr(timestamp, "isoformat") else timestamp
+
+
+def alert_payload(alert: Dict, alert_id: str) -> Dict:
+    """Body posted to devices; same shape the dashboard used to send."""
+    return {
+        "alert_id": alert_id,
+        "level": alert["alert_level"],
+        "magnitude": alert["predicted_magnitude"],
+        "location": alert.get("location"),
+        "latitude": alert.get("latitude"),
+        "longitude": alert.get("longitude"),
+        "timestamp": _iso(alert.get("timestamp")),
+    }
+
+
+class AlertDispatcher:
+    """
+    Queue-driven fan-out of alerts over one pooled aiohttp session.
+
+    Every alert is delivered to the devices that accept its level by at most
+    ``max_concurrency`` concurrent requests, each with the device's own
+    timeout and jittered exponential-backoff retries. Outcomes are kept as
+    delivery receipts.
+    """
+
+    def __init__(
+        self,
+        registry: DeviceRegistry,
+        config: Optional[DispatchConfig] = None,
+        session: Optional[aiohttp.ClientSession] = None,
+    ) -> None:
+        self.registry = registry
+        self.config = config or DispatchConfig()
+        self._session = session
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.receipts: Deque[Dict] = deque(maxlen=self.config.receipts_kept)
+        self.summaries: Deque[Dict] = deque(maxlen=200)
+        self.dropped = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._worker is not None and not self._worker.done() and self._loop is loop:
+            return
+        if self._loop is not None and self._loop is not loop:
+            # Pooled connections and queues are bound to the loop that made them.
+            self._retire(self._loop)
+            self._queue = None
+        self._loop = loop
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.config.max_concurrency, limit_per_host=0)
+            self._session = aiohttp.ClientSession(connector=connector)
+        # On the same loop a restarted worker picks up the alerts still queued.
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.config.queue_size)
+        self._worker = loop.create_task(self._run())
+
+    def _retire(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Stop the worker and close the session of a previous ``loop`` before they are replaced."""
+        worker, self._worker = self._worker, None
+        session, self._session = self._session, None
+        if loop.is_running():
+            if worker is not None:
+                loop.call_soon_threadsafe(worker.cancel)
+            if session is not None and not session.closed:
+                asyncio.run_coroutine_threadsafe(session.close(), loop)
+        elif session is not None and session.connector is not None:
+            # The loop cannot run ``close()`` any more; drop its pooled connections directly.
+            session.connector._close()
+
+    def submit(self, alert: Dict) -> Optional[str]:
+        """Queue a MID/HIGH alert for delivery; returns its id (None if skipped)."""
+        if alert.get("alert_level") not in DISPATCH_LEVELS:
+            return None
+        self._ensure_started()
+        alert_id = alert.get("alert_id") or uuid.uuid4().hex
+        try:
+            self._queue.put_nowait((alert_id, alert))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return None
+        return alert_id
+
+    async def _run(self) -> None:
+        while True:
+            alert_id, alert = await self._queue.get()
+            try:
+                await self.dispatch(alert, alert_id)
+            except Exception:
+                # One bad alert must not stop delivery of the ones queued behind it.
+                logger.exception("Dispatching alert %s failed", alert_id)
+            finally:
+                self._queue.task_done()
+
+    async def join(self) -> None:
+        """Wait until every queued alert has been delivered."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def dispatch(
+        self, alert: Dict, alert_id: Optional[str] = None, devices: Optional[List[Device]] = None
+    ) -> Dict:
+        """Deliver one alert to all accepting devices and return its summary."""
+        if self._session is None or self._loop is not asyncio.get_running_loop():
+            self._ensure_started()
+        alert_id = alert_id or uuid.uuid4().hex
+        level = alert["alert_level"]
+        if devices is None:
+            with instrumentation.span("iot_targeting"):
+                devices = self.registry.targets_for(alert)
+        targets: Iterator[Device] = iter([d for d in devices if d.accepts(level)])
+        # Encode once per alert rather than once per device.
+        payload = json.dumps(alert_payload(alert, alert_id)).encode()
+        results: List[DeliveryReceipt] = []
+        start = time.perf_counter()
+
+        async def worker() -> None:
+            # Workers share one iterator, which caps concurrency without a task per device.
+            for device in targets:
+                results.append(await self._deliver(device, payload, alert_id))
+
+        concurrency = max(1, min(self.config.max_concurrency, len(devices)))
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        duration = time.perf_counter() - start
+        instrumentation.observe("iot_fanout", duration)
+
+        delivered = sum(1 for r in results if r.delivered)
+        summary = {
+            "alert_id": alert_id,
+            "alert_level": level,
+            "targets": len(results),
+            "delivered": delivered,
+            "failed": len(results) - delivered,
+            "duration_s": duration,
+        }
+        self.summaries.appendleft(summary)
+        return summary
+
+    async def _deliver(self, device: Device, payload: bytes, alert_id: str) -> DeliveryReceipt:
+        attempts = 0
+        status_code = None
+        error = None
+        start = time.perf_counter()
+        while attempts <= self.config.max_retries:
+            attempts += 1
+            try:
+                async with self._session.post(
+                    device.url,
+                    data=payload,
+                    headers=JSON_HEADERS,
+                    timeout=aiohttp.ClientTimeout(total=device.timeout_s),
+                ) as response:
+                    await response.read()
+                    status_code = response.status
+                if status_code < 500:
+                    error = None if status_code < 400 else f"HTTP {status_code}"
+                    break
+                error = f"HTTP {status_code}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                error = f"{type(exc).__name__}: {exc}"
+            if attempts <= self.config.max_retries:
+                # Full jitter keeps retries from a mass outage from synchronising.
+                ceiling = min(self.config.backoff_max_s, self.config.backoff_base_s * 2 ** (attempts - 1))
+                await asyncio.sleep(random.uniform(0, ceiling))
+
+        latency = time.perf_counter() - start
+        instrumentation.observe("iot_delivery", latency)
+        receipt = DeliveryReceipt(
+            alert_id=alert_id,
+            device_id=device.device_id,
+            delivered=error is None,
+            attempts=attempts,
+            latency_ms=latency * 1000,
+            status_code=status_code,
+            error=error,
+        )
+        self.receipts.appendleft(asdict(receipt))
+        return receipt
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+DEVICE_REGISTRY = DeviceRegistry(DEVICES_PATH)
+DISPATCHER = AlertDispatcher(DEVICE_REGISTRY)
@@ -0,0 +1,271 @@
+"""Load generator for the prediction API.
+
+Drives ``api.main.app`` in-process through httpx's ASGI transport (no network),
+or a running server when ``--base-url`` is given:
+
+    python -m api.loadtest --requests 2000 --concurrency 32
+    python -m api.loadtest --mix predict=1,explain=1 --baseline prev.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from src.regions import REGIONS
+
+DEFAULT_MIX = {"predict": 4, "predict_lstm": 2, "explain": 1, "latest_alerts": 3}
+PERCENTILES = (50, 95, 99)
+
+
+def _random_location(rng: random.Random) -> Dict[str, float]:
+    # Spread over every configured region, so multi-region deployments route requests to all of them.
+    bbox = rng.choice(list(REGIONS.values())).bbox
+    return {
+        "latitude": round(rng.uniform(bbox["minlatitude"], bbox["maxlatitude"]), 4),
+        "longitude": round(rng.uniform(bbox["minlongitude"], bbox["maxlongitude"]), 4),
+        "depth_km": round(rng.uniform(0.0, 70.0), 1),
+    }
+
+
+def _recent_events(rng: random.Random, around: Dict[str, float], count: int = 10) -> List[Dict]:
+    now = datetime.now(timezone.utc)
+    events = []
+    for i in range(count):
+        events.append(
+            {
+                "latitude": around["latitude"] + rng.uniform(-0.5, 0.5),
+                "longitude": around["longitude"] + rng.uniform(-0.5, 0.5),
+                "depth_km": rng.uniform(5.0, 40.0),
+                "magnitude": round(rng.uniform(2.5, 5.5), 1),
+                "timestamp": (now - timedelta(days=count - i, hours=rng.uniform(0, 12))).isoformat(),
+            }
+        )
+    return events
+
+
+def build_request(kind: str, rng: random.Random) -> Tuple[str, str, Optional[Dict]]:
+    """Return (method, path, json body) for one request of the given mix entry."""
+    if kind == "predict":
+        return "POST", "/predict", _random_location(rng)
+    if kind == "predict_lstm":
+        body = _random_location(rng)
+        body["recent_events"] = _recent_events(rng, body)
+        return "POST", "/predict", body
+    if kind == "explain":
+        return "POST", "/explain", _random_location(rng)
+    if kind == "latest_alerts":
+        return "GET", "/latest-alerts", None
+    raise ValueError(f"Unknown mix entry: {kind}")
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown mix entry: {name} (choose from {', '.join(DEFAULT_MIX)})")
+        mix[name] = float(weight) if weight else 1.0
+    return mix
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: Dict[str, List[float]], errors: Dict[str, int], elapsed: float) -> Dict:
+    endpoints = {}
+    for kind in sorted(set(latencies) | set(errors)):
+        values = sorted(latencies.get(kind, []))
+        endpoints[kind] = {
+            "requests": len(values) + errors.get(kind, 0),
+            "errors": errors.get(kind, 0),
+            "rps": len(values) / elapsed if elapsed else 0.0,
+            **{f"p{p}_ms": _percentile(values, p) * 1000 for p in PERCENTILES},
+            "mean_ms": (sum(values) / len(values) * 1000) if values else 0.0,
+        }
+    total_ok = sum(len(v) for v in latencies.values())
+    return {
+        "elapsed_s": elapsed,
+        "total_requests": total_ok + sum(errors.values()),
+        "total_errors": sum(errors.values()),
+        "rps": total_ok / elapsed if elapsed else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    mix: Dict[str, float],
+    total_requests: int,
+    concurrency: int,
+    seed: int = 42,
+    warmup: int = 0,
+) -> Dict:
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    plan = [
+        (kind, *build_request(kind, rng))
+        for kind in rng.choices(kinds, weights=weights, k=warmup + total_requests)
+    ]
+    warmup_plan, plan = plan[:warmup], plan[warmup:]
+
+    latencies: Dict[str, List[float]] = {kind: [] for kind in kinds}
+    errors: Dict[str, int] = {}
+
+    async def send(method: str, path: str, body: Optional[Dict]) -> bool:
+        response = await client.request(method, path, json=body)
+        if response.status_code >= 400:
+            return False
+        # /explain reports failures in-band with a 200 status.
+        if path == "/explain" and "error" in response.json():
+            return False
+        return True
+
+    for _, method, path, body in warmup_plan:
+        await send(method, path, body)
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in plan:
+        queue.put_nowait(item)
+
+    async def worker() -> None:
+        while True:
+            try:
+                kind, method, path, body = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                ok = await send(method, path, body)
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies[kind].append(time.perf_counter() - start)
+            else:
+                errors[kind] = errors.get(kind, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    elapsed = time.perf_counter() - start
+    return summarize(latencies, errors, elapsed)
+
+
+def check_thresholds(
+    result: Dict,
+    max_p99_ms: Optional[float] = None,
+    max_error_rate: float = 0.0,
+    baseline: Optional[Dict] = None,
+    tolerance: float = 0.2,
+) -> List[str]:
+    """Return a list of human-readable threshold violations (empty when passing)."""
+    failures = []
+    total = result["total_requests"] or 1
+    if result["total_errors"] / total > max_error_rate:
+        failures.append(
+            f"error rate {result['total_errors'] / total:.2%} exceeds {max_error_rate:.2%}"
+        )
+    for kind, stats in result["endpoints"].items():
+        if max_p99_ms is not None and stats["p99_ms"] > max_p99_ms:
+            failures.append(f"{kind}: p99 {stats['p99_ms']:.1f} ms exceeds {max_p99_ms:.1f} ms")
+        if baseline is None or kind not in baseline.get("endpoints", {}):
+            continue
+        base = baseline["endpoints"][kind]
+        if base["p99_ms"] and stats["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            failures.append(
+                f"{kind}: p99 {stats['p99_ms']:.1f} ms regressed from {base['p99_ms']:.1f} ms"
+            )
+        if base["rps"] and stats["rps"] < base["rps"] * (1 - tolerance):
+            failures.append(f"{kind}: {stats['rps']:.1f} rps regressed from {base['rps']:.1f} rps")
+    return failures
+
+
+def _make_client(base_url: Optional[str], timeout: float) -> httpx.AsyncClient:
+    if base_url:
+        return httpx.AsyncClient(base_url=base_url, timeout=timeout)
+    from api.main import app
+
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=timeout
+    )
+
+
+async def _main_async(args: argparse.Namespace) -> Dict:
+    async with _make_client(args.base_url, args.timeout) as client:
+        return await run_load(
+            client,
+            mix=parse_mix(args.mix),
+            total_requests=args.requests,
+            concurrency=args.concurrency,
+            seed=args.seed,
+            warmup=args.warmup,
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the earthquake prediction API")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument(
+        "--mix",
+        default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+        help="Comma-separated name=weight pairs",
+    )
+    parser.add_argument("--base-url", default=None, help="Target a running server instead of in-process")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", type=Path, default=Path("loadtest_results.json"))
+    parser.add_argument("--max-p99-ms", type=float, default=None)
+    parser.add_argument("--max-error-rate", type=float, default=0.0)
+    parser.add_argument("--baseline", type=Path, default=None, help="Previous result file to compare to")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    result = asyncio.run(_main_async(args))
+    result["config"] = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "mix": parse_mix(args.mix),
+        "target": args.base_url or "in-process",
+    }
+    args.output.write_text(json.dumps(result, indent=2))
+
+    print(f"Total: {result['total_requests']} requests, {result['rps']:.1f} rps, "
+          f"{result['total_errors']} errors in {result['elapsed_s']:.2f}s")
+    for kind, stats in result["endpoints"].items():
+        print(
+            f"   {kind:<14} {stats['rps']:8.1f} rps  p50 {stats['p50_ms']:7.2f} ms  "
+            f"p95 {stats['p95_ms']:7.2f} ms  p99 {stats['p99_ms']:7.2f} ms  errors {stats['errors']}"
+        )
+    print(f"Saved results to {args.output}")
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    failures = check_thresholds(
+        result,
+        max_p99_ms=args.max_p99_ms,
+        max_error_rate=args.max_error_rate,
+        baseline=baseline,
+        tolerance=args.tolerance,
+    )
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
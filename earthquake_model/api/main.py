@@ -1,19 +1,104 @@
-from collections import deque
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from datetime import datetime, timezone
-from pathlib import Path
-from typing import Deque, Dict, List
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 import pandas as pd
-from fastapi import FastAPI
+from fastapi import FastAPI, Path, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-
-from api.schemas import HealthResponse, PredictRequest, PredictResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+
+from api.dispatcher import DEVICE_REGISTRY, DISPATCHER, Device
+from api.schemas import (
+    DeviceRegistration,
+    EventBatch,
+    HealthResponse,
+    PredictRequest,
+    PredictResponse,
+)
+from api.serialization import AlertFeed, FastJSONResponse
+from src import instrumentation, model_registry
 from src.alert_classifier import classify_alert
 from src.data_pipeline import fetch_usgs_data
-from src.feature_engineering import assign_seismic_zone
-from src.predict import predict_event, get_feature_vector, get_historical_averages
+from src.event_state import EVENT_STATES, get_event_state
+from src.predict import (
+    active_models,
+    get_feature_vector,
+    get_historical_averages,
+    loaded_models,
+    model_shard,
+    predict_event,
+    reload_models,
+    training_data_bytes,
+)
+from src.profiling import REQUEST_PROFILER
+from src.regions import REGIONS, Region, get_region, model_regions, region_for, regions_for
+from src.risk_raster import MAX_TILE_ZOOM, RASTER_PATH, get_raster, raster_region, tile_bounds
+from src.targeting import population_within, region_name, shaking_radius_km
+
 
-app = FastAPI(title="Earthquake Prediction API", version="1.0.0")
+
+MODEL_POLL_S = float(os.environ.get("EQ_MODEL_POLL_S", "15"))
+PROFILE_FRACTION = float(os.environ.get("EQ_PROFILE_FRACTION", "0"))
+# The /admin/profile routes expose stack traces; they answer 404 unless enabled.
+PROFILE_ENDPOINTS = os.environ.get("EQ_PROFILE_ENDPOINTS", "0").lower() in {"1", "true", "on"}
+# Per region name: the version being loaded and the last load error.
+MODEL_STATUS: Dict[str, Dict[str, Optional[str]]] = {
+    name: {"last_error": None, "loading": None} for name in REGIONS
+}
+logger = logging.getLogger(__name__)
+
+
+async def _swap_models(version: Optional[str], region: Region) -> str:
+    """Load, warm and swap in a model version off the event loop; serving continues meanwhile."""
+    status = MODEL_STATUS[region.name]
+    status["loading"] = version or model_registry.current_version(model_shard(region).registry)
+    try:
+        models = await asyncio.to_thread(reload_models, version, region=region)
+        status["last_error"] = None
+        return models.version
+    except Exception as exc:
+        status["last_error"] = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        status["loading"] = None
+
+
+async def _watch_registry() -> None:
+    """Hot-reload a region's models whenever its registry's CURRENT pointer moves."""
+    while True:
+        await asyncio.sleep(MODEL_POLL_S)
+        for region in model_regions():
+            current = model_registry.current_version(model_shard(region).registry)
+            # Skip regions mid-swap: an endpoint moves CURRENT only after its version has loaded.
+            if MODEL_STATUS[region.name]["loading"]:
+                continue
+            if current and current != active_models(region).version:
+                try:
+                    await _swap_models(current, region)
+                except Exception:
+                    logger.exception(
+                        "Loading model version %s for %s failed; still serving the previous one", current, region.name
+                    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    watcher = asyncio.create_task(_watch_registry()) if MODEL_POLL_S > 0 else None
+    if PROFILE_FRACTION > 0:
+        REQUEST_PROFILER.start(PROFILE_FRACTION)
+    yield
+    if watcher is not None:
+        watcher.cancel()
+    REQUEST_PROFILER.stop()
+    await DISPATCHER.close()
+
+
+app = FastAPI(title="Earthquake Prediction API", version="1.0.0", lifespan=lifespan)
 
 # Add CORS middleware for React dashboard
 app.add_middleware(
@@ -24,7 +109,70 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-LATEST_ALERTS: Deque[Dict] = deque(maxlen=50)
+LATEST_ALERTS = AlertFeed(maxlen=50)
+# Called with every published alert (api.replay records emission times here).
+ALERT_SUBSCRIBERS: List[Callable[[Dict], None]] = []
+# "Now" for the live feed's query window; api.replay swaps in a virtual clock.
+CLOCK: Callable[[], datetime] = lambda: datetime.now(timezone.utc)
+LIVE_FEED: Dict[str, Optional[Dict]] = {"latest": None}
+# Regions whose feed has been polled once; the first poll only backfills the event state.
+LIVE_FEED_PRIMED: Set[str] = set()
+RISK_MAP_MAX_AGE = 300
+REQUEST_START: ContextVar[Optional[float]] = ContextVar("request_start", default=None)
+IN_FLIGHT = {"requests": 0}
+
+
+class TimingMiddleware:
+    """Pure ASGI middleware recording per-endpoint latency and in-flight count, and picking requests to profile."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        sampled = REQUEST_PROFILER.begin()
+        try:
+            await self._timed(scope, receive, send)
+        finally:
+            REQUEST_PROFILER.end(sampled)
+
+    async def _timed(self, scope, receive, send) -> None:
+        if not instrumentation.ENABLED:
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        token = REQUEST_START.set(start)
+        IN_FLIGHT["requests"] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            IN_FLIGHT["requests"] -= 1
+            REQUEST_START.reset(token)
+            # The router records the matched route in the scope; its template keeps the label set bounded.
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            instrumentation.observe(f"http {scope['method']} {path}", time.perf_counter() - start)
+
+
+app.add_middleware(TimingMiddleware)
+instrumentation.register_gauge("latest_alerts_queue_depth", lambda: len(LATEST_ALERTS))
+instrumentation.register_gauge("http_requests_in_flight", lambda: IN_FLIGHT["requests"])
+instrumentation.register_gauge(
+    "event_state_window_events", lambda: sum(len(state) for state in EVENT_STATES.values())
+)
+instrumentation.register_gauge("dispatch_queue_depth", lambda: DISPATCHER.queue_depth)
+instrumentation.register_gauge("registered_devices", lambda: len(DEVICE_REGISTRY))
+instrumentation.register_gauge("models_loaded", loaded_models)
+instrumentation.register_gauge("training_catalog_bytes", training_data_bytes)
+
+
+def _mark_request_parsed() -> None:
+    """Record time from request arrival to handler entry (body read + validation)."""
+    start = REQUEST_START.get()
+    if start is not None:
+        instrumentation.observe("request_parse", time.perf_counter() - start)
 
 
 @app.get("/health", response_model=HealthResponse)
@@ -32,138 +180,491 @@ async def health() -> HealthResponse:
     return HealthResponse(status="ok")
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(
+        instrumentation.render_prometheus(),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
 @app.post("/predict", response_model=PredictResponse)
-async def predict(payload: PredictRequest) -> PredictResponse:
+async def predict(payload: PredictRequest) -> FastJSONResponse:
+    _mark_request_parsed()
     recent_events = [event.model_dump() for event in payload.recent_events]
     result = predict_event(
         lat=payload.latitude,
         lon=payload.longitude,
         depth_km=payload.depth_km,
         recent_events=recent_events,
+        mode=payload.mode,
     )
 
     magnitude = result["predicted_magnitude"]
     zone = int(result["seismic_zone"])
     alert_level = classify_alert(magnitude, zone)
 
-    response = PredictResponse(
-        predicted_magnitude=magnitude,
-        alert_level=alert_level,
-        confidence=result["confidence"],
-        location="India",
-        timestamp=datetime.now(timezone.utc),
-        recommendation=_recommendation(alert_level),
-        latitude=payload.latitude,
-        longitude=payload.longitude,
-        depth_km=payload.depth_km,
-        seismic_zone=zone,
-    )
-    LATEST_ALERTS.appendleft(response.model_dump())
-    return response
+    targeting = _targeting(payload.latitude, payload.longitude, magnitude)
+    # Fields in PredictResponse order; the published encoding is the response body.
+    alert = {
+        "predicted_magnitude": magnitude,
+        "alert_level": alert_level,
+        "confidence": result["confidence"],
+        "location": targeting["region"],
+        "timestamp": datetime.now(timezone.utc),
+        "recommendation": _recommendation(alert_level),
+        "latitude": payload.latitude,
+        "longitude": payload.longitude,
+        "depth_km": payload.depth_km,
+        "seismic_zone": zone,
+        "shaking_radius_km": targeting["shaking_radius_km"],
+        "affected_devices": targeting["affected_devices"],
+        "affected_population": targeting["affected_population"],
+        "model_version": result["model_version"],
+        "mode": result["mode"],
+        "region": result["region"],
+    }
+    return FastJSONResponse(_publish(alert))
 
 
-@app.get("/latest-alerts")
-async def latest_alerts() -> List[Dict]:
-    return list(LATEST_ALERTS)
+@app.get("/latest-alerts", response_class=FastJSONResponse)
+async def latest_alerts() -> FastJSONResponse:
+    return FastJSONResponse(LATEST_ALERTS.body())
 
 
 @app.post("/alert")
-async def create_alert(payload: PredictRequest) -> Dict:
+async def create_alert(payload: PredictRequest) -> FastJSONResponse:
     """Manual alert creation endpoint for testing or IoT feedback"""
+    _mark_request_parsed()
     recent_events = [event.model_dump() for event in payload.recent_events]
     result = predict_event(
         lat=payload.latitude,
         lon=payload.longitude,
         depth_km=payload.depth_km,
         recent_events=recent_events,
+        mode=payload.mode,
     )
 
     magnitude = result["predicted_magnitude"]
     zone = int(result["seismic_zone"])
     alert_level = classify_alert(magnitude, zone)
 
+    targeting = _targeting(payload.latitude, payload.longitude, magnitude)
     alert = {
         "predicted_magnitude": magnitude,
         "alert_level": alert_level,
         "confidence": result["confidence"],
-        "location": "India",
+        "location": targeting["region"],
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "recommendation": _recommendation(alert_level),
         "latitude": payload.latitude,
         "longitude": payload.longitude,
         "depth_km": payload.depth_km,
         "seismic_zone": zone,
+        **{k: v for k, v in targeting.items() if k != "region"},
+        "model_version": result["model_version"],
+        "mode": result["mode"],
+        "region": result["region"],
     }
-    LATEST_ALERTS.appendleft(alert)
-    return {"status": "alert_created", "alert": alert}
+    return FastJSONResponse(b'{"status":"alert_created","alert":' + _publish(alert) + b"}")
+
+
+def _fetch_region(region: Region, start_dt: datetime, end_dt: datetime) -> Optional[pd.DataFrame]:
+    """The region's recent events from the FDSN feed, keeping only those routed to it."""
+    with instrumentation.span("usgs_fetch"):
+        temp_path = fetch_usgs_data(
+            starttime=start_dt.strftime("%Y-%m-%dT%H:%M:%S"),
+            endtime=end_dt.strftime("%Y-%m-%dT%H:%M:%S"),
+            output_path=region.path("data/raw/usgs_live.csv"),
+            bbox=region.bbox,
+        )
+    try:
+        df = pd.read_csv(temp_path)
+    except pd.errors.EmptyDataError:  # FDSN services answer 204 with no body when nothing matched
+        return None
+    df = df.dropna(subset=["time", "mag"])
+    # Overlapping regions both receive an event; only the one it routes to keeps it.
+    df = df[regions_for(df["latitude"].to_numpy(), df["longitude"].to_numpy()) == region.name]
+    if df.empty:
+        return None
+    return df.rename(columns={"depth": "depth_km", "mag": "magnitude"})
 
 
 @app.get("/live-feed")
 async def live_feed() -> Dict:
-    end_dt = datetime.now(timezone.utc)
+    """
+    Poll the FDSN feed of every region; every event not seen before is
+    predicted and published. The first poll of a region only backfills its
+    event state with the 2-day window, so a restart does not re-alert it.
+    """
+    end_dt = CLOCK()
     start_dt = end_dt - pd.Timedelta(days=2)
-    temp_path = fetch_usgs_data(
-        starttime=start_dt.strftime("%Y-%m-%d"),
-        endtime=end_dt.strftime("%Y-%m-%d"),
-        output_path=Path("data/raw/usgs_live.csv"),
-    )
-    df = pd.read_csv(temp_path)
-    if df.empty:
+    regions = list(REGIONS.values())
+    frames = await asyncio.gather(*(asyncio.to_thread(_fetch_region, r, start_dt, end_dt) for r in regions))
+    fetched = [(region, df) for region, df in zip(regions, frames) if df is not None]
+    backfill = {region.name for region in regions} - LIVE_FEED_PRIMED
+    LIVE_FEED_PRIMED.update(region.name for region in regions)
+    if not fetched:
         return {"status": "no-data"}
-    df = df.sort_values("time")
-    latest = df.iloc[-1]
-    recent = df.tail(10)
-    recent_events = []
-    for _, row in recent.iterrows():
-        recent_events.append(
-            {
-                "latitude": float(row["latitude"]),
-                "longitude": float(row["longitude"]),
-                "depth_km": float(row["depth"]),
-                "magnitude": float(row["mag"]),
-                "timestamp": row["time"],
-                "days_since_last_quake": 0.0,
-                "seismic_zone": assign_seismic_zone(row["latitude"], row["longitude"]),
-            }
-        )
 
-    result = predict_event(
-        lat=float(latest["latitude"]),
-        lon=float(latest["longitude"]),
-        depth_km=float(latest["depth"]),
-        recent_events=recent_events,
-    )
+    # Inference is synchronous; keep it off the event loop so other requests are served meanwhile.
+    alerts = await asyncio.to_thread(_score_new_events, fetched, backfill)
+    for alert in alerts:
+        LIVE_FEED["latest"] = alert
+        _publish(alert)
+    if LIVE_FEED["latest"] is None:
+        df = pd.concat([df for _, df in fetched], ignore_index=True)
+        latest = df.loc[pd.to_datetime(df["time"], utc=True, format="mixed").idxmax()]
+        LIVE_FEED["latest"] = await asyncio.to_thread(_live_alert, latest)
+    return LIVE_FEED["latest"]
+
+
+def _score_new_events(fetched: List[Tuple[Region, pd.DataFrame]], backfill: Set[str]) -> List[Dict]:
+    """Ingest each region's events, returning alerts for the new ones in time order."""
+    alerts = []
+    for region, df in fetched:
+        state = get_event_state(region)
+        if region.name in backfill:
+            with instrumentation.span("event_state_ingest"):
+                state.ingest_rows(df)
+            continue
+        # Like build_features, each new event is scored on the events before it, as of its own time.
+        for _, event in df.sort_values("time").iterrows():
+            lat, lon, event_id = event["latitude"], event["longitude"], event.get("id")
+            if not state.is_new(event["time"], lat, lon, event_id):
+                continue
+            alert = _live_alert(event)
+            with instrumentation.span("event_state_ingest"):
+                added = state.ingest(event["time"], lat, lon, event["depth_km"], event["magnitude"], event_id=event_id)
+            if added:
+                alerts.append(alert)
+    return sorted(alerts, key=lambda alert: pd.Timestamp(alert["timestamp"]))
+
+
+def _live_alert(event: pd.Series) -> Dict:
+    lat, lon, depth = float(event["latitude"]), float(event["longitude"]), float(event["depth_km"])
+    result = predict_event(lat=lat, lon=lon, depth_km=depth, at=event["time"])
+    region = REGIONS[result["region"]]
     alert_level = classify_alert(result["predicted_magnitude"], int(result["seismic_zone"]))
-
-    payload = {
+    return {
         "predicted_magnitude": result["predicted_magnitude"],
         "alert_level": alert_level,
         "confidence": result["confidence"],
-        "location": latest.get("place", "India"),
-        "timestamp": latest["time"],
+        "location": event["place"] if isinstance(event.get("place"), str) else region.label,
+        "timestamp": event["time"],
+        "event_id": event.get("id"),
         "recommendation": _recommendation(alert_level),
-        "latitude": float(latest["latitude"]),
-        "longitude": float(latest["longitude"]),
-        "depth_km": float(latest["depth"]),
+        "latitude": lat,
+        "longitude": lon,
+        "depth_km": depth,
         "seismic_zone": int(result["seismic_zone"]),
+        **{k: v for k, v in _targeting(lat, lon, result["predicted_magnitude"]).items() if k != "region"},
+        "model_version": result["model_version"],
+        "region": region.name,
+    }
+
+
+def _publish(alert: Dict) -> bytes:
+    """Fan ``alert`` out and return its JSON encoding."""
+    encoded = LATEST_ALERTS.appendleft(alert)
+    DISPATCHER.submit(alert)
+    for subscriber in ALERT_SUBSCRIBERS:
+        subscriber(alert)
+    return encoded
+
+
+@app.get("/risk-map")
+async def risk_map(
+    request: Request,
+    region: Optional[str] = None,
+    min_lat: Optional[float] = Query(None, ge=-90, le=90),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90),
+    min_lon: Optional[float] = Query(None, ge=-180, le=180),
+    max_lon: Optional[float] = Query(None, ge=-180, le=180),
+    stride: int = Query(1, ge=1, le=100),
+) -> Response:
+    """Sub-rectangle of a region's precomputed risk raster (rows south to north; default: the whole region)"""
+    try:
+        selected = get_region(region)
+    except KeyError as exc:
+        return JSONResponse(status_code=404, content={"error": str(exc.args[0])})
+    bbox = selected.bbox
+    return _risk_map_response(
+        request,
+        selected,
+        bbox["minlatitude"] if min_lat is None else min_lat,
+        bbox["maxlatitude"] if max_lat is None else max_lat,
+        bbox["minlongitude"] if min_lon is None else min_lon,
+        bbox["maxlongitude"] if max_lon is None else max_lon,
+        stride,
+    )
+
+
+@app.get("/risk-map/tile/{z}/{x}/{y}")
+async def risk_map_tile(
+    request: Request,
+    z: int = Path(..., ge=0, le=MAX_TILE_ZOOM),
+    x: int = Path(..., ge=0),
+    y: int = Path(..., ge=0),
+    region: Optional[str] = None,
+    stride: int = Query(1, ge=1, le=100),
+) -> Response:
+    """Risk raster cells inside a Web Mercator slippy-map tile"""
+    try:
+        selected = get_region(region)
+    except KeyError as exc:
+        return JSONResponse(status_code=404, content={"error": str(exc.args[0])})
+    try:
+        min_lat, max_lat, min_lon, max_lon = tile_bounds(z, x, y)
+    except ValueError as exc:
+        return JSONResponse(status_code=400, content={"error": str(exc)})
+    return _risk_map_response(request, selected, min_lat, max_lat, min_lon, max_lon, stride)
+
+
+def _risk_map_response(
+    request: Request,
+    region: Region,
+    min_lat: float,
+    max_lat: float,
+    min_lon: float,
+    max_lon: float,
+    stride: int,
+) -> Response:
+    raster = get_raster(region.path(RASTER_PATH))
+    if raster is None:
+        return JSONResponse(
+            {"error": f"Risk raster not built. Run: python -m src.pipeline --region {region.name}"},
+            status_code=404,
+        )
+    rows, cols = raster.window(min_lat, max_lat, min_lon, max_lon)
+    etag = f'"{raster.version}-{raster.as_of.value}-{rows.start}-{rows.stop}-{cols.start}-{cols.stop}-{stride}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={RISK_MAP_MAX_AGE}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    body = raster_region(raster, min_lat, max_lat, min_lon, max_lon, stride)
+    return JSONResponse(body, headers=headers)
+
+
+@app.post("/events")
+async def ingest_events(payload: EventBatch) -> Dict:
+    """Feed observed events into the server-side context used by /predict, routed by location"""
+    _mark_request_parsed()
+    added = 0
+    with instrumentation.span("event_state_ingest"):
+        for event in sorted(payload.events, key=lambda e: e.timestamp):
+            state = get_event_state(region_for(event.latitude, event.longitude))
+            added += state.ingest(
+                event.timestamp,
+                event.latitude,
+                event.longitude,
+                event.depth_km,
+                event.magnitude,
+                event.seismic_zone,
+            )
+    return {"status": "ingested", "added": added, "received": len(payload.events)}
+
+
+@app.get("/devices")
+async def list_devices() -> List[Dict]:
+    return [vars(device) for device in DEVICE_REGISTRY.all()]
+
+
+@app.post("/devices")
+async def register_device(payload: DeviceRegistration) -> Dict:
+    device = DEVICE_REGISTRY.upsert(Device(**payload.model_dump()))
+    return {"status": "registered", "device": vars(device)}
+
+
+@app.delete("/devices/{device_id}")
+async def remove_device(device_id: str) -> Dict:
+    if not DEVICE_REGISTRY.remove(device_id):
+        return JSONResponse({"error": f"Unknown device: {device_id}"}, status_code=404)
+    return {"status": "removed", "device_id": device_id}
+
+
+@app.get("/dispatch/receipts")
+async def dispatch_receipts(limit: int = Query(100, ge=1, le=10000)) -> Dict:
+    """Recent IoT delivery receipts and per-alert fan-out summaries"""
+    receipts = list(DISPATCHER.receipts)[:limit]
+    return {
+        "queue_depth": DISPATCHER.queue_depth,
+        "dropped": DISPATCHER.dropped,
+        "alerts": list(DISPATCHER.summaries),
+        "receipts": receipts,
+    }
+
+
+@app.get("/models")
+async def list_models(region: Optional[str] = None) -> Dict:
+    """Model versions of ``region`` (default: the default region)"""
+    try:
+        selected = get_region(region)
+    except KeyError as exc:
+        return JSONResponse(status_code=404, content={"error": str(exc.args[0])})
+    shard = model_shard(selected)
+    return {
+        "region": selected.name,
+        "active": active_models(selected).version,
+        "current": model_registry.current_version(shard.registry),
+        "loaded": list(shard.cache),
+        "loading": MODEL_STATUS[selected.name]["loading"],
+        "last_error": MODEL_STATUS[selected.name]["last_error"],
+        "versions": model_registry.list_versions(shard.registry),
     }
-    LATEST_ALERTS.appendleft(payload)
-    return payload
+
+
+def _load_failed(exc: Exception) -> JSONResponse:
+    # Native loaders append stack traces; the first line names the problem.
+    message = (str(exc).strip().splitlines() or [""])[0]
+    return JSONResponse(
+        status_code=500, content={"error": f"Loading model version failed: {type(exc).__name__}: {message}"}
+    )
+
+
+@app.post("/models/reload")
+async def reload_model_version(version: Optional[str] = None, region: Optional[str] = None) -> Dict:
+    """
+    Load and warm ``version`` (or re-read CURRENT) and swap it in; CURRENT is
+    promoted only once the version is serving, so a broken one is never recorded.
+    """
+    try:
+        selected = get_region(region)
+        registry = model_shard(selected).registry
+        if version:
+            model_registry.read_metadata(version, registry)
+        active = await _swap_models(version, selected)
+    except KeyError as exc:
+        return JSONResponse(status_code=404, content={"error": str(exc.args[0])})
+    except Exception as exc:
+        return _load_failed(exc)
+    if version and version != model_registry.current_version(registry):
+        model_registry.set_current(version, registry)
+    return {"status": "active", "region": selected.name, "version": active}
+
+
+@app.post("/models/rollback")
+async def rollback_model_version(version: Optional[str] = None, region: Optional[str] = None) -> Dict:
+    """Serve the previous (or given) version again; instant while it is still loaded."""
+    try:
+        selected = get_region(region)
+        registry = model_shard(selected).registry
+        target = model_registry.rollback_target(version, registry)
+        active = await _swap_models(target, selected)
+    except KeyError as exc:
+        return JSONResponse(status_code=404, content={"error": str(exc.args[0])})
+    except ValueError as exc:
+        return JSONResponse(status_code=409, content={"error": str(exc)})
+    except Exception as exc:
+        return _load_failed(exc)
+    model_registry.set_current(target, registry, reason="rollback")
+    return {"status": "rolled_back", "region": selected.name, "version": active}
+
+
+def _profiling_disabled() -> Optional[JSONResponse]:
+    if PROFILE_ENDPOINTS:
+        return None
+    return JSONResponse(
+        status_code=404, content={"error": "Profiling endpoints are disabled; set EQ_PROFILE_ENDPOINTS=1"}
+    )
+
+
+@app.post("/admin/profile/start")
+async def start_profiling(
+    fraction: float = Query(0.1, gt=0, le=1),
+    interval_ms: float = Query(5.0, ge=1, le=1000),
+    reset: bool = True,
+) -> Dict:
+    """Sample the stacks of a random ``fraction`` of requests"""
+    disabled = _profiling_disabled()
+    if disabled is not None:
+        return disabled
+    REQUEST_PROFILER.start(fraction, interval_ms / 1000, reset=reset)
+    return REQUEST_PROFILER.status()
+
+
+@app.post("/admin/profile/stop")
+async def stop_profiling() -> Dict:
+    disabled = _profiling_disabled()
+    if disabled is not None:
+        return disabled
+    REQUEST_PROFILER.stop()
+    return REQUEST_PROFILER.status()
+
+
+@app.get("/admin/profile")
+async def download_profile() -> PlainTextResponse:
+    """Collected stacks in folded format (flamegraph.pl, inferno, speedscope)"""
+    disabled = _profiling_disabled()
+    if disabled is not None:
+        return disabled
+    return PlainTextResponse(
+        REQUEST_PROFILER.folded(),
+        headers={"Content-Disposition": 'attachment; filename="api-profile.folded"'},
+    )
+
+
+@app.get("/admin/profile/status")
+async def profiling_status() -> Dict:
+    disabled = _profiling_disabled()
+    if disabled is not None:
+        return disabled
+    return REQUEST_PROFILER.status()
+
+
+# Lookup tables for /explain, built once instead of per request.
+FEATURE_LABELS = {
+    "depth_km":           "Earthquake Depth",
+    "seismic_zone":       "Seismic Zone",
+    "quake_count_7d":     "Quakes in Last 7 Days",
+    "quake_count_30d":    "Quakes in Last 30 Days",
+    "avg_magnitude_30d":  "Avg Magnitude (30 Days)",
+    "max_magnitude_30d":  "Max Magnitude (30 Days)",
+    "prev_magnitude":     "Previous Event Magnitude",
+    "days_since_last_quake": "Days Since Last Quake",
+    "latitude":           "Latitude (Location)",
+    "longitude":          "Longitude (Location)",
+    "month":              "Time of Year"
+}
+# Upper bounds, checked in order, of each feature's LOW/MED/HIGH bands.
+FEATURE_RISK_THRESHOLDS = {
+    "depth_km":           [(10, "HIGH"), (30, "MED"), (999, "LOW")],
+    "quake_count_7d":     [(2,  "LOW"),  (5,  "MED"), (999, "HIGH")],
+    "quake_count_30d":    [(5,  "LOW"),  (15, "MED"), (999, "HIGH")],
+    "avg_magnitude_30d":  [(3.0,"LOW"),  (4.0,"MED"), (999, "HIGH")],
+    "max_magnitude_30d":  [(3.5,"LOW"),  (5.0,"MED"), (999, "HIGH")],
+    "days_since_last_quake": [(1,  "HIGH"), (7,  "MED"), (999, "LOW")],
+    "seismic_zone":       [(2,  "LOW"),  (3,  "MED"), (999, "HIGH")],
+}
+ZONE_DESCRIPTIONS = {5: "Very High Risk", 4: "High Risk", 3: "Moderate Risk", 2: "Low Risk"}
+# Gain importances of the active XGBoost model, recomputed only after a model swap.
+_IMPORTANCE: Dict[str, object] = {"model": None, "ranking": []}
+
+
+def _importance_ranking(model) -> List[Tuple[str, float]]:
+    """(feature, % of total gain) pairs, most important first."""
+    if _IMPORTANCE["model"] is not model:
+        importance_dict = model.get_booster().get_score(importance_type="gain")
+        total = sum(importance_dict.values()) or 1
+        _IMPORTANCE["ranking"] = sorted(
+            ((k, round((v / total) * 100, 1)) for k, v in importance_dict.items()),
+            key=lambda x: x[1],
+            reverse=True,
+        )
+        _IMPORTANCE["model"] = model
+    return _IMPORTANCE["ranking"]
 
 
 @app.post("/explain")
-async def explain_prediction(payload: PredictRequest) -> Dict:
+async def explain_prediction(payload: PredictRequest) -> FastJSONResponse:
     """
     Returns feature-level explanation for why
     the model gave this alert level
     """
+    _mark_request_parsed()
     try:
         recent_events = [event.model_dump() for event in payload.recent_events]
-        
+
         # Get the feature vector used for prediction
-        from src.train_xgboost import FEATURES
-        from src.predict import _load_xgb
-        
         features, feature_names = get_feature_vector(
             payload.latitude,
             payload.longitude,
@@ -171,51 +672,23 @@ async def explain_prediction(payload: PredictRequest) -> Dict:
             recent_events
         )
 
+        # One model snapshot for the importances and the prediction, so a swap in between cannot mix versions.
+        models = active_models(region_for(payload.latitude, payload.longitude))
         # Get XGBoost feature importances (gain-based)
-        model = _load_xgb()
+        model = models.xgb
         if model is None:
-            return {"error": "XGBoost model not loaded"}
-            
-        importance_dict = model.get_booster().get_score(
-            importance_type='gain'
-        )
-
-        # Normalize to percentages
-        total = sum(importance_dict.values()) or 1
-        importance_pct = {
-            k: round((v / total) * 100, 1)
-            for k, v in importance_dict.items()
-        }
-
-        # Map feature names to human-readable labels
-        readable_labels = {
-            "depth_km":           "Earthquake Depth",
-            "seismic_zone":       "Seismic Zone",
-            "quake_count_7d":     "Quakes in Last 7 Days",
-            "quake_count_30d":    "Quakes in Last 30 Days",
-            "avg_magnitude_30d":  "Avg Magnitude (30 Days)",
-            "max_magnitude_30d":  "Max Magnitude (30 Days)",
-            "prev_magnitude":     "Previous Event Magnitude",
-            "days_since_last_quake": "Days Since Last Quake",
-            "latitude":           "Latitude (Location)",
-            "longitude":          "Longitude (Location)",
-            "month":              "Time of Year"
-        }
+            return FastJSONResponse({"error": "XGBoost model not loaded"})
 
         # Build explanation features list sorted by importance
         explanation_features = []
-        for feat, pct in sorted(
-            importance_pct.items(),
-            key=lambda x: x[1],
-            reverse=True
-        ):
+        for feat, pct in _importance_ranking(model):
             # Get actual value for this feature
             idx = feature_names.index(feat) if feat in feature_names else -1
             actual_value = float(features[idx]) if idx >= 0 else None
 
             explanation_features.append({
                 "feature":        feat,
-                "label":          readable_labels.get(feat, feat),
+                "label":          FEATURE_LABELS.get(feat, feat),
                 "importance_pct": pct,
                 "actual_value":   actual_value,
                 "risk_level":     _classify_feature_risk(feat, actual_value)
@@ -232,17 +705,19 @@ async def explain_prediction(payload: PredictRequest) -> Dict:
             payload.latitude,
             payload.longitude,
             payload.depth_km,
-            recent_events
+            recent_events,
+            models=models,
         )
         
         magnitude = result["predicted_magnitude"]
         zone = int(result["seismic_zone"])
         alert_level = classify_alert(magnitude, zone)
 
-        return {
+        return FastJSONResponse({
             "predicted_magnitude": magnitude,
             "alert_level":         alert_level,
             "confidence":          result["confidence"],
+            "model_version":       result["model_version"],
             "features":            explanation_features[:6],  # top 6
             "historical_avg":      historical_avg,
             "plain_english":       _generate_plain_english(
@@ -251,28 +726,32 @@ async def explain_prediction(payload: PredictRequest) -> Dict:
                                       "alert_level": alert_level},
                                      historical_avg
                                    )
-        }
+        })
 
     except Exception as e:
-        return {"error": str(e)}
+        return FastJSONResponse({"error": str(e)})
+
+
+def _targeting(lat: float, lon: float, magnitude: float) -> Dict:
+    """Region name and the devices/population inside the shaking radius."""
+    with instrumentation.span("targeting"):
+        radius = shaking_radius_km(magnitude)
+        return {
+            "region": region_name(lat, lon),
+            "shaking_radius_km": round(radius, 1),
+            "affected_devices": DEVICE_REGISTRY.count_within(lat, lon, radius),
+            "affected_population": population_within(lat, lon, radius),
+        }
 
 
 def _classify_feature_risk(feature: str, value: float) -> str:
     """Classify each feature value as LOW/MED/HIGH risk"""
     if value is None:
         return "UNKNOWN"
-    thresholds = {
-        "depth_km":           [(10, "HIGH"), (30, "MED"), (999, "LOW")],
-        "quake_count_7d":     [(2,  "LOW"),  (5,  "MED"), (999, "HIGH")],
-        "quake_count_30d":    [(5,  "LOW"),  (15, "MED"), (999, "HIGH")],
-        "avg_magnitude_30d":  [(3.0,"LOW"),  (4.0,"MED"), (999, "HIGH")],
-        "max_magnitude_30d":  [(3.5,"LOW"),  (5.0,"MED"), (999, "HIGH")],
-        "days_since_last_quake": [(1,  "HIGH"), (7,  "MED"), (999, "LOW")],
-        "seismic_zone":       [(2,  "LOW"),  (3,  "MED"), (999, "HIGH")],
-    }
-    if feature not in thresholds:
+    bands = FEATURE_RISK_THRESHOLDS.get(feature)
+    if bands is None:
         return "NEUTRAL"
-    for threshold, label in thresholds[feature]:
+    for threshold, label in bands:
         if value <= threshold:
             return label
     return "LOW"
@@ -316,11 +795,9 @@ def _generate_plain_english(features, result, historical) -> List[str]:
                 f"{'above normal baseline indicating increased seismic stress' if val > 3.5 else 'within normal range'}."
             )
         elif feat == "seismic_zone" and val is not None:
-            zone_desc = {5: "Very High Risk", 4: "High Risk",
-                         3: "Moderate Risk", 2: "Low Risk"}
             sentences.append(
                 f"This location falls in IMD Seismic Zone {val:.0f} "
-                f"({zone_desc.get(int(val), 'Known Risk Zone')}), "
+                f"({ZONE_DESCRIPTIONS.get(int(val), 'Known Risk Zone')}), "
                 f"contributing {pct}% to the overall risk assessment."
             )
         elif feat == "days_since_last_quake" and val is not None:
@@ -354,3 +831,4 @@ def _recommendation(level: str) -> str:
     if level == "MID":
         return "Precautionary alert — monitor updates"
     return "Emergency alert — follow official guidance"
+
@@ -0,0 +1,422 @@
+"""Accelerated catalog replay through the live alert path.
+
+A local FDSN event-service stand-in serves a catalog (the cleaned USGS catalog
+or a synthetic aftershock sequence) as if it were happening now, on a virtual
+clock running ``--speed`` times faster than real time. The app is driven
+in-process: ``/live-feed`` is polled every ``--poll-s`` wall seconds, and every
+published alert is timed against the moment its event appeared in the feed.
+
+    python -m api.replay --synthetic --hours 6 --speed 120
+    python -m api.replay --since 2015-04-25 --until 2015-04-27 --speed 600
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from src import data_pipeline, event_state
+from src.regions import DEFAULT_REGION, REGIONS, regions_for
+
+CATALOG_PATH = Path("data/processed/usgs_india_clean.csv")
+FDSN_PATH = "/fdsnws/event/1/query"
+PERCENTILES = (50, 95, 99)
+
+
+class VirtualClock:
+    """Virtual UTC time starting at ``start`` and running ``speed`` times real time."""
+
+    def __init__(self, start: pd.Timestamp, speed: float) -> None:
+        self.start = start
+        self.speed = speed
+        self.wall_start = time.monotonic()
+
+    def now(self) -> datetime:
+        elapsed = pd.Timedelta(seconds=(time.monotonic() - self.wall_start) * self.speed)
+        return (self.start + elapsed).to_pydatetime(warn=False)
+
+    def wall_at(self, when: pd.Timestamp) -> float:
+        """``time.monotonic()`` value at which the virtual clock reaches ``when``."""
+        return self.wall_start + (when - self.start).total_seconds() / self.speed
+
+
+class FdsnStub:
+    """
+    Threaded HTTP stand-in for an FDSN ``event/1/query`` CSV endpoint.
+
+    Only events whose origin time plus ``publish_delay_s`` (virtual seconds,
+    the network's reporting lag) has passed on the clock are visible. Rows are
+    pre-rendered once, so a query is a bisect plus a bbox mask.
+    """
+
+    def __init__(self, catalog: pd.DataFrame, clock: VirtualClock, publish_delay_s: float = 0.0) -> None:
+        self.clock = clock
+        self.publish_delay = pd.Timedelta(seconds=publish_delay_s)
+        self.times = catalog["time"].to_numpy("datetime64[ns]")
+        self.lats = catalog["latitude"].to_numpy()
+        self.lons = catalog["longitude"].to_numpy()
+        stamps = catalog["time"].dt.strftime("%Y-%m-%dT%H:%M:%S.%f").str[:-3] + "Z"
+        body = catalog.assign(time=stamps)[["time", "latitude", "longitude", "depth", "mag", "place", "id"]]
+        self.header = "time,latitude,longitude,depth,mag,place,id\n".encode()
+        self.lines = [line.encode() for line in body.to_csv(index=False, header=False).splitlines(keepends=True)]
+        self.requests = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}{FDSN_PATH}"
+
+    def query(self, params: Dict[str, str]) -> bytes:
+        visible_until = pd.Timestamp(self.clock.now()) - self.publish_delay
+        start = pd.Timestamp(params.get("starttime", "1900-01-01"), tz="UTC")
+        end = min(pd.Timestamp(params.get("endtime", "2100-01-01"), tz="UTC"), visible_until)
+        lo = np.searchsorted(self.times, start.tz_convert(None).to_datetime64(), side="left")
+        hi = np.searchsorted(self.times, end.tz_convert(None).to_datetime64(), side="right")
+        lats, lons = self.lats[lo:hi], self.lons[lo:hi]
+        inside = (
+            (lats >= float(params.get("minlatitude", -90)))
+            & (lats <= float(params.get("maxlatitude", 90)))
+            & (lons >= float(params.get("minlongitude", -180)))
+            & (lons <= float(params.get("maxlongitude", 180)))
+        )
+        rows = np.flatnonzero(inside) + lo
+        if params.get("orderby") in (None, "time"):
+            rows = rows[::-1]
+        return b"".join([self.header, *(self.lines[i] for i in rows)]) if len(rows) else b""
+
+    def start(self) -> None:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                url = urlparse(self.path)
+                stub.requests += 1
+                if url.path != FDSN_PATH:
+                    self.send_error(404)
+                    return
+                body = stub.query({k: v[-1] for k, v in parse_qs(url.query).items()})
+                # FDSN answers 204 when nothing matches.
+                self.send_response(200 if body else 204)
+                self.send_header("Content-Type", "text/csv")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def _as_feed(df: pd.DataFrame, id_prefix: str) -> pd.DataFrame:
+    """Catalog rows in the FDSN CSV column names, sorted by time."""
+    df = df.rename(columns={"depth_km": "depth", "magnitude": "mag"}).copy()
+    df["time"] = pd.to_datetime(df["time"], utc=True, format="mixed")
+    df = df.sort_values("time").reset_index(drop=True)
+    if "place" not in df:
+        df["place"] = ""
+    if "id" not in df:
+        df["id"] = [f"{id_prefix}{i:06d}" for i in range(len(df))]
+    return df
+
+
+def load_catalog(path: Path = CATALOG_PATH) -> pd.DataFrame:
+    if not path.exists():
+        raise FileNotFoundError(f"Missing {path}. Run: python -m src.data_pipeline")
+    return _as_feed(pd.read_csv(path), "replay")
+
+
+def synthetic_catalog(
+    start: pd.Timestamp,
+    hours: float = 6.0,
+    mainshocks: int = 2,
+    min_magnitude: float = 3.0,
+    background_per_day: float = 4.0,
+    b_value: float = 1.0,
+    seed: int = 42,
+) -> pd.DataFrame:
+    """
+    Mainshocks with Omori-Utsu aftershock sequences plus uniform background.
+
+    Magnitudes follow Gutenberg-Richter with ``b_value``. A mainshock of
+    magnitude M has about 10^(b(M - 1.2 - min_magnitude)) aftershocks, so the
+    largest is about 1.2 units smaller (Båth's law). They decay in time as
+    (t + c)^-p with p = 1.1, c = 0.01 days, and scatter over about one rupture
+    length, 10^(0.5 M - 1.8) km.
+    """
+    rng = np.random.default_rng(seed)
+    bbox = DEFAULT_REGION.bbox
+    span_days = hours / 24
+    beta = 1.0 / (b_value * np.log(10))
+    p, c = 1.1, 0.01
+
+    def magnitudes(n: int, cap: float) -> np.ndarray:
+        return np.minimum(min_magnitude + rng.exponential(beta, n), cap)
+
+    def locations(n: int, lat: float, lon: float, spread_km: float):
+        lats = np.clip(lat + rng.normal(0, spread_km / 111.0, n), bbox["minlatitude"], bbox["maxlatitude"])
+        lons = np.clip(
+            lon + rng.normal(0, spread_km / (111.0 * np.cos(np.radians(lat))), n),
+            bbox["minlongitude"],
+            bbox["maxlongitude"],
+        )
+        return lats, lons
+
+    parts = []
+    n_background = rng.poisson(background_per_day * span_days)
+    parts.append(
+        pd.DataFrame(
+            {
+                "days": rng.uniform(0, span_days, n_background),
+                "latitude": rng.uniform(bbox["minlatitude"], bbox["maxlatitude"], n_background),
+                "longitude": rng.uniform(bbox["minlongitude"], bbox["maxlongitude"], n_background),
+                "depth": rng.uniform(5, 60, n_background),
+                "mag": magnitudes(n_background, 6.0),
+                "place": "Synthetic background",
+            }
+        )
+    )
+    for k in range(mainshocks):
+        onset = rng.uniform(0, span_days / 2)
+        m0 = float(min(min_magnitude + 2.5 + rng.exponential(beta), 7.8))
+        lat = rng.uniform(bbox["minlatitude"] + 2, bbox["maxlatitude"] - 2)
+        lon = rng.uniform(bbox["minlongitude"] + 2, bbox["maxlongitude"] - 2)
+        depth = rng.uniform(5, 40)
+        n = rng.poisson(10 ** (b_value * (m0 - 1.2 - min_magnitude)))
+        # Inverse CDF of the Omori-Utsu rate truncated to the rest of the window.
+        window = span_days - onset
+        a, z = c ** (1 - p), (window + c) ** (1 - p)
+        delays = (a - rng.uniform(0, 1, n) * (a - z)) ** (1 / (1 - p)) - c
+        lats, lons = locations(n, lat, lon, 10 ** (0.5 * m0 - 1.8) / 2)
+        label = f"Synthetic M{m0:.1f} sequence {k + 1}"
+        parts.append(
+            pd.DataFrame(
+                {
+                    "days": np.concatenate([[onset], onset + delays]),
+                    "latitude": np.concatenate([[lat], lats]),
+                    "longitude": np.concatenate([[lon], lons]),
+                    "depth": np.concatenate([[depth], np.clip(depth + rng.normal(0, 5, n), 1, 70)]),
+                    "mag": np.concatenate([[m0], magnitudes(n, m0 - 0.1)]),
+                    "place": [label] + [f"Aftershock of {label}"] * n,
+                }
+            )
+        )
+    df = pd.concat(parts, ignore_index=True)
+    df["time"] = start + pd.to_timedelta(df.pop("days"), unit="D")
+    df[["latitude", "longitude", "depth"]] = df[["latitude", "longitude", "depth"]].round(3)
+    df["mag"] = df["mag"].round(1)
+    return _as_feed(df, "syn")
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ms = np.asarray(values) * 1000
+    return {**{f"p{p}_ms": float(np.percentile(ms, p)) for p in PERCENTILES}, "max_ms": float(ms.max())}
+
+
+def swarm_mask(times: pd.Series, window: pd.Timedelta, min_events: int) -> np.ndarray:
+    """Events preceded by at least ``min_events`` others within ``window``."""
+    values = times.to_numpy("datetime64[ns]")
+    before = np.arange(len(values)) - np.searchsorted(values, values - window.to_timedelta64(), side="left")
+    return before >= min_events
+
+
+async def run_replay(
+    client: httpx.AsyncClient,
+    feed: pd.DataFrame,
+    speed: float,
+    poll_s: float,
+    publish_delay_s: float = 0.0,
+    lead_s: float = 60.0,
+    drain_s: float = 120.0,
+    history: Optional[pd.DataFrame] = None,
+    swarm_window: pd.Timedelta = pd.Timedelta(hours=1),
+    swarm_events: int = 10,
+) -> Dict:
+    """
+    Replay ``feed`` through ``/live-feed`` and time every alert from the
+    moment its event became visible in the feed to its publication.
+    ``history`` (catalog rows before the replay) seeds the event state of each region.
+    """
+    from api import main
+
+    if history is not None:
+        names = regions_for(history["latitude"].to_numpy(), history["longitude"].to_numpy())
+        for region in REGIONS.values():
+            state = event_state.EventState(region=region)
+            state.ingest_frame(event_state.seed_frame(history[names == region.name], state.config, region))
+            event_state.EVENT_STATES[region.name] = state
+    else:
+        for region in REGIONS.values():
+            event_state.get_event_state(region)
+
+    clock = VirtualClock(feed["time"].iloc[0] - pd.Timedelta(seconds=lead_s), speed)
+    stub = FdsnStub(feed, clock, publish_delay_s)
+    stub.start()
+    delay = pd.Timedelta(seconds=publish_delay_s)
+    visible_at = {event_id: clock.wall_at(t + delay) for event_id, t in zip(feed["id"], feed["time"])}
+    emitted: Dict[str, Dict] = {}
+    poll = {"started": 0.0}
+
+    def record(alert: Dict) -> None:
+        event_id = alert.get("event_id")
+        if event_id in visible_at and event_id not in emitted:
+            emitted[event_id] = {"at": time.monotonic(), "poll_started": poll["started"], "level": alert["alert_level"]}
+
+    saved = (data_pipeline.USGS_API, main.CLOCK)
+    data_pipeline.USGS_API, main.CLOCK = stub.url, clock.now
+    main.ALERT_SUBSCRIBERS.append(record)
+    poll_durations: List[float] = []
+    polls_with_events: List[int] = []
+    errors = 0
+    last_visible = max(visible_at.values())
+    try:
+        while len(emitted) < len(feed) and time.monotonic() < last_visible + drain_s:
+            poll["started"] = time.monotonic()
+            before = len(emitted)
+            response = await client.get("/live-feed")
+            if response.status_code != 200:
+                errors += 1
+            poll_durations.append(time.monotonic() - poll["started"])
+            polls_with_events.append(len(emitted) - before)
+            await asyncio.sleep(max(0.0, poll_s - poll_durations[-1]))
+    finally:
+        data_pipeline.USGS_API, main.CLOCK = saved
+        main.ALERT_SUBSCRIBERS.remove(record)
+        stub.stop()
+
+    ids = feed["id"].tolist()
+    swarm = dict(zip(ids, swarm_mask(feed["time"], swarm_window, swarm_events)))
+    total = [emitted[i]["at"] - visible_at[i] for i in ids if i in emitted]
+    wait = [max(0.0, emitted[i]["poll_started"] - visible_at[i]) for i in ids if i in emitted]
+    processing = [emitted[i]["at"] - emitted[i]["poll_started"] for i in ids if i in emitted]
+    in_swarm = [emitted[i]["at"] - visible_at[i] for i in ids if i in emitted and swarm[i]]
+    levels: Dict[str, int] = {}
+    for entry in emitted.values():
+        levels[entry["level"]] = levels.get(entry["level"], 0) + 1
+    span = (feed["time"].iloc[-1] - feed["time"].iloc[0]).total_seconds()
+    return {
+        "events": len(feed),
+        "alerted": len(emitted),
+        "missed": len(feed) - len(emitted),
+        "swarm_events": int(sum(swarm.values())),
+        "virtual_span_s": span,
+        "speed": speed,
+        "poll_s": poll_s,
+        "publish_delay_s": publish_delay_s,
+        "polls": len(poll_durations),
+        "poll_errors": errors,
+        "fdsn_requests": stub.requests,
+        "max_events_per_poll": max(polls_with_events, default=0),
+        "alert_levels": levels,
+        "latency": _percentiles(total),
+        "latency_swarm": _percentiles(in_swarm),
+        "poll_wait": _percentiles(wait),
+        "processing": _percentiles(processing),
+        "poll_duration": _percentiles(poll_durations),
+    }
+
+
+def _print_report(result: Dict) -> None:
+    print(
+        f"Replayed {result['events']} events ({result['virtual_span_s'] / 3600:.1f} h at {result['speed']:g}x) "
+        f"in {result['polls']} polls: {result['alerted']} alerted, {result['missed']} missed, "
+        f"{result['poll_errors']} poll errors"
+    )
+    print(f"   largest burst in one poll: {result['max_events_per_poll']} events; levels {result['alert_levels']}")
+    for key, label in (
+        ("latency", "visible -> alert"),
+        ("latency_swarm", f"  in swarms ({result['swarm_events']} ev)"),
+        ("poll_wait", "  waiting for poll"),
+        ("processing", "  fetch + predict"),
+        ("poll_duration", "poll duration"),
+    ):
+        stats = result[key]
+        if stats:
+            print(
+                f"   {label:<24} p50 {stats['p50_ms']:9.1f} ms  p95 {stats['p95_ms']:9.1f} ms  "
+                f"p99 {stats['p99_ms']:9.1f} ms  max {stats['max_ms']:9.1f} ms"
+            )
+
+
+async def _main_async(args: argparse.Namespace, feed: pd.DataFrame, history: Optional[pd.DataFrame]) -> Dict:
+    from api.main import DISPATCHER, app
+
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://replay", timeout=args.timeout
+        ) as client:
+            return await run_replay(
+                client,
+                feed,
+                speed=args.speed,
+                poll_s=args.poll_s,
+                publish_delay_s=args.publish_delay_s,
+                drain_s=args.drain_s,
+                history=history,
+                swarm_events=args.swarm_events,
+            )
+    finally:
+        await DISPATCHER.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay a catalog through the live alert path at N x speed")
+    parser.add_argument("--catalog", type=Path, default=CATALOG_PATH)
+    parser.add_argument("--since", default=None, help="Replay catalog events from this time (UTC)")
+    parser.add_argument("--until", default=None)
+    parser.add_argument("--synthetic", action="store_true", help="Replay a synthetic aftershock sequence instead")
+    parser.add_argument("--hours", type=float, default=6.0, help="Synthetic catalog length")
+    parser.add_argument("--mainshocks", type=int, default=2)
+    parser.add_argument("--min-magnitude", type=float, default=3.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--speed", type=float, default=120.0, help="Virtual seconds per wall second")
+    parser.add_argument("--poll-s", type=float, default=1.0, help="Wall seconds between /live-feed polls")
+    parser.add_argument("--publish-delay-s", type=float, default=0.0, help="Virtual feed reporting lag")
+    parser.add_argument("--drain-s", type=float, default=120.0, help="Wall seconds to wait after the last event")
+    parser.add_argument("--swarm-events", type=int, default=10, help="Events in the prior hour that make a swarm")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--output", type=Path, default=Path("replay_results.json"))
+    args = parser.parse_args()
+
+    history = None
+    if args.synthetic:
+        start = pd.Timestamp(datetime.now(timezone.utc)).floor("h")
+        feed = synthetic_catalog(start, args.hours, args.mainshocks, args.min_magnitude, seed=args.seed)
+    else:
+        catalog = load_catalog(args.catalog)
+        since = pd.Timestamp(args.since, tz="UTC") if args.since else catalog["time"].iloc[-1] - pd.Timedelta(days=1)
+        until = pd.Timestamp(args.until, tz="UTC") if args.until else catalog["time"].iloc[-1]
+        feed = catalog[(catalog["time"] >= since) & (catalog["time"] <= until)].reset_index(drop=True)
+        history = catalog[catalog["time"] < since].rename(columns={"depth": "depth_km", "mag": "magnitude"})
+    if feed.empty:
+        raise ValueError("No events to replay")
+
+    print(f"Replaying {len(feed)} events from {feed['time'].iloc[0]} to {feed['time'].iloc[-1]}")
+    result = asyncio.run(_main_async(args, feed, history))
+    result["config"] = {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()}
+    args.output.write_text(json.dumps(result, indent=2))
+    _print_report(result)
+    print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
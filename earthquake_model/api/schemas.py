@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 from pydantic import BaseModel, Field
 
@@ -19,6 +19,12 @@ class PredictRequest(BaseModel):
     longitude: float = Field(..., ge=-180, le=180)
     depth_km: float = Field(..., ge=0)
     recent_events: List[RecentEvent] = Field(default_factory=list)
+    # "fast" serves the distilled student model instead of the full ensemble.
+    mode: Literal["full", "fast"] = "full"
+
+
+class EventBatch(BaseModel):
+    events: List[RecentEvent] = Field(default_factory=list)
 
 
 class PredictResponse(BaseModel):
@@ -32,6 +38,22 @@ class PredictResponse(BaseModel):
     longitude: Optional[float] = None
     depth_km: Optional[float] = None
     seismic_zone: Optional[int] = None
+    shaking_radius_km: Optional[float] = None
+    affected_devices: Optional[int] = None
+    affected_population: Optional[int] = None
+    model_version: Optional[str] = None
+    mode: Optional[str] = None
+    region: Optional[str] = None
+
+
+class DeviceRegistration(BaseModel):
+    device_id: str
+    url: str
+    min_level: Literal["LOW", "MID", "HIGH"] = "MID"
+    timeout_s: float = Field(5.0, gt=0, le=60)
+    enabled: bool = True
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 
 class HealthResponse(BaseModel):
@@ -0,0 +1,83 @@
+"""
+Pre-serialized JSON responses for the hot endpoints.
+
+FastAPI's default path validates the returned value against the response
+model, walks it with ``jsonable_encoder`` and only then calls ``json.dumps``.
+Handlers on the hot path instead encode once with orjson and return the bytes
+in a :class:`FastJSONResponse`, which FastAPI sends untouched. Published
+alerts are encoded once and kept as bytes, so ``/latest-alerts`` serves the
+same 50 alerts by joining cached bytes rather than re-encoding them on every
+poll.
+"""
+from __future__ import annotations
+
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, Optional
+
+import numpy as np
+import orjson
+import pandas as pd
+from fastapi.responses import Response
+
+# OPT_UTC_Z writes UTC datetimes with a "Z" suffix, as pydantic did.
+_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is pd.NaT or value is pd.NA:
+        return None
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """orjson encoding; NaN and infinities become null instead of raising."""
+    return orjson.dumps(content, default=_default, option=_OPTIONS)
+
+
+class FastJSONResponse(Response):
+    """JSON response encoded with orjson; ``bytes`` content is sent as is."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+class AlertFeed:
+    """
+    The most recent alerts, newest first, each encoded once when published.
+
+    The JSON array body is rebuilt from the encoded alerts only after a
+    publish, so repeated polls return the same bytes.
+    """
+
+    def __init__(self, maxlen: int = 50) -> None:
+        self.alerts: Deque[Dict] = deque(maxlen=maxlen)
+        self._encoded: Deque[bytes] = deque(maxlen=maxlen)
+        self._body: Optional[bytes] = None
+
+    def __len__(self) -> int:
+        return len(self.alerts)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self.alerts)
+
+    def appendleft(self, alert: Dict) -> bytes:
+        """Store ``alert`` and return its encoding."""
+        encoded = dumps(alert)
+        self.alerts.appendleft(alert)
+        self._encoded.appendleft(encoded)
+        self._body = None
+        return encoded
+
+    def body(self) -> bytes:
+        body = self._body
+        if body is None:
+            body = self._body = b"[" + b",".join(self._encoded) + b"]"
+        return body
@@ -1,12 +1,34 @@
+from __future__ import annotations
+
+import numpy as np
+
+ALERT_LEVELS = ("LOW", "MID", "HIGH")
+LOW_THRESHOLD = 4.0
+MID_THRESHOLD = 5.5
+HIGH_ZONE_OFFSET = 0.5
+
+
 def classify_alert(magnitude: float, seismic_zone: int | None = None) -> str:
-    low = 4.0
-    mid = 5.5
+    low = LOW_THRESHOLD
+    mid = MID_THRESHOLD
     if seismic_zone is not None and seismic_zone >= 5:
-        low -= 0.5
-        mid -= 0.5
+        low -= HIGH_ZONE_OFFSET
+        mid -= HIGH_ZONE_OFFSET
 
     if magnitude < low:
         return "LOW"
     if magnitude < mid:
         return "MID"
     return "HIGH"
+
+
+def classify_alerts(magnitudes: np.ndarray, seismic_zones: np.ndarray | None = None) -> np.ndarray:
+    """Vectorized :func:`classify_alert`; returns int8 indexes into ``ALERT_LEVELS``."""
+    magnitudes = np.asarray(magnitudes, dtype=np.float64)
+    offset = 0.0
+    if seismic_zones is not None:
+        offset = np.where(np.asarray(seismic_zones) >= 5, HIGH_ZONE_OFFSET, 0.0)
+    levels = np.zeros(magnitudes.shape, dtype=np.int8)
+    levels[magnitudes >= LOW_THRESHOLD - offset] = 1
+    levels[magnitudes >= MID_THRESHOLD - offset] = 2
+    return levels
@@ -0,0 +1,390 @@
+"""
+Historical backtest of the alert pipeline.
+
+The catalog is replayed in time order through the serving feature path: an
+:class:`~src.event_state.EventState` answers each event's context and LSTM
+sequence exactly as ``predict_event`` would at the event's origin time, and
+only then ingests the event. The per-event replay is cheap; model inference
+runs once per time slice through ``predict_batch`` and one batched LSTM call.
+
+Slices are independent: each starts from a state seeded with the events
+that can still influence its first event (``seed_frame``), so they run in a
+process pool. The report has per-zone LOW/MID/HIGH confusion matrices
+(actual level from the observed magnitude, predicted level from the model),
+lead times of HIGH alerts raised in a zone before its HIGH events, and
+throughput.
+
+By default only events after the serving models' training data are scored
+(:func:`training_cutoff`); the in-memory trainers split rows at random, so
+anything earlier may have been fit on. When that leaves nothing to score,
+or ``--since`` reaches back further, the report counts the in-sample events.
+
+    python -m src.backtest --workers 2 --slices 8
+    python -m src.backtest --since 2020-01-01
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from threadpoolctl import threadpool_limits
+
+from src import model_registry
+from src.alert_classifier import ALERT_LEVELS, classify_alerts
+from src.event_state import EventState, seed_frame
+from src.feature_engineering import FeatureConfig
+from src.risk_raster import load_catalog
+from src.train_lstm import SEQUENCE_LENGTH
+from src.train_xgboost import FEATURES
+
+REPORT_PATH = Path("models/backtest_report.json")
+HIGH = ALERT_LEVELS.index("HIGH")
+
+_CATALOG: Dict[str, pd.DataFrame] = {}
+# Held for the worker's lifetime: the limits are restored when released.
+_THREAD_LIMITS: List[threadpool_limits] = []
+
+
+def training_cutoff() -> Optional[pd.Timestamp]:
+    """
+    Latest event time the serving base and fusion models may have trained on.
+    Per model that is the later of the streaming trainers' time-split
+    ``cutoff`` and ``trained_through``, which an accepted ``src.incremental``
+    update moves past the cutoff. None without recorded metrics.
+    """
+    models_dir = model_registry.artifact_paths()["xgb_model.json"].parent
+    cutoffs = []
+    for name in ("xgb_metrics.json", "lstm_metrics.json", "fusion_metrics.json"):
+        path = models_dir / name
+        if not path.exists():
+            continue
+        metrics = json.loads(path.read_text())
+        cutoffs.extend(pd.Timestamp(metrics[key]) for key in ("cutoff", "trained_through") if metrics.get(key))
+    return max(cutoffs) if cutoffs else None
+
+
+def slice_bounds(n_rows: int, start: int, n_slices: int) -> List[Tuple[int, int]]:
+    """Row ranges splitting ``[start, n_rows)`` into ``n_slices`` contiguous time slices."""
+    edges = np.linspace(start, n_rows, max(1, n_slices) + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+
+
+def replay_slice(catalog: pd.DataFrame, start: int, end: int) -> Dict[str, np.ndarray]:
+    """
+    Serving features for catalog rows ``[start, end)``: every event sees the
+    state built from the events before it, then is ingested.
+    """
+    config = FeatureConfig()
+    state = EventState(config)
+    if start > 0:
+        state.ingest_frame(seed_frame(catalog.iloc[:start], config))
+
+    rows = catalog.iloc[start:end]
+    x_input = np.zeros((len(rows), len(FEATURES)), dtype=np.float32)
+    sequences: List[np.ndarray] = []
+    sequence_rows: List[int] = []
+    columns = {name: i for i, name in enumerate(FEATURES)}
+    for i, (at, lat, lon, depth, magnitude, zone) in enumerate(
+        zip(
+            rows["time"],
+            rows["latitude"].to_numpy(dtype=float),
+            rows["longitude"].to_numpy(dtype=float),
+            rows["depth_km"].fillna(0.0).to_numpy(dtype=float),
+            rows["magnitude"].to_numpy(dtype=float),
+            rows["seismic_zone"].to_numpy(),
+        )
+    ):
+        context = state.context(lat, lon, at=at)
+        context.update(latitude=lat, longitude=lon, depth_km=depth)
+        for name, column in columns.items():
+            x_input[i, column] = context[name]
+        sequence = state.sequence(int(zone), SEQUENCE_LENGTH)
+        if sequence is not None:
+            sequences.append(sequence)
+            sequence_rows.append(i)
+        state.ingest(at, lat, lon, depth, magnitude, int(zone))
+    return {
+        "x_input": x_input,
+        "sequences": np.stack(sequences) if sequences else np.zeros((0, SEQUENCE_LENGTH, 6), np.float32),
+        "sequence_rows": np.asarray(sequence_rows, dtype=np.int64),
+    }
+
+
+def predict_slice(start: int, end: int) -> Dict:
+    """Replay and score one slice; runs inside a pool worker (or in-process)."""
+    from src.predict import active_models, predict_batch
+
+    catalog = _CATALOG["catalog"]
+    began = time.perf_counter()
+    replay = replay_slice(catalog, start, end)
+    replayed = time.perf_counter()
+
+    lstm_pred = np.full(end - start, np.nan, dtype=np.float32)
+    lstm = active_models().lstm
+    if lstm is not None and len(replay["sequence_rows"]):
+        lstm_pred[replay["sequence_rows"]] = lstm.predict(
+            replay["sequences"], batch_size=4096, verbose=0
+        ).reshape(-1)
+    magnitude, _ = predict_batch(replay["x_input"], lstm_pred)
+    rows = catalog.iloc[start:end]
+    return {
+        "start": start,
+        "end": end,
+        "time_ns": rows["time"].dt.tz_convert(None).to_numpy("datetime64[ns]").view(np.int64),
+        "zone": rows["seismic_zone"].to_numpy(dtype=np.int8),
+        "actual": rows["magnitude"].to_numpy(dtype=np.float32),
+        "predicted": magnitude,
+        "replay_s": replayed - began,
+        "inference_s": time.perf_counter() - replayed,
+        "model_version": active_models().version,
+    }
+
+
+def _init_worker(path: Optional[str], threads: int) -> None:
+    # numpy and TensorFlow are already imported here, so thread env vars would
+    # be read too late; cap the pools through their runtime APIs instead. The
+    # pool spawns its workers, so TensorFlow's runtime is not yet initialized.
+    _THREAD_LIMITS.append(threadpool_limits(threads))
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(threads)
+    _CATALOG["catalog"] = _load(path)
+
+
+def _load(path: Optional[str]) -> pd.DataFrame:
+    catalog = load_catalog(Path(path) if path else None)
+    # load_catalog sorts by time; the index is the replay order.
+    return catalog.reset_index(drop=True)
+
+
+def confusion_matrix(actual: np.ndarray, predicted: np.ndarray) -> np.ndarray:
+    """3x3 counts, rows = actual level, columns = predicted level."""
+    n = len(ALERT_LEVELS)
+    return np.bincount(actual.astype(np.int64) * n + predicted, minlength=n * n).reshape(n, n)
+
+
+def _level_scores(matrix: np.ndarray) -> Dict[str, Dict[str, Optional[float]]]:
+    scores = {}
+    for i, level in enumerate(ALERT_LEVELS):
+        actual, predicted = matrix[i].sum(), matrix[:, i].sum()
+        scores[level] = {
+            "recall": float(matrix[i, i] / actual) if actual else None,
+            "precision": float(matrix[i, i] / predicted) if predicted else None,
+            "support": int(actual),
+        }
+    return scores
+
+
+def lead_times(
+    time_ns: np.ndarray,
+    zone: np.ndarray,
+    actual_level: np.ndarray,
+    predicted_level: np.ndarray,
+    window_days: float = 7.0,
+) -> Dict:
+    """
+    For every actual HIGH event, the time since the earliest HIGH alert raised
+    for an earlier event of the same zone within ``window_days`` before it.
+    """
+    window_ns = int(window_days * 86400 * 1e9)
+    leads: List[np.ndarray] = []
+    warned = total = 0
+    for z in np.unique(zone):
+        in_zone = zone == z
+        targets = time_ns[in_zone & (actual_level == HIGH)]
+        if len(targets) == 0:
+            continue
+        alerts = np.sort(time_ns[in_zone & (predicted_level == HIGH)])
+        total += len(targets)
+        if len(alerts) == 0:
+            continue
+        first = np.searchsorted(alerts, targets - window_ns, side="left")
+        has_alert = first < len(alerts)
+        earliest = alerts[np.minimum(first, len(alerts) - 1)]
+        has_alert &= earliest < targets
+        warned += int(has_alert.sum())
+        leads.append((targets[has_alert] - earliest[has_alert]) / 3.6e12)
+    hours = np.concatenate(leads) if leads else np.zeros(0)
+    summary: Dict = {
+        "high_events": int(total),
+        "warned_in_advance": int(warned),
+        "warned_fraction": float(warned / total) if total else None,
+        "window_days": window_days,
+    }
+    if len(hours):
+        summary["lead_hours"] = {
+            "median": float(np.median(hours)),
+            "p10": float(np.quantile(hours, 0.1)),
+            "p90": float(np.quantile(hours, 0.9)),
+            "mean": float(hours.mean()),
+        }
+    return summary
+
+
+def summarize(results: List[Dict], lead_window_days: float) -> Dict:
+    results = sorted(results, key=lambda r: r["start"])
+    time_ns = np.concatenate([r["time_ns"] for r in results])
+    zone = np.concatenate([r["zone"] for r in results])
+    actual = np.concatenate([r["actual"] for r in results])
+    predicted = np.concatenate([r["predicted"] for r in results])
+    actual_level = classify_alerts(actual, zone)
+    predicted_level = classify_alerts(predicted, zone)
+
+    overall = confusion_matrix(actual_level, predicted_level)
+    per_zone = {}
+    for z in np.unique(zone):
+        mask = zone == z
+        matrix = confusion_matrix(actual_level[mask], predicted_level[mask])
+        per_zone[str(int(z))] = {
+            "events": int(mask.sum()),
+            "confusion": matrix.tolist(),
+            "levels": _level_scores(matrix),
+        }
+    return {
+        "events": int(len(actual)),
+        "from": pd.Timestamp(int(time_ns.min()), tz="UTC").isoformat(),
+        "to": pd.Timestamp(int(time_ns.max()), tz="UTC").isoformat(),
+        "model_version": results[0]["model_version"],
+        "labels": list(ALERT_LEVELS),
+        "mae": float(np.abs(predicted - actual).mean()),
+        "alert_accuracy": float((actual_level == predicted_level).mean()),
+        "confusion": overall.tolist(),
+        "levels": _level_scores(overall),
+        "per_zone": per_zone,
+        "lead_time": lead_times(time_ns, zone, actual_level, predicted_level, lead_window_days),
+    }
+
+
+def run_backtest(
+    path: Optional[Path] = None,
+    since: Optional[pd.Timestamp] = None,
+    until: Optional[pd.Timestamp] = None,
+    slices: int = 4,
+    workers: int = 1,
+    threads: int = 1,
+    lead_window_days: float = 7.0,
+) -> Dict:
+    began = time.perf_counter()
+    catalog = _load(str(path) if path else None)
+    times = catalog["time"]
+    cutoff = training_cutoff()
+    start = int(times.searchsorted(since)) if since is not None else 0
+    # Nanosecond views: recorded cutoffs can be finer than the catalog's time unit.
+    time_ns = times.dt.tz_convert(None).to_numpy("datetime64[ns]").view(np.int64)
+    cutoff_ns = cutoff.value if cutoff is not None else None
+    if since is None and cutoff is not None:
+        start = int(np.searchsorted(time_ns, cutoff_ns, side="right"))
+        if start == len(catalog):
+            print(f"Warning: no events after the models' training data (through {cutoff}); scoring in-sample events")
+            start = 0
+    end = int(times.searchsorted(until, side="right")) if until is not None else len(catalog)
+    # Rows after ``end`` are never needed: slices only look back.
+    catalog = catalog.iloc[:end]
+    bounds = slice_bounds(end, start, slices)
+    if not bounds:
+        raise ValueError("No events in the requested time range")
+
+    if workers > 1:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(str(path) if path else None, threads),
+        ) as pool:
+            results = list(pool.map(predict_slice, *zip(*bounds)))
+    else:
+        _CATALOG["catalog"] = catalog
+        results = [predict_slice(a, b) for a, b in bounds]
+
+    report = summarize(results, lead_window_days)
+    report["training_cutoff"] = cutoff.isoformat() if cutoff is not None else None
+    # Events the models may have been fit on; their scores overstate accuracy.
+    report["in_sample_events"] = int((time_ns[start:end] <= cutoff_ns).sum()) if cutoff is not None else None
+    wall = time.perf_counter() - began
+    report["throughput"] = {
+        "wall_s": wall,
+        "events_per_s": report["events"] / wall,
+        "replay_s": sum(r["replay_s"] for r in results),
+        "inference_s": sum(r["inference_s"] for r in results),
+        "slices": len(bounds),
+        "workers": workers,
+    }
+    return report
+
+
+def print_report(report: Dict) -> None:
+    print(
+        f"Backtest {report['from'][:10]} .. {report['to'][:10]}: {report['events']} events, "
+        f"model {report['model_version']}"
+    )
+    if report["in_sample_events"]:
+        print(
+            f"   {report['in_sample_events']} of these events predate the training cutoff "
+            f"({report['training_cutoff'][:10]}) and may be in the training data"
+        )
+    print(f"   MAE {report['mae']:.3f}, alert accuracy {report['alert_accuracy']:.3f}")
+    header = "actual \\ predicted"
+    for name, section in [("all zones", report), *((f"zone {z}", s) for z, s in report["per_zone"].items())]:
+        print(f"\n{name}:")
+        print(f"   {header:<20}" + "".join(f"{level:>8}" for level in ALERT_LEVELS) + "   recall")
+        for level, row in zip(ALERT_LEVELS, section["confusion"]):
+            recall = section["levels"][level]["recall"]
+            recall_text = f"{recall:.3f}" if recall is not None else "-"
+            print(f"   {level:<20}" + "".join(f"{count:>8}" for count in row) + f"   {recall_text}")
+    lead = report["lead_time"]
+    print(
+        f"\nLead time: {lead['warned_in_advance']}/{lead['high_events']} HIGH events had a HIGH alert "
+        f"in their zone within {lead['window_days']:g} days before"
+    )
+    if "lead_hours" in lead:
+        hours = lead["lead_hours"]
+        print(f"   median {hours['median']:.1f} h (p10 {hours['p10']:.1f} h, p90 {hours['p90']:.1f} h)")
+    speed = report["throughput"]
+    print(
+        f"Throughput: {speed['events_per_s']:,.0f} events/s ({speed['wall_s']:.1f}s wall; "
+        f"replay {speed['replay_s']:.1f}s, inference {speed['inference_s']:.1f}s over "
+        f"{speed['slices']} slices, {speed['workers']} workers)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay the catalog through the serving path and score alerts")
+    parser.add_argument("--catalog", type=Path, default=None, help="Defaults to the feature store")
+    parser.add_argument(
+        "--since",
+        default=None,
+        help="First event time to score (default: after the models' training data; warm-up uses earlier events)",
+    )
+    parser.add_argument("--until", default=None)
+    parser.add_argument("--slices", type=int, default=None, help="Time slices (default: 4 per worker)")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=None, help="Threads per worker")
+    parser.add_argument("--lead-window-days", type=float, default=7.0)
+    parser.add_argument("--output", type=Path, default=REPORT_PATH)
+    args = parser.parse_args()
+
+    report = run_backtest(
+        args.catalog,
+        pd.Timestamp(args.since, tz="UTC") if args.since else None,
+        pd.Timestamp(args.until, tz="UTC") if args.until else None,
+        args.slices or 4 * args.workers,
+        args.workers,
+        args.threads or max(1, (os.cpu_count() or 1) // args.workers),
+        args.lead_window_days,
+    )
+    print_report(report)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Compact in-memory event catalog.
+
+A default ``pd.read_csv`` of the feature store holds float64/int64 columns,
+one Python string per row for ``place`` and timestamps as strings.
+:class:`EventCatalog` keeps the same data as a struct of numpy arrays instead:
+float32 coordinates, depths, magnitudes and feature columns, int8 zones,
+int64 epoch nanoseconds, and ``place`` dictionary-encoded as int32 codes into
+a table of distinct strings.
+
+:func:`read_catalog` parses the CSV in chunks (so the parse never holds the
+whole default-dtype frame) and saves the arrays as ``.npy`` files under
+``data/cache/catalog/``. Later loads memory-map that cache, so API workers
+share one copy of the pages instead of each holding their own.
+
+    python -m src.catalog                 # memory report for the feature store
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.feature_engineering import assign_seismic_zones
+from src.regions import Region
+
+FEATURES_PATH = Path("data/processed/features.csv")
+CACHE_DIR = Path("data/cache/catalog")
+
+
+@dataclass
+class EventCatalog:
+    """Struct-of-arrays catalog; ``catalog["latitude"]`` returns a column array."""
+
+    time_ns: np.ndarray
+    seismic_zone: np.ndarray
+    columns: Dict[str, np.ndarray]
+    place_code: Optional[np.ndarray] = None
+    places: List[str] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.time_ns)
+
+    @property
+    def empty(self) -> bool:
+        return len(self) == 0
+
+    def __contains__(self, name: str) -> bool:
+        return name in ("time", "seismic_zone") or name in self.columns or (
+            name == "place" and self.place_code is not None
+        )
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name == "seismic_zone":
+            return self.seismic_zone
+        if name == "time_ns":
+            return self.time_ns
+        if name == "place":
+            return self.place_names()
+        return self.columns[name]
+
+    @property
+    def time(self) -> pd.DatetimeIndex:
+        return pd.to_datetime(np.asarray(self.time_ns), utc=True)
+
+    def place_names(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Decoded ``place`` strings (None where missing), for ``rows`` or every row."""
+        if self.place_code is None:
+            return np.full(len(self) if rows is None else len(rows), None, dtype=object)
+        codes = np.asarray(self.place_code if rows is None else self.place_code[rows])
+        table = np.array([*self.places, None], dtype=object)
+        return table[np.where(codes >= 0, codes, len(self.places))]
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Bytes per column, including the place table's strings."""
+        usage = {"time": self.time_ns.nbytes, "seismic_zone": self.seismic_zone.nbytes}
+        usage.update({name: values.nbytes for name, values in self.columns.items()})
+        if self.place_code is not None:
+            usage["place"] = self.place_code.nbytes + sum(sys.getsizeof(p) for p in self.places)
+        return usage
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self.memory_usage().values())
+
+    def to_frame(self, columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """A pandas frame over the compact dtypes (``place`` as a categorical)."""
+        names = list(columns) if columns is not None else ["time", *self.columns, "seismic_zone", "place"]
+        data = {}
+        for name in names:
+            if name == "time":
+                data["time"] = self.time
+            elif name == "place":
+                if self.place_code is not None:
+                    data["place"] = pd.Categorical.from_codes(np.asarray(self.place_code), self.places)
+            else:
+                data[name] = np.asarray(self[name])
+        return pd.DataFrame(data)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "EventCatalog":
+        return _Builder().add(df).build()
+
+    def save(self, directory: Path) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        arrays = {"time_ns": self.time_ns, "seismic_zone": self.seismic_zone, **self.columns}
+        if self.place_code is not None:
+            arrays["place_code"] = self.place_code
+        for name, values in arrays.items():
+            np.save(directory / f"{name}.npy", values)
+        (directory / "places.json").write_text(json.dumps(self.places))
+
+    @classmethod
+    def load(cls, directory: Path, columns: Iterable[str], mmap: bool = True) -> "EventCatalog":
+        mode = "r" if mmap else None
+        place_path = directory / "place_code.npy"
+        return cls(
+            time_ns=np.load(directory / "time_ns.npy", mmap_mode=mode),
+            seismic_zone=np.load(directory / "seismic_zone.npy", mmap_mode=mode),
+            columns={name: np.load(directory / f"{name}.npy", mmap_mode=mode) for name in columns},
+            place_code=np.load(place_path, mmap_mode=mode) if place_path.exists() else None,
+            places=json.loads((directory / "places.json").read_text()),
+        )
+
+
+class _Builder:
+    """Accumulates CSV chunks into compact arrays, dictionary-encoding ``place``."""
+
+    def __init__(self, region: Optional[Region] = None) -> None:
+        self.region = region
+        self.parts: Dict[str, List[np.ndarray]] = {}
+        self.place_table: Dict[str, int] = {}
+        self.has_place = False
+
+    def add(self, chunk: pd.DataFrame) -> "_Builder":
+        times = pd.to_datetime(chunk["time"], utc=True, format="mixed")
+        self._append("time_ns", times.dt.tz_convert(None).to_numpy("datetime64[ns]").view(np.int64))
+        if "seismic_zone" in chunk:
+            zones = chunk["seismic_zone"].to_numpy()
+        else:
+            zones = assign_seismic_zones(chunk["latitude"].to_numpy(), chunk["longitude"].to_numpy(), self.region)
+        self._append("seismic_zone", np.asarray(zones, dtype=np.int8))
+        if "place" in chunk:
+            self.has_place = True
+            local, uniques = pd.factorize(chunk["place"])
+            remap = np.array(
+                [self.place_table.setdefault(str(p), len(self.place_table)) for p in uniques], dtype=np.int32
+            )
+            self._append("place_code", np.where(local >= 0, remap[np.maximum(local, 0)], -1).astype(np.int32))
+        for name in chunk.columns:
+            if name in ("time", "seismic_zone", "place") or not pd.api.types.is_numeric_dtype(chunk[name]):
+                continue
+            self._append(name, chunk[name].to_numpy(dtype=np.float32))
+        return self
+
+    def _append(self, name: str, values: np.ndarray) -> None:
+        self.parts.setdefault(name, []).append(values)
+
+    def build(self) -> EventCatalog:
+        def joined(name: str, dtype) -> np.ndarray:
+            parts = self.parts.get(name)
+            return np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+
+        names = [n for n in self.parts if n not in ("time_ns", "seismic_zone", "place_code")]
+        return EventCatalog(
+            time_ns=joined("time_ns", np.int64),
+            seismic_zone=joined("seismic_zone", np.int8),
+            columns={name: joined(name, np.float32) for name in names},
+            place_code=joined("place_code", np.int32) if self.has_place else None,
+            places=list(self.place_table),
+        )
+
+
+def _cache_key(path: Path) -> str:
+    stat = path.stat()
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def read_catalog(
+    path: Path = FEATURES_PATH,
+    cache_dir: Optional[Path] = CACHE_DIR,
+    chunk_rows: int = 100_000,
+    mmap: bool = True,
+    region: Optional[Region] = None,
+) -> EventCatalog:
+    """
+    Compact catalog of a CSV, rows in file order. Uses (and refreshes) the
+    memory-mapped cache in ``cache_dir`` unless it is None. Rows without a
+    ``seismic_zone`` get ``region``'s zones (default: the active region).
+    """
+    root = cache_dir / path.stem if cache_dir is not None else None
+    target = root / _cache_key(path) if root is not None else None
+    if target is not None and (target / "meta.json").exists():
+        meta = json.loads((target / "meta.json").read_text())
+        return EventCatalog.load(target, meta["columns"], mmap=mmap)
+
+    builder = _Builder(region)
+    for chunk in pd.read_csv(path, chunksize=chunk_rows):
+        builder.add(chunk)
+    catalog = builder.build()
+    if target is None:
+        return catalog
+
+    # Build in a private directory and rename it into place, so trainers started
+    # side by side never see (or map) a half-written cache.
+    root.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=".build-", dir=root))
+    catalog.save(staging)
+    (staging / "meta.json").write_text(json.dumps({"source": str(path), "columns": list(catalog.columns)}))
+    try:
+        staging.rename(target)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)  # another process got there first
+    for stale in root.iterdir():
+        if stale.name != target.name and not stale.name.startswith(".build-"):
+            shutil.rmtree(stale, ignore_errors=True)
+    return EventCatalog.load(target, list(catalog.columns), mmap=True) if mmap else catalog
+
+
+_RSS_PROBE = """
+import sys
+{load}
+print(next(l.split()[1] for l in open('/proc/self/status') if l.startswith('VmRSS')))
+"""
+
+
+def _probe_rss_mb(load: str) -> float:
+    """Resident memory (MB) of a fresh interpreter after running ``load``."""
+    output = subprocess.run(
+        [sys.executable, "-c", _RSS_PROBE.format(load=load)], capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()
+    return int(output[-1]) / 1024
+
+
+def memory_report(path: Path = FEATURES_PATH) -> Dict:
+    catalog = read_catalog(path)
+    frame = pd.read_csv(path)
+    baseline = "import numpy, pandas; from src import catalog"
+    return {
+        "rows": len(catalog),
+        "distinct_places": len(catalog.places),
+        "pandas_bytes": int(frame.memory_usage(deep=True).sum()),
+        "compact_bytes": catalog.nbytes,
+        "compact_columns": catalog.memory_usage(),
+        "rss_mb": {
+            "baseline": _probe_rss_mb(baseline),
+            "pandas": _probe_rss_mb(f"{baseline}; df = pandas.read_csv({str(path)!r})"),
+            "compact": _probe_rss_mb(
+                f"{baseline}; c = catalog.read_catalog(catalog.Path({str(path)!r}), mmap=False)"
+            ),
+            "compact_mmap": _probe_rss_mb(
+                f"{baseline}; c = catalog.read_catalog(catalog.Path({str(path)!r}))"
+                "; [c[n].sum() for n in ('latitude', 'longitude', 'magnitude')]"
+            ),
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the compact catalog cache and report its memory use")
+    parser.add_argument("--path", type=Path, default=FEATURES_PATH)
+    args = parser.parse_args()
+    if not args.path.exists():
+        raise FileNotFoundError(f"Missing {args.path}. Run: python -m src.feature_engineering")
+
+    report = memory_report(args.path)
+    print(f"{report['rows']} events, {report['distinct_places']} distinct places")
+    print(f"   pandas default dtypes: {report['pandas_bytes'] / 1e6:.1f} MB")
+    print(
+        f"   compact catalog:       {report['compact_bytes'] / 1e6:.1f} MB "
+        f"({report['pandas_bytes'] / report['compact_bytes']:.1f}x smaller)"
+    )
+    rss = report["rss_mb"]
+    print(
+        f"   process RSS over a bare interpreter: pandas +{rss['pandas'] - rss['baseline']:.1f} MB, "
+        f"compact +{rss['compact'] - rss['baseline']:.1f} MB, "
+        f"memory-mapped +{rss['compact_mmap'] - rss['baseline']:.1f} MB (shared between workers)"
+    )
+
+
+if __name__ == "__main__":
+    main()
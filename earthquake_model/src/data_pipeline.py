@@ -1,19 +1,17 @@
 import argparse
+import os
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional
 
 import pandas as pd
 import requests
 
-USGS_API = "https://earthquake.usgs.gov/fdsnws/event/1/query"
+from src.profiling import StageProfiler
+from src.regions import active_region
 
-INDIA_BBOX = {
-    "minlatitude": 6.5,
-    "maxlatitude": 37.6,
-    "minlongitude": 68.1,
-    "maxlongitude": 97.4,
-}
+# Any FDSN event service; api.replay points this at a local stand-in.
+USGS_API = os.environ.get("EQ_USGS_API", "https://earthquake.usgs.gov/fdsnws/event/1/query")
 
 
 def fetch_usgs_data(
@@ -21,13 +19,15 @@ def fetch_usgs_data(
     endtime: str,
     output_path: Path,
     timeout: int = 30,
+    bbox: Optional[Dict[str, float]] = None,
 ) -> Path:
+    """Fetch a CSV of the events in ``bbox`` (default: the active region's)."""
     params = {
         "format": "csv",
         "starttime": starttime,
         "endtime": endtime,
         "orderby": "time-asc",
-        **INDIA_BBOX,
+        **(bbox or active_region().bbox),
     }
     response = requests.get(USGS_API, params=params, timeout=timeout)
     response.raise_for_status()
@@ -47,28 +47,34 @@ def clean_usgs_data(csv_path: Path) -> pd.DataFrame:
     return df
 
 
-def fetch_and_clean(years: int = 20, output_dir: Optional[Path] = None) -> Path:
+def fetch_and_clean(
+    years: int = 20, output_dir: Optional[Path] = None, profiler: Optional[StageProfiler] = None
+) -> Path:
+    profiler = profiler or StageProfiler("data_pipeline", enabled=False)
     output_dir = output_dir or Path("data/raw")
     end_dt = datetime.now(timezone.utc)
     start_dt = end_dt - timedelta(days=365 * years)
     raw_path = output_dir / "usgs_india.csv"
-    fetch_usgs_data(
-        starttime=start_dt.strftime("%Y-%m-%d"),
-        endtime=end_dt.strftime("%Y-%m-%d"),
-        output_path=raw_path,
-    )
-    cleaned = clean_usgs_data(raw_path)
-    cleaned_path = Path("data/processed") / "usgs_india_clean.csv"
-    cleaned_path.parent.mkdir(parents=True, exist_ok=True)
-    cleaned.to_csv(cleaned_path, index=False)
+    with profiler.stage("fetch"):
+        fetch_usgs_data(
+            starttime=start_dt.strftime("%Y-%m-%d"),
+            endtime=end_dt.strftime("%Y-%m-%d"),
+            output_path=raw_path,
+        )
+    with profiler.stage("clean"):
+        cleaned = clean_usgs_data(raw_path)
+        cleaned_path = Path("data/processed") / "usgs_india_clean.csv"
+        cleaned_path.parent.mkdir(parents=True, exist_ok=True)
+        cleaned.to_csv(cleaned_path, index=False)
     return cleaned_path
 
 
 def main() -> None:
-    parser = argparse.ArgumentParser(description="Fetch USGS earthquake data for India")
+    parser = argparse.ArgumentParser(description="Fetch USGS earthquake data for the active region")
     parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--profile", action="store_true", help="Write a sampling profile per stage")
     args = parser.parse_args()
-    cleaned_path = fetch_and_clean(years=args.years)
+    cleaned_path = fetch_and_clean(years=args.years, profiler=StageProfiler("data_pipeline", args.profile))
     print(f"Saved cleaned data to {cleaned_path}")
 
 
@@ -0,0 +1,243 @@
+"""
+Distil the XGBoost + LSTM + fusion ensemble into a compact student model.
+
+The teacher labels every feature-store row with the magnitude the serving
+stack would predict (fusion where the zone has a full LSTM sequence,
+XGBoost otherwise, exactly as ``predict_batch``). A shallow XGBoost model is
+fit to those labels and exported with :mod:`src.student` as a numpy-only
+JSON artifact. The report compares the student with the ensemble on held-out
+rows: alert-level agreement, latency, artifact size and process memory.
+
+    python -m src.distill --trees 150 --depth 4
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+from xgboost import XGBRegressor
+
+from src.alert_classifier import ALERT_LEVELS, classify_alerts
+from src.model_registry import artifact_paths
+from src.predict import active_models, predict_batch
+from src.student import STUDENT_PATH, StudentModel, from_xgboost
+from src.train_lstm import sequence_set
+from src.train_xgboost import FEATURES
+
+FEATURES_PATH = Path("data/processed/features.csv")
+REPORT_PATH = Path("models/student_report.json")
+HIGH = ALERT_LEVELS.index("HIGH")
+
+# ru_maxrss survives exec on Linux, so the probes read the process's own VmHWM instead.
+_PEAK_RSS = "print(next(l.split()[1] for l in open('/proc/self/status') if l.startswith('VmHWM')))"
+_FULL_STACK_PROBE = f"""
+from src.predict import active_models, warm_model_set
+warm_model_set(active_models())
+{_PEAK_RSS}
+"""
+_STUDENT_PROBE = f"""
+import numpy as np
+from src.student import StudentModel
+model = StudentModel.load({{path!r}})
+model.predict(np.zeros((1, len(model.features))))
+{_PEAK_RSS}
+"""
+
+
+def teacher_predictions(df: pd.DataFrame) -> np.ndarray:
+    """Ensemble magnitude for every row, with the serving fallbacks."""
+    x_input = df[FEATURES].fillna(0.0).to_numpy(dtype=np.float32)
+    lstm_pred = np.full(len(df), np.nan, dtype=np.float32)
+    lstm = active_models().lstm
+    if lstm is not None:
+        samples = sequence_set(df)
+        lstm_pred[samples.rows] = lstm.predict(samples.dataset(4096), verbose=0).reshape(-1)
+    magnitude, _ = predict_batch(x_input, lstm_pred)
+    return magnitude
+
+
+def train_student(
+    X: np.ndarray,
+    teacher: np.ndarray,
+    zones: np.ndarray,
+    trees: int,
+    depth: int,
+    high_weight: float = 10.0,
+) -> StudentModel:
+    """Fit a shallow booster to the teacher; rows the teacher rates HIGH are up-weighted."""
+    model = XGBRegressor(
+        n_estimators=trees,
+        max_depth=depth,
+        learning_rate=0.1,
+        subsample=0.9,
+        tree_method="hist",
+        objective="reg:squarederror",
+        random_state=42,
+    )
+    weights = np.where(classify_alerts(teacher, zones) == HIGH, high_weight, 1.0)
+    model.fit(X, teacher, sample_weight=weights)
+    meta = {"trees": trees, "depth": depth, "high_weight": high_weight}
+    return from_xgboost(model.get_booster(), FEATURES, meta=meta)
+
+
+def agreement(teacher: np.ndarray, student: np.ndarray, zones: np.ndarray) -> Dict:
+    teacher_levels = classify_alerts(teacher, zones)
+    student_levels = classify_alerts(student, zones)
+    per_level = {}
+    for index, level in enumerate(ALERT_LEVELS):
+        mask = teacher_levels == index
+        per_level[level] = {
+            "rows": int(mask.sum()),
+            "agreement": float((student_levels[mask] == index).mean()) if mask.any() else None,
+        }
+    return {
+        "alert_agreement": float((teacher_levels == student_levels).mean()),
+        "per_level": per_level,
+        "mae_vs_teacher": float(np.abs(teacher - student).mean()),
+    }
+
+
+def _latency_ms(fn, repeats: int) -> Tuple[float, float]:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+
+
+def latency_report(student: StudentModel, X: np.ndarray, repeats: int = 200) -> Dict:
+    """Single-row and batch latency of the full stack versus the student."""
+    models = active_models()
+    row = X[:1]
+    sequence = np.zeros((1, 10, 6), dtype=np.float32)
+
+    def full_single() -> None:
+        xgb_pred = models.xgb.predict(pd.DataFrame(row, columns=FEATURES)) if models.xgb else None
+        if models.lstm is not None:
+            lstm_pred = models.lstm.predict(sequence, verbose=0)
+            if models.fusion is not None and xgb_pred is not None:
+                models.fusion.predict(np.array([[xgb_pred[0], lstm_pred[0][0]]]), verbose=0)
+
+    full_p50, full_p99 = _latency_ms(full_single, repeats)
+    student_p50, student_p99 = _latency_ms(lambda: student.predict(row), repeats * 10)
+
+    start = time.perf_counter()
+    predict_batch(X, np.zeros(len(X), dtype=np.float32) if models.lstm is not None else None)
+    full_batch = time.perf_counter() - start
+    start = time.perf_counter()
+    student.predict(X)
+    student_batch = time.perf_counter() - start
+    return {
+        "single_row_ms": {
+            "full": {"p50": full_p50, "p99": full_p99},
+            "student": {"p50": student_p50, "p99": student_p99},
+        },
+        "batch_rows_per_s": {
+            "rows": int(len(X)),
+            "full": len(X) / full_batch,
+            "student": len(X) / student_batch,
+        },
+    }
+
+
+def _probe_rss_mb(code: str) -> float:
+    """Peak RSS of a fresh interpreter running ``code`` (which prints its VmHWM in KiB)."""
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()
+    return int(output[-1]) / 1024
+
+
+def memory_report(student_path: Path) -> Dict:
+    on_disk = {
+        name: path.stat().st_size
+        for name, path in artifact_paths().items()
+        if path.exists() and name != student_path.name
+    }
+    return {
+        "artifact_bytes": {"full": on_disk, "student": student_path.stat().st_size},
+        "process_peak_rss_mb": {
+            "full": _probe_rss_mb(_FULL_STACK_PROBE),
+            "student": _probe_rss_mb(_STUDENT_PROBE.format(path=str(student_path))),
+        },
+        "student_runtime_dependencies": ["numpy"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Distil the model ensemble into a fast student model")
+    parser.add_argument("--trees", type=int, default=150)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--high-weight", type=float, default=10.0, help="Sample weight of teacher-HIGH rows")
+    parser.add_argument("--output", type=Path, default=STUDENT_PATH)
+    parser.add_argument("--skip-memory", action="store_true", help="Skip the subprocess memory probes")
+    args = parser.parse_args()
+
+    if not FEATURES_PATH.exists():
+        raise FileNotFoundError(
+            "Missing features. Run: python -m src.feature_engineering"
+        )
+    df = pd.read_csv(FEATURES_PATH, parse_dates=["time"])
+    models = active_models()
+    if models.xgb is None:
+        raise FileNotFoundError("Missing base models. Train XGBoost (and LSTM/fusion) first.")
+
+    start = time.perf_counter()
+    teacher = teacher_predictions(df)
+    print(f"Teacher labels for {len(df)} rows in {time.perf_counter() - start:.1f}s (model {models.version})")
+
+    X = df[FEATURES].fillna(0.0).to_numpy(dtype=np.float32)
+    zones = df["seismic_zone"].to_numpy()
+    order = np.random.default_rng(42).permutation(len(df))
+    n_holdout = int(len(df) * args.holdout)
+    holdout, train = order[:n_holdout], order[n_holdout:]
+
+    student = train_student(
+        X[train], teacher[train], zones[train], args.trees, args.depth, args.high_weight
+    )
+    student.meta["teacher_version"] = models.version
+    student.save(args.output)
+
+    student_pred = student.predict(X[holdout])
+    report = {
+        "teacher_version": models.version,
+        "student": {"trees": student.n_trees, "depth": args.depth, "path": str(args.output)},
+        **agreement(teacher[holdout], student_pred, zones[holdout]),
+        "mae_vs_actual": {
+            "teacher": float(np.abs(teacher[holdout] - df["magnitude"].to_numpy()[holdout]).mean()),
+            "student": float(np.abs(student_pred - df["magnitude"].to_numpy()[holdout]).mean()),
+        },
+        "latency": latency_report(student, X[holdout]),
+    }
+    if not args.skip_memory:
+        report["memory"] = memory_report(args.output)
+    student.meta.update(alert_agreement=report["alert_agreement"])
+    student.save(args.output)
+    REPORT_PATH.write_text(json.dumps(report, indent=2))
+
+    single = report["latency"]["single_row_ms"]
+    print(f"✅ Student saved to {args.output} ({args.output.stat().st_size / 1024:.0f} KiB)")
+    print(f"   Alert agreement with ensemble: {report['alert_agreement']:.3f}")
+    print(f"   MAE vs ensemble: {report['mae_vs_teacher']:.3f}")
+    print(
+        f"   Single-row p50: {single['full']['p50']:.2f} ms full vs "
+        f"{single['student']['p50']:.3f} ms student"
+    )
+    if "memory" in report:
+        rss = report["memory"]["process_peak_rss_mb"]
+        print(f"   Peak RSS: {rss['full']:.0f} MB full vs {rss['student']:.0f} MB student")
+    print(f"   Report written to {REPORT_PATH}")
+
+
+if __name__ == "__main__":
+    main()
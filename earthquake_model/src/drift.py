@@ -0,0 +1,88 @@
+"""
+Feature-distribution drift between the training data and new events.
+
+Trainers record a :func:`feature_profile` (decile bin edges and the share of
+training rows per bin) in their metrics, streaming ones through a
+:class:`ProfileAccumulator`; :func:`population_stability` scores
+new rows against it with the population stability index (PSI). By the usual
+rule of thumb PSI < 0.1 is stable and > 0.25 is a significant shift.
+"""
+from __future__ import annotations
+
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Calendar and location columns are left out: a batch of recent events always
+# "drifts" in month, and its footprint depends on where they happened.
+DRIFT_FEATURES = [
+    "depth_km",
+    "magnitude",
+    "prev_magnitude",
+    "quake_count_7d",
+    "quake_count_30d",
+    "avg_magnitude_30d",
+    "max_magnitude_30d",
+    "days_since_last_quake",
+]
+PSI_THRESHOLD = 0.25
+
+
+def _bin_shares(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    counts = np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1)
+    return counts / max(len(values), 1)
+
+
+def feature_profile(df: pd.DataFrame, columns: Sequence[str] = DRIFT_FEATURES, bins: int = 10) -> Dict:
+    """Decile edges and per-bin shares of ``columns`` (those present in ``df``)."""
+    profile = {}
+    for column in columns:
+        if column not in df:
+            continue
+        values = df[column].fillna(0.0).to_numpy(dtype=np.float64)
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1]))
+        profile[column] = {"edges": edges.tolist(), "shares": _bin_shares(values, edges).tolist()}
+    return profile
+
+
+class ProfileAccumulator:
+    """
+    :func:`feature_profile` of rows seen chunk by chunk. Keeps a uniform
+    sample of at most ``max_rows`` rows (the rows with the smallest random
+    keys), so the profile is exact up to that many rows and estimated beyond.
+    """
+
+    def __init__(self, columns: Sequence[str] = DRIFT_FEATURES, max_rows: int = 200_000, seed: int = 0) -> None:
+        self.columns = list(columns)
+        self.max_rows = max_rows
+        self.rows = 0
+        self._rng = np.random.default_rng(seed)
+        self._sample: Optional[pd.DataFrame] = None
+        self._keys = np.empty(0)
+
+    def add(self, df: pd.DataFrame) -> None:
+        chunk = df[[c for c in self.columns if c in df]].reset_index(drop=True)
+        keys = np.concatenate([self._keys, self._rng.random(len(chunk))])
+        sample = chunk if self._sample is None else pd.concat([self._sample, chunk], ignore_index=True)
+        if len(keys) > self.max_rows:
+            keep = np.sort(np.argpartition(keys, self.max_rows)[: self.max_rows])
+            sample, keys = sample.iloc[keep].reset_index(drop=True), keys[keep]
+        self._sample, self._keys = sample, keys
+        self.rows += len(chunk)
+
+    def profile(self, bins: int = 10) -> Dict:
+        return {} if self._sample is None else feature_profile(self._sample, self.columns, bins)
+
+
+def population_stability(profile: Dict, df: pd.DataFrame, eps: float = 1e-4) -> Dict[str, float]:
+    """PSI of every profiled column present in ``df``."""
+    scores = {}
+    for column, reference in profile.items():
+        if column not in df:
+            continue
+        edges = np.asarray(reference["edges"])
+        expected = np.maximum(np.asarray(reference["shares"]), eps)
+        actual = np.maximum(_bin_shares(df[column].fillna(0.0).to_numpy(dtype=np.float64), edges), eps)
+        scores[column] = float(((actual - expected) * np.log(actual / expected)).sum())
+    return scores
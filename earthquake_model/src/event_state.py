@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import bisect
+import math
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.catalog import CACHE_DIR, read_catalog
+from src.feature_engineering import FeatureConfig, haversine_km
+from src.regions import Region, active_region
+
+NS_PER_DAY = 86400 * 10**9
+KM_PER_DEGREE = 111.195
+RING_SIZE = 32
+MAX_SEEN_IDS = 100_000
+
+# (time_ns, latitude, longitude, depth_km, magnitude, days_since_last_quake)
+Event = Tuple[int, float, float, float, float, float]
+
+
+@dataclass
+class _ZoneState:
+    # Last RING_SIZE events of the zone: previous-event features and LSTM sequences.
+    recent: Deque[Event] = field(default_factory=lambda: deque(maxlen=RING_SIZE))
+    # (time_ns, magnitude) of every zone event inside the 30-day window.
+    window: Deque[Tuple[int, float]] = field(default_factory=deque)
+    window_sum: float = 0.0
+    # Monotonic deque of window magnitudes, strictly decreasing: front is the max.
+    maxima: Deque[Tuple[int, float]] = field(default_factory=deque)
+
+    def push_window(self, time_ns: int, magnitude: float) -> None:
+        self.window.append((time_ns, magnitude))
+        self.window_sum += magnitude
+        while self.maxima and self.maxima[-1][1] <= magnitude:
+            self.maxima.pop()
+        self.maxima.append((time_ns, magnitude))
+
+    def evict(self, cutoff_ns: int) -> None:
+        while self.window and self.window[0][0] < cutoff_ns:
+            _, magnitude = self.window.popleft()
+            self.window_sum -= magnitude
+        while self.maxima and self.maxima[0][0] < cutoff_ns:
+            self.maxima.popleft()
+        if not self.window:
+            self.window_sum = 0.0
+
+    def rebuild_window(self, entries: List[Tuple[int, float]]) -> None:
+        self.window = deque()
+        self.window_sum = 0.0
+        self.maxima = deque()
+        for time_ns, magnitude in entries:
+            self.push_window(time_ns, magnitude)
+
+
+class EventState:
+    """
+    Rolling per-zone and spatial event context of one region for serving.
+
+    Answers the ``build_features`` context of a hypothetical event at (lat, lon,
+    time) without the client shipping its history: previous-event features come
+    from per-zone ring buffers, the 30-day zone count/mean/max from a FIFO with
+    a running sum and a monotonic max deque, and the 7-day radius count from a
+    grid of spatial buckets about one radius wide, so only neighbouring buckets
+    are scanned. Windows are evicted against a clock that only moves forward,
+    so queries and ingestion are expected in (roughly) time order; late events
+    are inserted in place at O(window) cost.
+    """
+
+    def __init__(self, config: Optional[FeatureConfig] = None, region: Optional[Region] = None) -> None:
+        self.config = config or FeatureConfig()
+        self.region = region or active_region()
+        self.window_7d_ns = self.config.window_7d * NS_PER_DAY
+        self.window_30d_ns = self.config.window_30d * NS_PER_DAY
+        self.bucket_deg = self.config.radius_km / KM_PER_DEGREE
+        self.zones: Dict[int, _ZoneState] = {}
+        self.buckets: Dict[Tuple[int, int], Deque[Tuple[int, float, float]]] = {}
+        self.spatial_fifo: Deque[Tuple[int, Tuple[int, int]]] = deque()
+        self.clock_ns = 0
+        self.total_ingested = 0
+        self._seen: "OrderedDict[object, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Events in the 7-day spatial window (each is also held in its zone's 30-day window)."""
+        return len(self.spatial_fifo)
+
+    def _bucket(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.bucket_deg)), int(math.floor(lon / self.bucket_deg))
+
+    def _advance(self, time_ns: int) -> None:
+        if time_ns <= self.clock_ns:
+            return
+        self.clock_ns = time_ns
+        cutoff_7d = time_ns - self.window_7d_ns
+        while self.spatial_fifo and self.spatial_fifo[0][0] < cutoff_7d:
+            _, key = self.spatial_fifo.popleft()
+            bucket = self.buckets[key]
+            bucket.popleft()
+            if not bucket:
+                del self.buckets[key]
+        cutoff_30d = time_ns - self.window_30d_ns
+        for zone_state in self.zones.values():
+            zone_state.evict(cutoff_30d)
+
+    @staticmethod
+    def _key(time_ns: int, latitude: float, longitude: float, event_id: Optional[object]) -> object:
+        return event_id if event_id is not None else (time_ns, round(latitude, 4), round(longitude, 4))
+
+    def is_new(self, time: pd.Timestamp, latitude: float, longitude: float, event_id: Optional[object] = None) -> bool:
+        """Whether :meth:`ingest` would add this event (it has not been seen yet)."""
+        return self._key(_to_ns(time), latitude, longitude, event_id) not in self._seen
+
+    def ingest(
+        self,
+        time: pd.Timestamp,
+        latitude: float,
+        longitude: float,
+        depth_km: float,
+        magnitude: float,
+        seismic_zone: Optional[int] = None,
+        event_id: Optional[object] = None,
+    ) -> bool:
+        """Add one event; returns False when ``event_id`` was already ingested."""
+        time_ns = _to_ns(time)
+        key = self._key(time_ns, latitude, longitude, event_id)
+        zone = int(seismic_zone) if seismic_zone is not None else self.region.zone(latitude, longitude)
+        with self._lock:
+            if key in self._seen:
+                return False
+            self._seen[key] = None
+            if len(self._seen) > MAX_SEEN_IDS:
+                self._seen.popitem(last=False)
+
+            zone_state = self.zones.setdefault(zone, _ZoneState())
+            late = bool(zone_state.recent) and time_ns < zone_state.recent[-1][0]
+            if late or time_ns < self.clock_ns:
+                self._insert_late(zone_state, time_ns, latitude, longitude, depth_km, magnitude)
+            else:
+                self._advance(time_ns)
+                previous = zone_state.recent[-1][0] if zone_state.recent else None
+                days_since = (time_ns - previous) / NS_PER_DAY if previous is not None else 0.0
+                zone_state.recent.append((time_ns, latitude, longitude, depth_km, magnitude, days_since))
+                zone_state.push_window(time_ns, magnitude)
+                bucket_key = self._bucket(latitude, longitude)
+                self.buckets.setdefault(bucket_key, deque()).append((time_ns, latitude, longitude))
+                self.spatial_fifo.append((time_ns, bucket_key))
+            self.total_ingested += 1
+            return True
+
+    def _insert_late(
+        self,
+        zone_state: _ZoneState,
+        time_ns: int,
+        latitude: float,
+        longitude: float,
+        depth_km: float,
+        magnitude: float,
+    ) -> None:
+        recent = list(zone_state.recent)
+        position = bisect.bisect_right([e[0] for e in recent], time_ns)
+        if position > 0 or len(recent) < RING_SIZE:
+            previous = recent[position - 1][0] if position > 0 else None
+            days_since = (time_ns - previous) / NS_PER_DAY if previous is not None else 0.0
+            recent.insert(position, (time_ns, latitude, longitude, depth_km, magnitude, days_since))
+            if position + 1 < len(recent):
+                follower = recent[position + 1]
+                recent[position + 1] = follower[:5] + ((follower[0] - time_ns) / NS_PER_DAY,)
+            zone_state.recent = deque(recent[-RING_SIZE:], maxlen=RING_SIZE)
+
+        if time_ns >= self.clock_ns - self.window_30d_ns:
+            entries = list(zone_state.window)
+            bisect.insort(entries, (time_ns, magnitude))
+            zone_state.rebuild_window(entries)
+        if time_ns >= self.clock_ns - self.window_7d_ns:
+            bucket_key = self._bucket(latitude, longitude)
+            bucket = self.buckets.setdefault(bucket_key, deque())
+            bucket.insert(bisect.bisect_right([e[0] for e in bucket], time_ns), (time_ns, latitude, longitude))
+            fifo_times = [e[0] for e in self.spatial_fifo]
+            self.spatial_fifo.insert(bisect.bisect_right(fifo_times, time_ns), (time_ns, bucket_key))
+
+    def ingest_frame(self, df: pd.DataFrame) -> int:
+        """Ingest a catalog frame (time, latitude, longitude, depth_km, magnitude)."""
+        return int(self.ingest_rows(df).sum())
+
+    def ingest_rows(self, df: pd.DataFrame) -> np.ndarray:
+        """Ingest a catalog frame in time order; per row of ``df``, whether it was new."""
+        added = np.zeros(len(df), dtype=bool)
+        if df.empty:
+            return added
+        times = pd.to_datetime(df["time"], utc=True)
+        order = np.argsort(times.to_numpy(), kind="stable")
+        stamps = times.tolist()
+        zones = (
+            df["seismic_zone"].to_numpy()
+            if "seismic_zone" in df
+            else self.region.zones(df["latitude"].to_numpy(), df["longitude"].to_numpy())
+        )
+        ids = df["id"].to_numpy() if "id" in df else np.full(len(df), None, dtype=object)
+        lats = df["latitude"].to_numpy(dtype=float)
+        lons = df["longitude"].to_numpy(dtype=float)
+        depths = df["depth_km"].to_numpy(dtype=float)
+        mags = df["magnitude"].to_numpy(dtype=float)
+        for i in order:
+            added[i] = self.ingest(stamps[i], lats[i], lons[i], depths[i], mags[i], int(zones[i]), ids[i])
+        return added
+
+    def _count_nearby(self, lat: float, lon: float, cutoff_ns: int, at_ns: int) -> int:
+        radius = self.config.radius_km
+        row, col = self._bucket(lat, lon)
+        widest = min(abs(lat) + self.bucket_deg, 89.0)
+        col_span = int(math.ceil(1.0 / max(math.cos(math.radians(widest)), 1e-6)))
+        count = 0
+        for r in range(row - 1, row + 2):
+            for c in range(col - col_span, col + col_span + 1):
+                bucket = self.buckets.get((r, c))
+                if not bucket:
+                    continue
+                for time_ns, event_lat, event_lon in bucket:
+                    if cutoff_ns <= time_ns <= at_ns and haversine_km(lat, lon, event_lat, event_lon) <= radius:
+                        count += 1
+        return count
+
+    def context(
+        self, lat: float, lon: float, at: Optional[pd.Timestamp] = None
+    ) -> Dict[str, float]:
+        """``build_features`` context for a hypothetical event at (lat, lon, at)."""
+        at_ts = pd.Timestamp.now(tz="UTC") if at is None else _to_timestamp(at)
+        at_ns = at_ts.value
+        zone = self.region.zone(lat, lon)
+        with self._lock:
+            self._advance(at_ns)
+            zone_state = self.zones.get(zone)
+            prev_magnitude = 0.0
+            days_since = 0.0
+            count_30d = 0
+            avg_30d = 0.0
+            max_30d = 0.0
+            if zone_state is not None and zone_state.recent:
+                last = zone_state.recent[-1]
+                prev_magnitude = last[4]
+                days_since = (at_ns - last[0]) / NS_PER_DAY
+                if zone_state.window:
+                    count_30d = len(zone_state.window)
+                    avg_30d = zone_state.window_sum / count_30d
+                    max_30d = zone_state.maxima[0][1]
+            count_7d = self._count_nearby(lat, lon, at_ns - self.window_7d_ns, at_ns)
+
+        return {
+            "prev_magnitude": float(prev_magnitude),
+            "quake_count_7d": float(count_7d),
+            "quake_count_30d": float(count_30d),
+            "avg_magnitude_30d": float(avg_30d),
+            "max_magnitude_30d": float(max_30d),
+            "days_since_last_quake": float(days_since),
+            "month": float(at_ts.month),
+            "seismic_zone": float(zone),
+        }
+
+    def sequence(self, zone: int, length: int = 10) -> Optional[np.ndarray]:
+        """Last ``length`` zone events in ``train_lstm.FEATURES`` order, or None."""
+        with self._lock:
+            zone_state = self.zones.get(int(zone))
+            if zone_state is None or len(zone_state.recent) < length:
+                return None
+            rows = list(zone_state.recent)[-length:]
+        return np.array(
+            [[lat, lon, depth, mag, days, float(zone)] for _, lat, lon, depth, mag, days in rows],
+            dtype=np.float32,
+        )
+
+
+def _to_timestamp(value) -> pd.Timestamp:
+    ts = pd.Timestamp(value)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+def _to_ns(value) -> int:
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return _to_timestamp(value).value
+
+
+# One state per region: ingestion and context queries never cross regions.
+EVENT_STATES: Dict[str, EventState] = {}
+
+
+def seed_frame(df: pd.DataFrame, config: FeatureConfig, region: Optional[Region] = None) -> pd.DataFrame:
+    """Rows of a catalog that can still influence serving context."""
+    if df.empty:
+        return df
+    df = df.copy()
+    df["time"] = pd.to_datetime(df["time"], utc=True, format="mixed")
+    if "seismic_zone" not in df:
+        df["seismic_zone"] = (region or active_region()).zones(df["latitude"].to_numpy(), df["longitude"].to_numpy())
+    df = df.sort_values("time")
+    newest = df["time"].max()
+    horizon = newest - pd.Timedelta(days=max(config.window_7d, config.window_30d))
+    in_window = df["time"] >= horizon
+    tail = df.groupby("seismic_zone").cumcount(ascending=False) < RING_SIZE
+    return df[in_window | tail]
+
+
+def get_event_state(region: Optional[Region] = None) -> EventState:
+    """The event state of ``region`` (default: the active region), seeded from its processed catalog on first use."""
+    region = region or active_region()
+    state = EVENT_STATES.get(region.name)
+    if state is not None:
+        return state
+    state = EventState(region=region)
+    for path in (
+        Path("data/processed/features.csv"),
+        Path("data/processed/usgs_india_clean.csv"),
+        Path("notebooks/data/processed/usgs_india_clean.csv"),
+    ):
+        path = region.path(path)
+        if path.exists():
+            catalog = read_catalog(path, cache_dir=region.path(CACHE_DIR), region=region)
+            df = catalog.to_frame(["time", "latitude", "longitude", "depth_km", "magnitude", "seismic_zone"])
+            state.ingest_frame(seed_frame(df, state.config, region))
+            break
+    return EVENT_STATES.setdefault(region.name, state)
@@ -1,12 +1,21 @@
 from __future__ import annotations
 
+import argparse
 from dataclasses import dataclass
 from math import asin, cos, radians, sin, sqrt
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
+from src.profiling import StageProfiler
+from src.regions import Region, active_region
+
+
+FEATURES_PATH = Path("data/processed/features.csv")
+DECLUSTERED_FEATURES_PATH = Path("data/processed/features_declustered.csv")
+
 
 @dataclass
 class FeatureConfig:
@@ -24,53 +33,35 @@ def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     return r * c
 
 
-def _in_box(lat: float, lon: float, box: Tuple[float, float, float, float]) -> bool:
-    min_lon, min_lat, max_lon, max_lat = box
-    return min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
-
-
-def assign_seismic_zone(lat: float, lon: float) -> int:
-    # Approximate zone polygons as bounding boxes for a lightweight, file-free setup.
-    zone_boxes = {
-        5: [
-            (89.0, 20.0, 97.0, 29.0),
-            (73.0, 32.0, 80.0, 37.0),
-            (68.0, 22.0, 74.0, 25.0),
-            (92.0, 6.0, 94.0, 14.0),
-        ],
-        4: [
-            (75.0, 28.0, 82.0, 32.0),
-            (84.0, 24.0, 89.0, 28.0),
-            (88.0, 24.0, 92.0, 27.0),
-            (73.0, 30.0, 76.0, 33.0),
-        ],
-        3: [
-            (72.0, 14.0, 78.0, 22.0),
-            (78.0, 18.0, 86.0, 24.0),
-            (74.0, 24.0, 82.0, 28.0),
-            (76.0, 8.0, 80.0, 14.0),
-            (80.0, 8.0, 88.0, 16.0),
-            (86.0, 20.0, 92.0, 24.0),
-        ],
-        2: [
-            (76.0, 8.0, 82.0, 16.0),
-            (68.0, 24.0, 76.0, 30.0),
-            (78.0, 14.0, 84.0, 20.0),
-        ],
-    }
-
-    for zone in [5, 4, 3, 2]:
-        if any(_in_box(lat, lon, box) for box in zone_boxes[zone]):
-            return zone
-    return 2
+def assign_seismic_zone(lat: float, lon: float, region: Optional[Region] = None) -> int:
+    """Seismic zone of (lat, lon) in ``region``'s zone raster (default: the active region)."""
+    return (region or active_region()).zone(lat, lon)
+
+
+def assign_seismic_zones(lats: np.ndarray, lons: np.ndarray, region: Optional[Region] = None) -> np.ndarray:
+    """Vectorized :func:`assign_seismic_zone` over coordinate arrays (int8)."""
+    return (region or active_region()).zones(lats, lons)
+
+
+def haversine_km_array(
+    lat: float, lon: float, lats: np.ndarray, lons: np.ndarray
+) -> np.ndarray:
+    """Vectorized :func:`haversine_km` from one point to arrays of points."""
+    r = 6371.0
+    lat1 = np.radians(lat)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(lons, dtype=np.float64) - lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * r * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
 
 
 def build_features(df: pd.DataFrame, config: FeatureConfig | None = None) -> pd.DataFrame:
     config = config or FeatureConfig()
     df = df.sort_values("time").reset_index(drop=True)
-    df["seismic_zone"] = df.apply(
-        lambda row: assign_seismic_zone(row["latitude"], row["longitude"]), axis=1
-    )
+    df["seismic_zone"] = assign_seismic_zones(
+        df["latitude"].to_numpy(), df["longitude"].to_numpy()
+    ).astype(int)
     df["month"] = df["time"].dt.month
 
     prev_magnitude: List[float] = []
@@ -131,17 +122,45 @@ def build_features(df: pd.DataFrame, config: FeatureConfig | None = None) -> pd.
     return df
 
 
-def main() -> None:
-    input_path = Path("data/processed/usgs_india_clean.csv")
-    if not input_path.exists():
+def load_tagged_catalog() -> pd.DataFrame:
+    """
+    Cleaned catalog with the declustering tags (``cluster_id``, ``mainshock``).
+    Reuses src.declustering's output unless the cleaned catalog is newer.
+    """
+    from src.declustering import CLEAN_PATH, DECLUSTERED_PATH, decluster_frame
+
+    if not CLEAN_PATH.exists():
         raise FileNotFoundError(
             "Missing cleaned data. Run: python -m src.data_pipeline"
         )
-    df = pd.read_csv(input_path, parse_dates=["time"])
-    features = build_features(df)
-    output_path = Path("data/processed/features.csv")
-    features.to_csv(output_path, index=False)
-    print(f"Saved features to {output_path}")
+    if DECLUSTERED_PATH.exists() and DECLUSTERED_PATH.stat().st_mtime >= CLEAN_PATH.stat().st_mtime:
+        df = pd.read_csv(DECLUSTERED_PATH)
+    else:
+        df = decluster_frame(pd.read_csv(CLEAN_PATH))
+    # USGS timestamps mix fractional-second formats; parse them all as UTC.
+    df["time"] = pd.to_datetime(df["time"], utc=True, format="mixed")
+    return df
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build model features from the cleaned catalog")
+    parser.add_argument("--profile", action="store_true", help="Write a sampling profile per stage")
+    args = parser.parse_args()
+    profiler = StageProfiler("feature_engineering", args.profile)
+
+    with profiler.stage("load"):
+        df = load_tagged_catalog()
+    with profiler.stage("build_features"):
+        features = build_features(df)
+    # Context features over mainshocks only, so aftershock sequences do not
+    # inflate the counts.
+    with profiler.stage("build_declustered_features"):
+        declustered = build_features(df[df["mainshock"]])
+    with profiler.stage("save"):
+        features.to_csv(FEATURES_PATH, index=False)
+        declustered.to_csv(DECLUSTERED_FEATURES_PATH, index=False)
+    print(f"Saved features to {FEATURES_PATH} ({len(features)} events)")
+    print(f"Saved declustered features to {DECLUSTERED_FEATURES_PATH} ({len(declustered)} mainshocks)")
 
 
 if __name__ == "__main__":
@@ -1,18 +1,98 @@
+import argparse
 import json
 from pathlib import Path
+from typing import Dict, Optional
 
 import numpy as np
-import pandas as pd
 from sklearn.model_selection import train_test_split
 from tensorflow.keras import Sequential
 from tensorflow.keras.layers import Dense
 from tensorflow.keras.models import load_model
 from xgboost import XGBRegressor
 
+from src import streaming
+from src.stacking import load_base_predictions
+from src.train_lstm import FEATURES as LSTM_FEATURES, SEQUENCE_LENGTH
 from src.train_xgboost import FEATURES
 
 
+def build_fusion() -> Sequential:
+    fusion = Sequential(
+        [
+            Dense(8, activation="relu", input_shape=(2,)),
+            Dense(1),
+        ]
+    )
+    fusion.compile(optimizer="adam", loss="mse", metrics=["mae"])
+    return fusion
+
+
+def train_streaming(xgb: XGBRegressor, lstm, chunk_rows: int, batch_size: int = 32) -> None:
+    """
+    Train the fusion head without holding the catalog in memory.
+
+    Base-model predictions are computed chunk by chunk and appended to on-disk
+    float32 arrays split by the time cutoff; the head then trains from
+    memory maps of those arrays.
+    """
+    cutoff = streaming.time_cutoff(chunk_rows=chunk_rows)
+    print(f"Time split: training on events before {cutoff}")
+    streaming.CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    paths = {part: streaming.CACHE_DIR / f"fusion_{part}.f32" for part in streaming.PARTS}
+    for path in paths.values():
+        path.unlink(missing_ok=True)
+
+    rate = streaming.RowRate("base-model predictions")
+    for samples, frame in streaming.iter_sequence_chunks(
+        LSTM_FEATURES, SEQUENCE_LENGTH, chunk_rows=chunk_rows, extra_columns=FEATURES
+    ):
+        rows = frame.iloc[samples.rows]
+        xgb_pred = xgb.predict(rows[FEATURES].fillna(0.0).values)
+        windows, targets = samples.materialize()
+        lstm_pred = lstm.predict(windows, batch_size=4096, verbose=0).reshape(-1)
+        stacked = np.column_stack([xgb_pred, lstm_pred, targets])
+        in_train = streaming.part_mask(rows["time"], cutoff, "train")
+        streaming.append_rows(paths["train"], stacked[in_train])
+        streaming.append_rows(paths["val"], stacked[~in_train])
+        rate.add(len(samples))
+    rate.report()
+    prediction_rate = rate.rate
+
+    train = streaming.open_rows(paths["train"], 3)
+    val = streaming.open_rows(paths["val"], 3)
+    fusion = build_fusion()
+    history = fusion.fit(
+        streaming.array_dataset(train[:, :2], train[:, 2], batch_size, shuffle=True),
+        validation_data=streaming.array_dataset(val[:, :2], val[:, 2], batch_size),
+        epochs=10,
+        shuffle=False,  # array_dataset shuffles every epoch itself
+    )
+    eval_loss, eval_mae = fusion.evaluate(
+        streaming.array_dataset(val[:, :2], val[:, 2], batch_size), verbose=0
+    )
+    _save(
+        fusion,
+        history,
+        eval_loss,
+        eval_mae,
+        {"split": "time", "cutoff": cutoff.isoformat(), "input_rows_per_s": prediction_rate},
+    )
+
+
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Train the XGBoost + LSTM fusion head")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read the feature store in chunks and train from on-disk predictions (time-based split)",
+    )
+    parser.add_argument("--chunk-rows", type=int, default=streaming.DEFAULT_CHUNK_ROWS)
+    parser.add_argument(
+        "--folds", type=int, default=5, help="Out-of-fold folds for the cached base predictions (0 = in-sample)"
+    )
+    parser.add_argument("--refresh", action="store_true", help="Recompute cached base predictions")
+    args = parser.parse_args()
+
     features_path = Path("data/processed/features.csv")
     if not features_path.exists():
         raise FileNotFoundError(
@@ -24,45 +104,29 @@ def main() -> None:
     if not xgb_path.exists() or not lstm_path.exists():
         raise FileNotFoundError("Missing base models. Train XGBoost and LSTM first.")
 
-    df = pd.read_csv(features_path, parse_dates=["time"])
-    xgb = XGBRegressor()
-    xgb.load_model(xgb_path)
-    lstm = load_model(lstm_path)
-
-    xgb_input = df[FEATURES].fillna(0.0).values
-    xgb_pred = xgb.predict(xgb_input)
-
-    lstm_features = df[
-        ["latitude", "longitude", "depth_km", "magnitude", "days_since_last_quake", "seismic_zone"]
-    ].values
-    seq_len = 10
-    lstm_sequences = []
-    lstm_targets = []
-    for idx in range(seq_len, len(lstm_features)):
-        lstm_sequences.append(lstm_features[idx - seq_len : idx])
-        lstm_targets.append(df.iloc[idx]["magnitude"])
+    if args.stream:
+        xgb = XGBRegressor()
+        xgb.load_model(xgb_path)
+        train_streaming(xgb, load_model(lstm_path), args.chunk_rows)
+        return
 
-    lstm_sequences = np.array(lstm_sequences)
-    lstm_pred = lstm.predict(lstm_sequences, verbose=0).reshape(-1)
-
-    aligned_xgb = xgb_pred[seq_len:]
-    X_fusion = np.vstack([aligned_xgb, lstm_pred]).T
-    y_fusion = np.array(lstm_targets)
+    # Base predictions are cached per feature store and base-model hash, so
+    # only the first run after a base model changes pays for them.
+    base = load_base_predictions(args.folds, features_path, xgb_path, lstm_path, refresh=args.refresh)
+    X_fusion = np.column_stack([base["xgb_pred"], base["lstm_pred"]])
+    y_fusion = base["target"]
 
     X_train, X_test, y_train, y_test = train_test_split(
         X_fusion, y_fusion, test_size=0.2, random_state=42
     )
 
-    fusion = Sequential(
-        [
-            Dense(8, activation="relu", input_shape=(2,)),
-            Dense(1),
-        ]
-    )
-    fusion.compile(optimizer="adam", loss="mse", metrics=["mae"])
+    fusion = build_fusion()
     history = fusion.fit(X_train, y_train, validation_split=0.2, epochs=10, batch_size=32)
     eval_loss, eval_mae = fusion.evaluate(X_test, y_test, verbose=0)
+    _save(fusion, history, eval_loss, eval_mae, {"base_predictions": "out-of-fold" if args.folds > 1 else "in-sample"})
+
 
+def _save(fusion, history, eval_loss: float, eval_mae: float, extra: Optional[Dict] = None) -> None:
     models_dir = Path("models")
     models_dir.mkdir(exist_ok=True)
     fusion.save(models_dir / "fusion_model.keras")
@@ -71,6 +135,7 @@ def main() -> None:
         "loss": float(eval_loss),
         "mae": float(eval_mae),
         "epochs": len(history.history.get("loss", [])),
+        **(extra or {}),
     }
     (models_dir / "fusion_metrics.json").write_text(json.dumps(metrics, indent=2))
 
@@ -0,0 +1,327 @@
+"""
+Incremental model updates from the feature-store changeset.
+
+The trainers record ``trained_through`` (the newest event they were fit on)
+in their metrics. Because the feature store is time-ordered and its features only
+look backwards, the rows after that watermark are exactly the new events;
+:func:`src.streaming.read_since` finds them by bisecting the file, so an
+update reads and trains on the delta rather than the whole catalog.
+
+* XGBoost gets ``--rounds`` extra trees by continued training on the delta.
+* The LSTM is fine-tuned (warm start, low learning rate) on the sequence
+  windows whose target is a new event; the preceding ``--context-days`` of
+  events supply the windows' history.
+
+Each update is scored on the newest ``--holdout`` share of the delta before
+and after, and is only kept if it does not make that score worse. When the
+delta drifts from the training data (PSI against the recorded feature
+profile, or the current model's error on it) or is large relative to the
+training set, a full retrain runs through :mod:`src.pipeline` instead.
+
+    python -m src.incremental
+    python -m src.incremental --dry-run     # changeset and drift report only
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+import xgboost
+from xgboost import XGBRegressor
+
+from src import model_registry, streaming
+from src.drift import PSI_THRESHOLD, population_stability
+from src.train_xgboost import FEATURES, PARAMS
+
+MODELS_DIR = Path("models")
+XGB_PATH = MODELS_DIR / "xgb_model.json"
+LSTM_PATH = MODELS_DIR / "lstm_model.keras"
+UPDATE_LOG = MODELS_DIR / "update_log.jsonl"
+
+
+@dataclass
+class Changeset:
+    """Feature-store rows newer than ``since`` plus ``context`` rows for LSTM windows."""
+
+    since: pd.Timestamp
+    rows: pd.DataFrame
+    context: pd.DataFrame
+    read_s: float
+
+
+def _read_metrics(name: str) -> Dict:
+    path = MODELS_DIR / f"{name}_metrics.json"
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def _write_metrics(name: str, metrics: Dict) -> None:
+    (MODELS_DIR / f"{name}_metrics.json").write_text(json.dumps(metrics, indent=2))
+
+
+def _watermark(metrics: Dict) -> Optional[pd.Timestamp]:
+    value = metrics.get("trained_through")
+    return pd.Timestamp(value).tz_convert("UTC") if value else None
+
+
+def load_changeset(
+    since: pd.Timestamp, context_days: float = 365.0, path: Path = streaming.FEATURES_PATH
+) -> Changeset:
+    start = time.perf_counter()
+    context = streaming.read_since(since - pd.Timedelta(days=context_days), path)
+    rows = context[context["time"] > since].reset_index(drop=True)
+    return Changeset(since, rows, context, time.perf_counter() - start)
+
+
+def _xgb_params(metrics: Dict) -> Dict:
+    params = {**metrics.get("params", PARAMS)}
+    params["seed"] = params.pop("random_state", params.get("seed", 42))
+    if "n_jobs" in params:
+        params["nthread"] = params.pop("n_jobs")
+    return params
+
+
+def _mae(pred: np.ndarray, target: np.ndarray) -> float:
+    return float(np.abs(np.asarray(pred).reshape(-1) - target).mean())
+
+
+def check_drift(
+    rows: pd.DataFrame,
+    metrics: Dict,
+    psi_threshold: float = PSI_THRESHOLD,
+    error_ratio: float = 1.5,
+    max_delta_fraction: float = 0.5,
+) -> Dict:
+    """
+    Whether ``rows`` are too different from, or too large relative to, the
+    training data for an incremental update to be trusted.
+    """
+    reasons = []
+    profile = metrics.get("feature_profile") or {}
+    psi = population_stability(profile, rows)
+    if not psi:
+        # Without a reference the delta cannot be shown to match the training data.
+        reasons.append("no reference feature profile in the model metrics")
+    # PSI of a small sample is inflated by noise of roughly bins / n; discount it.
+    noise = {c: len(profile[c]["edges"]) / len(rows) for c in psi}
+    shifted = {c: round(s, 3) for c, s in psi.items() if s - noise[c] > psi_threshold}
+    if shifted:
+        reasons.append(f"feature drift (PSI) in {shifted}")
+
+    booster = xgboost.Booster()
+    booster.load_model(XGB_PATH)
+    delta_mae = _mae(
+        booster.inplace_predict(rows[FEATURES].fillna(0.0).to_numpy(dtype=np.float32)),
+        rows["magnitude"].to_numpy(dtype=np.float32),
+    )
+    reference_mae = metrics.get("mae")
+    if reference_mae and delta_mae > reference_mae * error_ratio:
+        reasons.append(f"error on new events {delta_mae:.3f} vs {reference_mae:.3f} at training")
+
+    train_rows = metrics.get("train_rows")
+    if train_rows and len(rows) > train_rows * max_delta_fraction:
+        reasons.append(f"{len(rows)} new rows is more than {max_delta_fraction:.0%} of the training set")
+    return {
+        "psi": {c: round(s, 4) for c, s in psi.items()},
+        "delta_mae": delta_mae,
+        "reference_mae": reference_mae,
+        "drifted": bool(reasons),
+        "reasons": reasons,
+    }
+
+
+def update_xgboost(rows: pd.DataFrame, metrics: Dict, rounds: int, holdout: float = 0.2) -> Dict:
+    """Add ``rounds`` trees fit to ``rows``; kept only if the held-out newest rows do not get worse."""
+    start = time.perf_counter()
+    X = rows[FEATURES].fillna(0.0).to_numpy(dtype=np.float32)
+    y = rows["magnitude"].to_numpy(dtype=np.float32)
+    split = int(len(rows) * (1.0 - holdout))
+    booster = xgboost.Booster()
+    booster.load_model(XGB_PATH)
+    params = _xgb_params(metrics)
+
+    def grow(n_rows: int) -> xgboost.Booster:
+        data = xgboost.DMatrix(X[:n_rows], y[:n_rows], feature_names=booster.feature_names)
+        return xgboost.train(params, data, num_boost_round=rounds, xgb_model=booster)
+
+    before = _mae(booster.inplace_predict(X[split:]), y[split:])
+    after = _mae(grow(split).inplace_predict(X[split:]), y[split:])
+    result = {"rows": len(rows), "holdout_mae_before": before, "holdout_mae_after": after}
+    result["accepted"] = after <= before
+    if result["accepted"]:
+        updated = grow(len(rows))
+        updated.save_model(XGB_PATH)
+        model = XGBRegressor()
+        model.load_model(XGB_PATH)
+        joblib.dump(model, MODELS_DIR / "xgb_model.joblib")
+        result["trees"] = updated.num_boosted_rounds()
+        metrics["trained_through"] = rows["time"].max().isoformat()
+        metrics.setdefault("updates", []).append(
+            {k: result[k] for k in ("rows", "holdout_mae_before", "holdout_mae_after", "trees")}
+        )
+        _write_metrics("xgb", metrics)
+    result["duration_s"] = time.perf_counter() - start
+    return result
+
+
+def update_lstm(
+    changeset: Changeset,
+    metrics: Dict,
+    epochs: int,
+    learning_rate: float,
+    holdout: float = 0.2,
+) -> Dict:
+    """Fine-tune the saved LSTM on windows ending in new events; kept only if the holdout improves."""
+    from tensorflow.keras.models import load_model
+
+    from src.train_lstm import sequence_set
+
+    start = time.perf_counter()
+    since = _watermark(metrics) or changeset.since
+    samples = sequence_set(changeset.context)
+    target_times = changeset.context["time"].iloc[samples.rows]
+    # samples.rows index a time-ordered frame, so sorting them orders windows by time.
+    new = np.flatnonzero((target_times > since).to_numpy())
+    new = new[np.argsort(samples.rows[new], kind="stable")]
+    result = {"windows": int(len(new))}
+    split = int(len(new) * (1.0 - holdout))
+    if split == 0 or split == len(new):
+        result.update(accepted=False, reason="too few new windows")
+        return result
+    batch_size = int(metrics.get("batch_size", 32))
+    evaluate_set = samples.subset(new[split:]).dataset(4096)
+
+    def fine_tune(indices: np.ndarray):
+        model = load_model(LSTM_PATH)
+        model.optimizer.learning_rate.assign(learning_rate)
+        model.fit(
+            samples.subset(indices).dataset(batch_size, shuffle=True, seed=42),
+            epochs=epochs,
+            shuffle=False,
+            verbose=0,
+        )
+        return model
+
+    before = float(load_model(LSTM_PATH).evaluate(evaluate_set, verbose=0)[1])
+    after = float(fine_tune(new[:split]).evaluate(evaluate_set, verbose=0)[1])
+    result.update(holdout_mae_before=before, holdout_mae_after=after, accepted=after <= before)
+    if result["accepted"]:
+        fine_tune(new).save(LSTM_PATH)
+        metrics["trained_through"] = target_times.max().isoformat()
+        metrics.setdefault("updates", []).append(
+            {k: result[k] for k in ("windows", "holdout_mae_before", "holdout_mae_after")}
+        )
+        _write_metrics("lstm", metrics)
+    result["duration_s"] = time.perf_counter() - start
+    return result
+
+
+def full_retrain(jobs: int = 2) -> bool:
+    """Retrain XGBoost, LSTM and fusion from scratch through the pipeline runner."""
+    from src.pipeline import default_stages, print_summary, run_pipeline
+
+    epochs = int(_read_metrics("lstm").get("epochs", 10))
+    stages = [s for s in default_stages(epochs=epochs) if s.name in ("xgboost", "lstm", "fusion")]
+    start = time.perf_counter()
+    results = run_pipeline(stages, jobs, force=[s.name for s in stages])
+    print_summary(results, time.perf_counter() - start)
+    return all(r.status == "ran" for r in results)
+
+
+def _log(entry: Dict) -> None:
+    UPDATE_LOG.parent.mkdir(parents=True, exist_ok=True)
+    with UPDATE_LOG.open("a") as handle:
+        handle.write(json.dumps({"at": datetime.now(timezone.utc).isoformat(), **entry}, default=str) + "\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Update the models with new feature-store events")
+    parser.add_argument("--rounds", type=int, default=20, help="Trees added to XGBoost")
+    parser.add_argument("--epochs", type=int, default=2, help="LSTM fine-tuning epochs")
+    parser.add_argument("--learning-rate", type=float, default=1e-4, help="LSTM fine-tuning learning rate")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Newest share of the delta used to accept updates")
+    parser.add_argument("--min-rows", type=int, default=50, help="Fewer new events than this are left for later")
+    parser.add_argument("--context-days", type=float, default=365.0)
+    parser.add_argument("--psi-threshold", type=float, default=PSI_THRESHOLD)
+    parser.add_argument("--error-ratio", type=float, default=1.5)
+    parser.add_argument("--max-delta-fraction", type=float, default=0.5)
+    parser.add_argument("--dry-run", action="store_true", help="Report the changeset and drift only")
+    parser.add_argument("--no-fallback", action="store_true", help="Never fall back to a full retrain")
+    parser.add_argument("--register", action="store_true", help="Register the updated models as a new version")
+    args = parser.parse_args()
+
+    xgb_metrics, lstm_metrics = _read_metrics("xgb"), _read_metrics("lstm")
+    watermarks = [w for w in (_watermark(xgb_metrics), _watermark(lstm_metrics)) if w is not None]
+    if not XGB_PATH.exists() or len(watermarks) < 2:
+        print("No trained_through watermark in the model metrics; a full retrain is needed.")
+        if args.dry_run or args.no_fallback:
+            return
+        _log({"action": "full_retrain", "reason": "no watermark", "ok": full_retrain()})
+        return
+
+    changeset = load_changeset(min(watermarks), args.context_days)
+    rows = changeset.rows
+    xgb_rows = rows[rows["time"] > _watermark(xgb_metrics)]
+    print(
+        f"Changeset since {changeset.since}: {len(rows)} new events "
+        f"({len(changeset.context)} rows read in {changeset.read_s * 1000:.0f} ms)"
+    )
+    if len(rows) < args.min_rows:
+        print(f"Fewer than {args.min_rows} new events; nothing to do.")
+        return
+
+    drift = check_drift(
+        xgb_rows if len(xgb_rows) else rows,
+        xgb_metrics,
+        args.psi_threshold,
+        args.error_ratio,
+        args.max_delta_fraction,
+    )
+    print(f"Drift check: MAE on new events {drift['delta_mae']:.3f} (training {drift['reference_mae']})")
+    for reason in drift["reasons"]:
+        print(f"   {reason}")
+    if args.dry_run:
+        return
+    if drift["drifted"] and not args.no_fallback:
+        print("Falling back to a full retrain")
+        ok = full_retrain()
+        _log({"action": "full_retrain", "reason": drift["reasons"], "rows": len(rows), "ok": ok})
+        if ok and args.register:
+            print(f"Registered {model_registry.register(note='full retrain after drift')['version']}")
+        return
+
+    entry: Dict = {"action": "incremental", "rows": len(rows), "drift": drift}
+    if len(xgb_rows) >= args.min_rows:
+        entry["xgboost"] = update_xgboost(xgb_rows, xgb_metrics, args.rounds, args.holdout)
+        report = entry["xgboost"]
+        print(
+            f"XGBoost: {report['rows']} rows, holdout MAE {report['holdout_mae_before']:.3f} -> "
+            f"{report['holdout_mae_after']:.3f}, {'kept' if report['accepted'] else 'rejected'} "
+            f"({report['duration_s']:.1f}s)"
+        )
+    if LSTM_PATH.exists():
+        entry["lstm"] = update_lstm(changeset, lstm_metrics, args.epochs, args.learning_rate, args.holdout)
+        report = entry["lstm"]
+        if "holdout_mae_before" in report:
+            print(
+                f"LSTM: {report['windows']} windows, holdout MAE {report['holdout_mae_before']:.3f} -> "
+                f"{report['holdout_mae_after']:.3f}, {'kept' if report['accepted'] else 'rejected'} "
+                f"({report['duration_s']:.1f}s)"
+            )
+        else:
+            print(f"LSTM: skipped ({report['reason']})")
+    _log(entry)
+    updated = any(entry.get(name, {}).get("accepted") for name in ("xgboost", "lstm"))
+    if updated and args.register:
+        print(f"Registered {model_registry.register(note=f'incremental update, {len(rows)} events')['version']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.profiling import REQUEST_PROFILER
+
+# Log-linear (HDR-style) bucketing: values below 2 ** (SUB_BUCKET_BITS + 1) get
+# an exact bucket, larger values get 2 ** SUB_BUCKET_BITS buckets per power of
+# two, which bounds the relative error of any recorded value to ~6%.
+SUB_BUCKET_BITS = 4
+_SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+_LINEAR_LIMIT = _SUB_BUCKETS << 1
+
+# Bucket edges (seconds) used for the Prometheus histogram exposition.
+PROMETHEUS_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+QUANTILES = (0.5, 0.95, 0.99)
+
+ENABLED = os.getenv("EQ_METRICS", "1").lower() not in {"0", "false", "off"}
+
+
+def _bucket_index(value_us: int) -> int:
+    if value_us < _LINEAR_LIMIT:
+        return value_us
+    shift = value_us.bit_length() - SUB_BUCKET_BITS - 1
+    return shift * _SUB_BUCKETS + (value_us >> shift)
+
+
+def _bucket_bounds(index: int) -> Tuple[int, int]:
+    if index < _LINEAR_LIMIT:
+        return index, index + 1
+    shift = index // _SUB_BUCKETS - 1
+    mantissa = index - shift * _SUB_BUCKETS
+    return mantissa << shift, (mantissa + 1) << shift
+
+
+class LatencyHistogram:
+    """Sparse log-linear histogram of durations recorded in microseconds."""
+
+    __slots__ = ("counts", "count", "total_us", "max_us", "_lock")
+
+    def __init__(self) -> None:
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+        self._lock = threading.Lock()
+
+    def record(self, value_us: int) -> None:
+        if value_us < 0:
+            value_us = 0
+        index = _bucket_index(value_us)
+        with self._lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.total_us += value_us
+            if value_us > self.max_us:
+                self.max_us = value_us
+
+    def _sorted_buckets(self) -> List[Tuple[int, int]]:
+        with self._lock:
+            return sorted(self.counts.items())
+
+    def quantile(self, q: float) -> float:
+        """Return the q-quantile in seconds (upper edge of the matching bucket)."""
+        buckets = self._sorted_buckets()
+        total = sum(count for _, count in buckets)
+        if total == 0:
+            return 0.0
+        rank = max(1, int(round(q * total)))
+        seen = 0
+        for index, count in buckets:
+            seen += count
+            if seen >= rank:
+                upper = min(_bucket_bounds(index)[1], self.max_us)
+                return upper / 1e6
+        return self.max_us / 1e6
+
+    def cumulative(self, edges_s: Iterable[float]) -> List[Tuple[float, int]]:
+        """Cumulative counts of buckets whose upper bound is within each edge."""
+        buckets = self._sorted_buckets()
+        result = []
+        position = 0
+        running = 0
+        for edge in edges_s:
+            edge_us = edge * 1e6
+            while position < len(buckets) and _bucket_bounds(buckets[position][0])[1] <= edge_us:
+                running += buckets[position][1]
+                position += 1
+            result.append((edge, running))
+        return result
+
+
+HISTOGRAMS: Dict[str, LatencyHistogram] = {}
+MODEL_LOAD_SECONDS: Dict[str, float] = {}
+CACHE_STATS: Dict[str, List[int]] = {}
+GAUGES: Dict[str, Callable[[], float]] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def histogram(stage: str) -> LatencyHistogram:
+    hist = HISTOGRAMS.get(stage)
+    if hist is None:
+        with _REGISTRY_LOCK:
+            hist = HISTOGRAMS.setdefault(stage, LatencyHistogram())
+    return hist
+
+
+def observe(stage: str, seconds: float) -> None:
+    if ENABLED:
+        histogram(stage).record(int(seconds * 1e6))
+
+
+class _Span:
+    __slots__ = ("hist", "start", "sampled")
+
+    def __init__(self, hist: Optional[LatencyHistogram]) -> None:
+        self.hist = hist
+        self.start = 0
+        self.sampled: Optional[int] = None
+
+    def __enter__(self) -> "_Span":
+        self.sampled = REQUEST_PROFILER.enter()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.hist is not None:
+            self.hist.record((time.perf_counter_ns() - self.start) // 1000)
+        REQUEST_PROFILER.exit(self.sampled)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+def span(stage: str):
+    """
+    Context manager timing the enclosed block into the ``stage`` histogram.
+    Spans of a sampled request also mark their thread for the request profiler,
+    so they must not wrap an ``await``.
+    """
+    if not ENABLED:
+        return _Span(None) if REQUEST_PROFILER.active else _NOOP
+    return _Span(histogram(stage))
+
+
+def timed(stage: str) -> Callable:
+    """Decorator form of :func:`span`."""
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_model_load(name: str, seconds: float) -> None:
+    MODEL_LOAD_SECONDS[name] = seconds
+
+
+def record_cache(name: str, hit: bool) -> None:
+    if not ENABLED:
+        return
+    stats = CACHE_STATS.get(name)
+    if stats is None:
+        stats = CACHE_STATS.setdefault(name, [0, 0])
+    stats[0 if hit else 1] += 1
+
+
+def register_gauge(name: str, getter: Callable[[], float]) -> None:
+    """Register a callable sampled at scrape time (e.g. a queue depth)."""
+    GAUGES[name] = getter
+
+
+def reset() -> None:
+    HISTOGRAMS.clear()
+    MODEL_LOAD_SECONDS.clear()
+    CACHE_STATS.clear()
+
+
+def snapshot() -> Dict[str, Dict]:
+    """Plain-dict view of the recorded stages, useful for logs and reports."""
+    stages = {}
+    for stage, hist in sorted(HISTOGRAMS.items()):
+        stages[stage] = {
+            "count": hist.count,
+            "mean_s": (hist.total_us / hist.count / 1e6) if hist.count else 0.0,
+            "max_s": hist.max_us / 1e6,
+            **{f"p{int(q * 100)}_s": hist.quantile(q) for q in QUANTILES},
+        }
+    return {
+        "stages": stages,
+        "model_load_seconds": dict(MODEL_LOAD_SECONDS),
+        "cache": {
+            name: {"hits": hits, "misses": misses}
+            for name, (hits, misses) in CACHE_STATS.items()
+        },
+    }
+
+
+def _fmt(value: float) -> str:
+    return repr(float(value))
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus(prefix: str = "eq") -> str:
+    """Render all collected metrics in the Prometheus text exposition format."""
+    lines: List[str] = []
+
+    name = f"{prefix}_stage_latency_seconds"
+    lines.append(f"# HELP {name} Latency of instrumented stages.")
+    lines.append(f"# TYPE {name} histogram")
+    for stage, hist in sorted(HISTOGRAMS.items()):
+        label = _label(stage)
+        for edge, count in hist.cumulative(PROMETHEUS_BUCKETS):
+            lines.append(f'{name}_bucket{{stage="{label}",le="{edge}"}} {count}')
+        lines.append(f'{name}_bucket{{stage="{label}",le="+Inf"}} {hist.count}')
+        lines.append(f'{name}_sum{{stage="{label}"}} {_fmt(hist.total_us / 1e6)}')
+        lines.append(f'{name}_count{{stage="{label}"}} {hist.count}')
+
+    name = f"{prefix}_stage_latency_quantile_seconds"
+    lines.append(f"# HELP {name} HDR histogram quantiles of instrumented stages.")
+    lines.append(f"# TYPE {name} gauge")
+    for stage, hist in sorted(HISTOGRAMS.items()):
+        for q in QUANTILES:
+            lines.append(
+                f'{name}{{stage="{_label(stage)}",quantile="{q}"}} {_fmt(hist.quantile(q))}'
+            )
+
+    name = f"{prefix}_model_load_seconds"
+    lines.append(f"# HELP {name} Wall time spent loading each model artifact.")
+    lines.append(f"# TYPE {name} gauge")
+    for model, seconds in sorted(MODEL_LOAD_SECONDS.items()):
+        lines.append(f'{name}{{model="{_label(model)}"}} {_fmt(seconds)}')
+
+    hits_name = f"{prefix}_cache_hits_total"
+    misses_name = f"{prefix}_cache_misses_total"
+    ratio_name = f"{prefix}_cache_hit_ratio"
+    lines.append(f"# HELP {hits_name} Cache lookups served from memory.")
+    lines.append(f"# TYPE {hits_name} counter")
+    for cache, (hits, _) in sorted(CACHE_STATS.items()):
+        lines.append(f'{hits_name}{{cache="{_label(cache)}"}} {hits}')
+    lines.append(f"# HELP {misses_name} Cache lookups that had to load.")
+    lines.append(f"# TYPE {misses_name} counter")
+    for cache, (_, misses) in sorted(CACHE_STATS.items()):
+        lines.append(f'{misses_name}{{cache="{_label(cache)}"}} {misses}')
+    lines.append(f"# HELP {ratio_name} Fraction of cache lookups that were hits.")
+    lines.append(f"# TYPE {ratio_name} gauge")
+    for cache, (hits, misses) in sorted(CACHE_STATS.items()):
+        total = hits + misses
+        lines.append(f'{ratio_name}{{cache="{_label(cache)}"}} {_fmt(hits / total if total else 0.0)}')
+
+    for gauge, getter in sorted(GAUGES.items()):
+        name = f"{prefix}_{gauge}"
+        try:
+            value = float(getter())
+        except Exception:
+            continue
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {_fmt(value)}")
+
+    name = f"{prefix}_metrics_enabled"
+    lines.append(f"# TYPE {name} gauge")
+    lines.append(f"{name} {1 if ENABLED else 0}")
+    return "\n".join(lines) + "\n"
+
@@ -0,0 +1,256 @@
+"""
+Versioned model registry.
+
+Each registered version is an immutable directory under
+``models/registry/versions/<version>/`` holding the model artifacts, their
+metrics files and a ``metadata.json`` (creation time, file hashes, metrics,
+note). ``models/registry/CURRENT`` names the version the API should serve and
+is replaced atomically, and every promotion is appended to
+``history.jsonl`` so a rollback can walk back through what was served before.
+
+    python -m src.model_registry register --note "retrained on 2026 catalog"
+    python -m src.model_registry list
+    python -m src.model_registry promote 20261019T063000Z-1a2b3c
+    python -m src.model_registry rollback
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+MODELS_DIR = Path("models")
+REGISTRY_DIR = MODELS_DIR / "registry"
+ARTIFACTS = ("xgb_model.json", "lstm_model.keras", "fusion_model.keras", "student_model.json")
+METRICS = ("xgb_metrics.json", "lstm_metrics.json", "fusion_metrics.json", "student_report.json")
+UNVERSIONED = "unversioned"
+
+
+def _versions_dir(registry: Path) -> Path:
+    return registry / "versions"
+
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    """Write via a temp file and ``os.replace`` so readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    with os.fdopen(fd, "w") as handle:
+        handle.write(text)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp, path)
+
+
+def version_dir(version: str, registry: Path = REGISTRY_DIR) -> Path:
+    return _versions_dir(registry) / version
+
+
+def current_version(registry: Path = REGISTRY_DIR) -> Optional[str]:
+    pointer = registry / "CURRENT"
+    if not pointer.exists():
+        return None
+    version = pointer.read_text().strip()
+    return version or None
+
+
+def read_metadata(version: str, registry: Path = REGISTRY_DIR) -> Dict:
+    path = version_dir(version, registry) / "metadata.json"
+    if not path.exists():
+        raise KeyError(f"Unknown model version: {version}")
+    return json.loads(path.read_text())
+
+
+def list_versions(registry: Path = REGISTRY_DIR) -> List[Dict]:
+    """Metadata of every registered version, newest first."""
+    root = _versions_dir(registry)
+    if not root.exists():
+        return []
+    current = current_version(registry)
+    versions = []
+    for path in root.iterdir():
+        meta_path = path / "metadata.json"
+        if meta_path.exists():
+            meta = json.loads(meta_path.read_text())
+            meta["current"] = meta["version"] == current
+            versions.append(meta)
+    return sorted(versions, key=lambda m: m["created_at"], reverse=True)
+
+
+def artifact_paths(version: Optional[str] = None, registry: Path = REGISTRY_DIR) -> Dict[str, Path]:
+    """
+    Artifact paths of ``version`` (default: current). Without a registry the
+    legacy fixed paths in the models directory holding ``registry`` are returned.
+    """
+    version = version or current_version(registry)
+    base = registry.parent if version is None else version_dir(version, registry)
+    return {name: base / name for name in ARTIFACTS}
+
+
+def register(
+    source_dir: Path = MODELS_DIR,
+    note: str = "",
+    promote: bool = True,
+    registry: Path = REGISTRY_DIR,
+) -> Dict:
+    """Snapshot the artifacts in ``source_dir`` as a new immutable version."""
+    present = [name for name in ARTIFACTS if (source_dir / name).exists()]
+    if not present:
+        raise FileNotFoundError(f"No model artifacts in {source_dir}")
+    hashes = {name: _file_hash(source_dir / name) for name in present}
+    fingerprint = hashlib.sha256(json.dumps(hashes, sort_keys=True).encode()).hexdigest()[:6]
+    created = datetime.now(timezone.utc)
+    version = f"{created.strftime('%Y%m%dT%H%M%SZ')}-{fingerprint}"
+
+    # Build in a temp dir and rename, so a version directory is either complete or absent.
+    root = _versions_dir(registry)
+    root.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(dir=root, prefix=".staging-"))
+    metrics = {}
+    for name in present:
+        shutil.copy2(source_dir / name, staging / name)
+    for name in METRICS:
+        if (source_dir / name).exists():
+            shutil.copy2(source_dir / name, staging / name)
+            metrics[name.rsplit("_", 1)[0]] = json.loads((source_dir / name).read_text())
+    metadata = {
+        "version": version,
+        "created_at": created.isoformat(),
+        "artifacts": hashes,
+        "metrics": metrics,
+        "note": note,
+    }
+    (staging / "metadata.json").write_text(json.dumps(metadata, indent=2))
+    os.replace(staging, root / version)
+
+    if promote:
+        set_current(version, registry, reason="register")
+    return metadata
+
+
+def set_current(version: str, registry: Path = REGISTRY_DIR, reason: str = "promote") -> None:
+    """Atomically point ``CURRENT`` at ``version`` and log the change."""
+    read_metadata(version, registry)
+    previous = current_version(registry)
+    _write_atomic(registry / "CURRENT", version + "\n")
+    entry = {
+        "version": version,
+        "previous": previous,
+        "reason": reason,
+        "at": datetime.now(timezone.utc).isoformat(),
+    }
+    with (registry / "history.jsonl").open("a") as handle:
+        handle.write(json.dumps(entry) + "\n")
+
+
+def _served_stack(entries: List[Dict], current: Optional[str]) -> List[str]:
+    """
+    Versions served so far, oldest first, with rolled-back versions popped.
+
+    Promotions push a version; a rollback to a version already on the stack
+    truncates back to it, so repeated rollbacks keep walking back instead of
+    flipping between the last two versions.
+    """
+    stack: List[str] = [entries[0]["previous"]] if entries and entries[0].get("previous") else []
+    for entry in entries:
+        version = entry["version"]
+        if entry.get("reason") == "rollback" and version in stack:
+            del stack[len(stack) - stack[::-1].index(version):]
+        elif not stack or stack[-1] != version:
+            stack.append(version)
+    if current and (not stack or stack[-1] != current):
+        stack.append(current)
+    return stack
+
+
+def rollback_target(to: Optional[str] = None, registry: Path = REGISTRY_DIR) -> str:
+    """The version :func:`rollback` would serve: ``to`` or the one served before the current one."""
+    if to is not None:
+        read_metadata(to, registry)
+        return to
+    history_path = registry / "history.jsonl"
+    entries = (
+        [json.loads(line) for line in history_path.read_text().splitlines() if line.strip()]
+        if history_path.exists()
+        else []
+    )
+    current = current_version(registry)
+    # Pruned versions cannot be served again; skip past them.
+    target = next(
+        (
+            v for v in reversed(_served_stack(entries, current)[:-1])
+            if v != current and (version_dir(v, registry) / "metadata.json").exists()
+        ),
+        None,
+    )
+    if target is None:
+        raise ValueError("No previous version to roll back to")
+    return target
+
+
+def rollback(to: Optional[str] = None, registry: Path = REGISTRY_DIR) -> str:
+    """Point ``CURRENT`` back at ``to`` or, by default, the version served before the current one."""
+    to = rollback_target(to, registry)
+    set_current(to, registry, reason="rollback")
+    return to
+
+
+def prune(keep: int = 5, registry: Path = REGISTRY_DIR) -> List[str]:
+    """Delete all but the ``keep`` newest versions, never the current one."""
+    current = current_version(registry)
+    removed = []
+    for meta in list_versions(registry)[keep:]:
+        if meta["version"] != current:
+            shutil.rmtree(version_dir(meta["version"], registry))
+            removed.append(meta["version"])
+    return removed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage versioned model artifacts")
+    commands = parser.add_subparsers(dest="command", required=True)
+    register_cmd = commands.add_parser("register", help="Snapshot models/ as a new version")
+    register_cmd.add_argument("--source", type=Path, default=MODELS_DIR)
+    register_cmd.add_argument("--note", default="")
+    register_cmd.add_argument("--no-promote", action="store_true")
+    commands.add_parser("list", help="List registered versions")
+    promote_cmd = commands.add_parser("promote", help="Serve a registered version")
+    promote_cmd.add_argument("version")
+    rollback_cmd = commands.add_parser("rollback", help="Serve the previous version again")
+    rollback_cmd.add_argument("version", nargs="?", default=None)
+    prune_cmd = commands.add_parser("prune", help="Delete old versions")
+    prune_cmd.add_argument("--keep", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "register":
+        meta = register(args.source, args.note, promote=not args.no_promote)
+        print(f"Registered {meta['version']} ({', '.join(meta['artifacts'])})")
+    elif args.command == "list":
+        for meta in list_versions():
+            marker = "*" if meta["current"] else " "
+            print(f"{marker} {meta['version']}  {meta['created_at']}  {', '.join(meta['artifacts'])}  {meta['note']}")
+    elif args.command == "promote":
+        set_current(args.version)
+        print(f"Current version: {args.version}")
+    elif args.command == "rollback":
+        print(f"Rolled back to {rollback(args.version)}")
+    elif args.command == "prune":
+        removed = prune(args.keep)
+        print(f"Removed {len(removed)} versions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""
+Content-hashed DAG runner for the training pipeline.
+
+Stages (``data`` -> ``decluster`` -> ``features`` -> ``xgboost`` / ``lstm`` -> ``fusion``) are
+plain data: a module run as ``python -m``, its arguments, and the files it
+reads and writes. Dependencies follow from which stage writes a file another
+one reads. Before a stage runs it is fingerprinted from its arguments, the
+contents of its input files and the source of its module plus every ``src``
+module that module imports. Outputs are stored by content hash under
+``data/cache/pipeline/objects`` with one manifest per fingerprint, so a
+stage whose fingerprint is already known is skipped, or has its outputs
+copied back from the store if the working copies differ (e.g. after
+switching a config back). Stages whose dependencies are done run in
+parallel subprocesses, so XGBoost and LSTM train side by side. With
+``--region`` the whole pipeline runs inside that region's root directory
+(see ``src/regions.py``), giving it its own catalog, features, models and store.
+
+    python -m src.pipeline                      # everything, fetching fresh data daily
+    python -m src.pipeline --from features      # use the existing cleaned catalog
+    python -m src.pipeline --force lstm --jobs 2
+    python -m src.pipeline --region himalaya
+"""
+from __future__ import annotations
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from src.regions import HOME, REGIONS, REGIONS_PATH, Region, active_region
+
+SRC_DIR = Path(__file__).resolve().parent
+STORE_DIR = Path("data/cache/pipeline")
+CLEAN_PATH = Path("data/processed/usgs_india_clean.csv")
+DECLUSTERED_PATH = Path("data/processed/usgs_india_declustered.csv")
+FEATURES_PATH = Path("data/processed/features.csv")
+DECLUSTERED_FEATURES_PATH = Path("data/processed/features_declustered.csv")
+MODEL_STAGES = ("xgboost", "lstm", "fusion")
+
+
+@dataclass
+class Stage:
+    """One pipeline step: ``python -m module *args`` reading ``inputs``, writing ``outputs``."""
+
+    name: str
+    module: str
+    args: List[str] = field(default_factory=list)
+    inputs: List[Path] = field(default_factory=list)
+    outputs: List[Path] = field(default_factory=list)
+    # Extra fingerprint material for stages that read outside sources (the USGS API).
+    salt: str = ""
+
+
+def default_stages(
+    years: int = 20,
+    epochs: int = 10,
+    stream: bool = False,
+    xgb_params: Optional[Path] = None,
+    folds: int = 5,
+    region: Optional[Region] = None,
+) -> List[Stage]:
+    region = region or active_region()
+    stream_args = ["--stream"] if stream else []
+    xgb_args = stream_args + (["--params", str(xgb_params)] if xgb_params else [])
+    zone_map = [Path(region.spec["zone_raster"]["path"])] if "zone_raster" in region.spec else []
+    return [
+        Stage(
+            "data",
+            "src.data_pipeline",
+            ["--years", str(years)],
+            outputs=[Path("data/raw/usgs_india.csv"), CLEAN_PATH],
+            # The fetch window ends today, so the catalog is refreshed at most once a day.
+            salt=f"{datetime.now(timezone.utc):%Y-%m-%d}-{region.fingerprint}",
+        ),
+        Stage("decluster", "src.declustering", inputs=[CLEAN_PATH], outputs=[DECLUSTERED_PATH]),
+        Stage(
+            "features",
+            "src.feature_engineering",
+            inputs=[CLEAN_PATH, DECLUSTERED_PATH, *zone_map],
+            outputs=[FEATURES_PATH, DECLUSTERED_FEATURES_PATH],
+            # Seismic zones come from the region definition.
+            salt=region.fingerprint,
+        ),
+        Stage(
+            "xgboost",
+            "src.train_xgboost",
+            xgb_args,
+            inputs=[FEATURES_PATH, *([xgb_params] if xgb_params else [])],
+            outputs=[
+                Path("models/xgb_model.json"),
+                Path("models/xgb_model.joblib"),
+                Path("models/xgb_metrics.json"),
+            ],
+        ),
+        Stage(
+            "lstm",
+            "src.train_lstm",
+            ["--epochs", str(epochs), *stream_args],
+            inputs=[FEATURES_PATH],
+            outputs=[Path("models/lstm_model.keras"), Path("models/lstm_metrics.json")],
+        ),
+        Stage(
+            "fusion",
+            "src.fusion_model",
+            stream_args or ["--folds", str(folds)],
+            inputs=[
+                FEATURES_PATH,
+                Path("models/xgb_model.json"),
+                Path("models/xgb_metrics.json"),
+                Path("models/lstm_model.keras"),
+                Path("models/lstm_metrics.json"),
+            ],
+            outputs=[Path("models/fusion_model.keras"), Path("models/fusion_metrics.json")],
+        ),
+    ]
+
+
+def dependencies(stages: Sequence[Stage]) -> Dict[str, Set[str]]:
+    """Stage name -> names of the stages that write one of its inputs."""
+    producer = {path: stage.name for stage in stages for path in stage.outputs}
+    return {
+        stage.name: {producer[path] for path in stage.inputs if path in producer} - {stage.name}
+        for stage in stages
+    }
+
+
+def code_files(module: str) -> List[Path]:
+    """Source of ``module`` plus every ``src`` module it imports, transitively."""
+    seen: Set[Path] = set()
+    pending = [module]
+    while pending:
+        name = pending.pop()
+        path = SRC_DIR / f"{name.split('.', 1)[1]}.py" if name.startswith("src.") else None
+        if path is None or path in seen or not path.exists():
+            continue
+        seen.add(path)
+        for node in ast.walk(ast.parse(path.read_text())):
+            if isinstance(node, ast.ImportFrom) and node.module == "src":
+                pending.extend(f"src.{alias.name}" for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and (node.module or "").startswith("src."):
+                pending.append(node.module)
+            elif isinstance(node, ast.Import):
+                pending.extend(a.name for a in node.names if a.name.startswith("src."))
+    return sorted(seen)
+
+
+class ContentStore:
+    """Blobs addressed by SHA-256 plus one output manifest per stage fingerprint."""
+
+    def __init__(self, root: Path = STORE_DIR) -> None:
+        self.root = root
+        self.objects = root / "objects"
+        self.manifests = root / "manifests"
+        self.logs = root / "logs"
+        self._digest_cache_path = root / "digests.json"
+        self._digest_cache: Dict[str, List] = (
+            json.loads(self._digest_cache_path.read_text()) if self._digest_cache_path.exists() else {}
+        )
+
+    def digest(self, path: Path) -> str:
+        """File SHA-256, memoized on (size, mtime) so unchanged inputs are not re-read."""
+        stat = path.stat()
+        key = str(path.resolve())
+        cached = self._digest_cache.get(key)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = hashlib.sha256()
+        with path.open("rb") as handle:
+            for block in iter(lambda: handle.read(1 << 20), b""):
+                digest.update(block)
+        self._digest_cache[key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def save_digests(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._digest_cache_path.write_text(json.dumps(self._digest_cache))
+
+    def fingerprint(self, stage: Stage) -> str:
+        missing = [str(p) for p in stage.inputs if not p.exists()]
+        if missing:
+            raise FileNotFoundError(f"Stage {stage.name} is missing inputs: {', '.join(missing)}")
+        payload = {
+            "module": stage.module,
+            "args": stage.args,
+            "salt": stage.salt,
+            "inputs": {str(p): self.digest(p) for p in stage.inputs},
+            "code": {p.name: self.digest(p) for p in code_files(stage.module)},
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def manifest(self, fingerprint: str) -> Optional[Dict]:
+        path = self.manifests / f"{fingerprint}.json"
+        return json.loads(path.read_text()) if path.exists() else None
+
+    def put(self, stage: Stage, fingerprint: str, duration_s: float) -> Dict:
+        outputs = {}
+        for path in stage.outputs:
+            if not path.exists():
+                raise FileNotFoundError(f"Stage {stage.name} did not write {path}")
+            digest = self.digest(path)
+            blob = self.objects / digest[:2] / digest
+            if not blob.exists():
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                # Copy under a temp name then rename, so a blob is never partially written.
+                fd, tmp = tempfile.mkstemp(dir=blob.parent)
+                os.close(fd)
+                shutil.copyfile(path, tmp)
+                os.replace(tmp, blob)
+            outputs[str(path)] = digest
+        manifest = {
+            "stage": stage.name,
+            "fingerprint": fingerprint,
+            "outputs": outputs,
+            "duration_s": duration_s,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        self.manifests.mkdir(parents=True, exist_ok=True)
+        (self.manifests / f"{fingerprint}.json").write_text(json.dumps(manifest, indent=2))
+        return manifest
+
+    def restore(self, manifest: Dict) -> bool:
+        """Bring working outputs in line with ``manifest``; True if any file was copied back."""
+        copied = False
+        for name, digest in manifest["outputs"].items():
+            path = Path(name)
+            if path.exists() and self.digest(path) == digest:
+                continue
+            # Copies, not links: trainers rewrite their outputs in place.
+            path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(self.objects / digest[:2] / digest, path)
+            copied = True
+        return copied
+
+    def has_blobs(self, manifest: Dict) -> bool:
+        return all((self.objects / d[:2] / d).exists() for d in manifest["outputs"].values())
+
+
+@dataclass
+class StageResult:
+    name: str
+    status: str  # ran, skipped, restored, failed, blocked
+    duration_s: float = 0.0
+    fingerprint: str = ""
+    error: str = ""
+
+
+def _execute(stage: Stage, store: ContentStore) -> Tuple[float, int]:
+    store.logs.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    with (store.logs / f"{stage.name}.log").open("w") as log:
+        code = subprocess.run(
+            [sys.executable, "-m", stage.module, *stage.args],
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        ).returncode
+    return time.perf_counter() - start, code
+
+
+def run_pipeline(
+    stages: Sequence[Stage],
+    jobs: int = 2,
+    force: Sequence[str] = (),
+    dry_run: bool = False,
+    store: Optional[ContentStore] = None,
+) -> List[StageResult]:
+    """
+    Run ``stages`` in dependency order, at most ``jobs`` at a time, skipping
+    those whose fingerprint is in the store. Fingerprints are taken when a
+    stage becomes ready, i.e. after its upstream stages wrote their outputs.
+    """
+    store = store or ContentStore()
+    deps = dependencies(stages)
+    results: Dict[str, StageResult] = {}
+    running: Dict[Future, Tuple[Stage, str]] = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while len(results) < len(stages):
+            active = {stage.name for stage, _ in running.values()}
+            for stage in stages:
+                if stage.name in results or stage.name in active:
+                    continue
+                upstream = [results.get(d) for d in sorted(deps[stage.name])]
+                broken = [r.name for r in upstream if r and r.status in ("failed", "blocked")]
+                if broken:
+                    results[stage.name] = StageResult(stage.name, "blocked", error=f"blocked by {', '.join(broken)}")
+                    continue
+                if any(r is None for r in upstream) or len(running) >= jobs:
+                    continue
+                if any(r.status == "would run" for r in upstream):
+                    # Its inputs are not written yet, so there is nothing to fingerprint.
+                    results[stage.name] = StageResult(stage.name, "would run")
+                    continue
+                try:
+                    fingerprint = store.fingerprint(stage)
+                except FileNotFoundError as exc:
+                    results[stage.name] = StageResult(stage.name, "failed", error=str(exc))
+                    continue
+                manifest = store.manifest(fingerprint)
+                if manifest and stage.name not in force and store.has_blobs(manifest):
+                    status = "restored" if not dry_run and store.restore(manifest) else "skipped"
+                    results[stage.name] = StageResult(stage.name, status, 0.0, fingerprint)
+                    print(f"[{stage.name}] {status} ({fingerprint[:12]})")
+                    continue
+                if dry_run:
+                    results[stage.name] = StageResult(stage.name, "would run", 0.0, fingerprint)
+                    continue
+                print(f"[{stage.name}] running python -m {stage.module} {' '.join(stage.args)}")
+                running[pool.submit(_execute, stage, store)] = (stage, fingerprint)
+                active.add(stage.name)
+
+            if not running:
+                if len(results) < len(stages):
+                    # Only possible with a dependency cycle.
+                    for stage in stages:
+                        results.setdefault(stage.name, StageResult(stage.name, "blocked", error="cycle"))
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, fingerprint = running.pop(future)
+                duration, code = future.result()
+                if code != 0:
+                    log = store.logs / f"{stage.name}.log"
+                    tail = "\n".join(log.read_text().splitlines()[-5:])
+                    results[stage.name] = StageResult(stage.name, "failed", duration, fingerprint, tail)
+                    print(f"[{stage.name}] failed after {duration:.1f}s (exit {code}), see {log}")
+                    continue
+                try:
+                    store.put(stage, fingerprint, duration)
+                except FileNotFoundError as exc:
+                    results[stage.name] = StageResult(stage.name, "failed", duration, fingerprint, str(exc))
+                    continue
+                results[stage.name] = StageResult(stage.name, "ran", duration, fingerprint)
+                print(f"[{stage.name}] done in {duration:.1f}s")
+    store.save_digests()
+    return [results[stage.name] for stage in stages]
+
+
+def enter_region(region: Region) -> None:
+    """Work inside ``region``'s root from now on, in this process and the stage subprocesses."""
+    region.root.mkdir(parents=True, exist_ok=True)
+    os.environ["EQ_REGION"] = region.name
+    os.environ["EQ_HOME"] = str(HOME)
+    os.environ["EQ_REGIONS"] = str(REGIONS_PATH.resolve())
+    # Stages run as ``python -m src.<stage>`` from the region root.
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [str(SRC_DIR.parent), os.environ.get("PYTHONPATH")]))
+    os.chdir(region.root)
+
+
+def print_summary(results: Sequence[StageResult], wall_s: float) -> None:
+    print(f"\n{'stage':<10} {'status':<10} {'seconds':>8}  fingerprint")
+    for result in results:
+        print(f"{result.name:<10} {result.status:<10} {result.duration_s:>8.1f}  {result.fingerprint[:12]}")
+        if result.error:
+            print(f"{'':<10} {result.error}")
+    busy = sum(r.duration_s for r in results)
+    print(f"Wall time {wall_s:.1f}s for {busy:.1f}s of stage time")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the training pipeline, skipping unchanged stages")
+    parser.add_argument("--from", dest="start", default=None, help="Start at this stage, using existing upstream outputs")
+    parser.add_argument("--force", nargs="*", default=[], help="Rerun these stages even if unchanged")
+    parser.add_argument("--jobs", type=int, default=2, help="Stages to run in parallel")
+    parser.add_argument("--dry-run", action="store_true", help="Only report which stages would run")
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--stream", action="store_true", help="Train with the streaming (out-of-core) trainers")
+    parser.add_argument("--xgb-params", type=Path, default=None, help="best_params.json from src.tune_xgboost")
+    parser.add_argument("--region", default=None, help="Run for this region (default: the active region)")
+    args = parser.parse_args()
+
+    region = active_region()
+    if args.region:
+        if args.region not in REGIONS:
+            parser.error(f"--region must be one of {', '.join(REGIONS)}")
+        region = REGIONS[args.region]
+        if args.xgb_params:
+            args.xgb_params = args.xgb_params.resolve()
+        enter_region(region)
+
+    stages = default_stages(args.years, args.epochs, args.stream, args.xgb_params, args.folds, region)
+    if region.models_dir != region.path("models"):
+        # A region borrowing another region's model set only builds its catalog and features.
+        stages = [stage for stage in stages if stage.name not in MODEL_STAGES]
+    names = [stage.name for stage in stages]
+    if args.start:
+        if args.start not in names:
+            parser.error(f"--from must be one of {', '.join(names)}")
+        stages = stages[names.index(args.start):]
+    unknown = set(args.force) - set(names)
+    if unknown:
+        parser.error(f"Unknown stages for --force: {', '.join(sorted(unknown))}")
+
+    start = time.perf_counter()
+    results = run_pipeline(stages, args.jobs, args.force, args.dry_run)
+    print_summary(results, time.perf_counter() - start)
+    if any(r.status in ("failed", "blocked") for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
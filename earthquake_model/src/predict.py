@@ -1,72 +1,185 @@
 from __future__ import annotations
 
+import threading
+import time
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 from tensorflow.keras.models import load_model
 from xgboost import XGBRegressor
 
+from src import instrumentation, model_registry
+from src.catalog import CACHE_DIR, EventCatalog, read_catalog
+from src.event_state import get_event_state
 from src.feature_engineering import assign_seismic_zone
+from src.regions import Region, active_region, region_for
+from src.student import StudentModel
+from src.train_lstm import FEATURES as LSTM_FEATURES
+from src.train_lstm import SEQUENCE_LENGTH
 from src.train_xgboost import FEATURES
 
-MODELS_CACHE: Dict[str, object] = {}
-TRAINING_DATA: Optional[pd.DataFrame] = None
-
-
-def _load_xgb() -> Optional[XGBRegressor]:
-    model_path = Path("models/xgb_model.json")
-    if not model_path.exists():
-        return None
-    if "xgb" in MODELS_CACHE:
-        return MODELS_CACHE["xgb"]
-    model = XGBRegressor()
-    model.load_model(model_path)
-    MODELS_CACHE["xgb"] = model
-    return model
-
-
-def _load_lstm() -> Optional[object]:
-    model_path = Path("models/lstm_model.keras")
-    if not model_path.exists():
-        return None
-    if "lstm" in MODELS_CACHE:
-        return MODELS_CACHE["lstm"]
-    model = load_model(model_path)
-    MODELS_CACHE["lstm"] = model
-    return model
-
-
-def _load_fusion() -> Optional[object]:
-    model_path = Path("models/fusion_model.keras")
-    if not model_path.exists():
-        return None
-    if "fusion" in MODELS_CACHE:
-        return MODELS_CACHE["fusion"]
-    model = load_model(model_path)
-    MODELS_CACHE["fusion"] = model
-    return model
-
-
-def _load_training_data() -> pd.DataFrame:
-    """Load training data for historical comparisons"""
-    global TRAINING_DATA
-    if TRAINING_DATA is not None:
-        return TRAINING_DATA
+# Historical catalog per region name.
+TRAINING_DATA: Dict[str, EventCatalog] = {}
+KEEP_LOADED = 2  # the active version plus the previous one, for instant rollback
+
+
+@dataclass
+class ModelSet:
+    """One model version's loaded XGBoost, LSTM, fusion and distilled student models."""
+
+    version: str
+    xgb: Optional[XGBRegressor] = None
+    lstm: Optional[object] = None
+    fusion: Optional[object] = None
+    student: Optional[StudentModel] = None
+    loaded_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class ModelShard:
+    """The loaded versions and active model set of one region's model registry."""
+
+    registry: Path
+    cache: Dict[str, ModelSet] = field(default_factory=dict)
+    active: Optional[ModelSet] = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+# Keyed by models directory, so regions sharing a model set load it once.
+MODEL_SHARDS: Dict[Path, ModelShard] = {}
+
+
+def model_shard(region: Optional[Region] = None) -> ModelShard:
+    """Model cache of ``region`` (default: the active region)."""
+    region = region or active_region()
+    shard = MODEL_SHARDS.get(region.models_dir)
+    if shard is None:
+        shard = MODEL_SHARDS.setdefault(region.models_dir, ModelShard(region.models_dir / "registry"))
+    return shard
+
+
+def load_model_set(version: Optional[str] = None, registry: Path = model_registry.REGISTRY_DIR) -> ModelSet:
+    """Load a registry version (default: current; legacy ``models/`` paths without a registry)."""
+    version = version or model_registry.current_version(registry)
+    paths = model_registry.artifact_paths(version, registry)
+    models = ModelSet(version or model_registry.UNVERSIONED)
+    if paths["xgb_model.json"].exists():
+        start = time.perf_counter()
+        models.xgb = XGBRegressor()
+        models.xgb.load_model(paths["xgb_model.json"])
+        instrumentation.record_model_load("xgb", time.perf_counter() - start)
+    for name in ("lstm", "fusion"):
+        path = paths[f"{name}_model.keras"]
+        if path.exists():
+            start = time.perf_counter()
+            setattr(models, name, load_model(path))
+            instrumentation.record_model_load(name, time.perf_counter() - start)
+    if paths["student_model.json"].exists():
+        start = time.perf_counter()
+        models.student = StudentModel.load(paths["student_model.json"])
+        instrumentation.record_model_load("student", time.perf_counter() - start)
+    return models
+
+
+def warm_model_set(models: ModelSet) -> None:
+    """Run one throwaway inference per model so the first real request is not a cold start."""
+    with instrumentation.span("model_warm"):
+        if models.xgb is not None:
+            models.xgb.predict(pd.DataFrame(np.zeros((1, len(FEATURES))), columns=FEATURES))
+        if models.lstm is not None:
+            models.lstm.predict(np.zeros((1, SEQUENCE_LENGTH, len(LSTM_FEATURES))), verbose=0)
+        if models.fusion is not None:
+            models.fusion.predict(np.zeros((1, 2)), verbose=0)
+
+
+def _activate(shard: ModelShard, models: ModelSet) -> None:
+    shard.cache.pop(models.version, None)
+    shard.cache[models.version] = models
+    while len(shard.cache) > KEEP_LOADED:
+        shard.cache.pop(next(iter(shard.cache)))
+    # One reference assignment: a request sees either the old set or the new one, never a mix.
+    shard.active = models
+
+
+def active_models(region: Optional[Region] = None) -> ModelSet:
+    """The model set serving ``region`` (default: the active region), loading its current version on first use."""
+    shard = model_shard(region)
+    if shard.active is not None:
+        instrumentation.record_cache("models", hit=True)
+        return shard.active
+    with shard.lock:
+        if shard.active is None:
+            instrumentation.record_cache("models", hit=False)
+            _activate(shard, load_model_set(registry=shard.registry))
+    return shard.active
+
+
+def reload_models(version: Optional[str] = None, warm: bool = True, region: Optional[Region] = None) -> ModelSet:
+    """
+    Load ``version`` (default: the registry's current one), warm it and swap
+    it in. Requests keep using the previous set until the swap; a version
+    that is still loaded (e.g. after a rollback) is swapped in immediately.
+    """
+    shard = model_shard(region)
+    with shard.lock:
+        version = version or model_registry.current_version(shard.registry) or model_registry.UNVERSIONED
+        models = shard.cache.get(version)
+        # Unversioned artifacts can change in place, so they are always reloaded.
+        if models is None or version == model_registry.UNVERSIONED:
+            with instrumentation.span("model_reload"):
+                models = load_model_set(None if version == model_registry.UNVERSIONED else version, shard.registry)
+                if warm:
+                    warm_model_set(models)
+        _activate(shard, models)
+        return models
+
+
+def loaded_models() -> int:
+    """Model sets held across all regions."""
+    return sum(len(shard.cache) for shard in MODEL_SHARDS.values())
+
+
+def _load_xgb(region: Optional[Region] = None) -> Optional[XGBRegressor]:
+    return active_models(region).xgb
+
+
+def _load_lstm(region: Optional[Region] = None) -> Optional[object]:
+    return active_models(region).lstm
+
+
+def _load_fusion(region: Optional[Region] = None) -> Optional[object]:
+    return active_models(region).fusion
+
+
+def _load_training_data(region: Optional[Region] = None) -> EventCatalog:
+    """Load training data for historical comparisons (compact, memory-mapped)"""
+    region = region or active_region()
+    cached = TRAINING_DATA.get(region.name)
+    if cached is not None:
+        instrumentation.record_cache("training_data", hit=True)
+        return cached
+    instrumentation.record_cache("training_data", hit=False)
     
-    data_path = Path("data/processed/features.csv")
+    data_path = region.path("data/processed/features.csv")
     if not data_path.exists():
         # Fallback to notebook data
-        data_path = Path("notebooks/data/processed/usgs_india_clean.csv")
+        data_path = region.path("notebooks/data/processed/usgs_india_clean.csv")
     
     if data_path.exists():
-        TRAINING_DATA = pd.read_csv(data_path)
+        catalog = read_catalog(data_path, cache_dir=region.path(CACHE_DIR), region=region)
     else:
-        TRAINING_DATA = pd.DataFrame()
+        catalog = EventCatalog(np.zeros(0, np.int64), np.zeros(0, np.int8), {})
     
-    return TRAINING_DATA
+    return TRAINING_DATA.setdefault(region.name, catalog)
+
+
+def training_data_bytes() -> int:
+    """Bytes held by the loaded historical catalogs (0 until first use)."""
+    return sum(catalog.nbytes for catalog in TRAINING_DATA.values())
 
 
 def get_feature_vector(
@@ -78,9 +191,8 @@ def get_feature_vector(
     """
     Returns feature vector and feature names used for prediction
     """
-    recent_events = _enrich_recent_events(recent_events or [])
-    context = _context_features(lat, lon, depth_km, recent_events)
-    
+    context, _ = _serving_context(lat, lon, depth_km, recent_events)
+
     row = {
         "latitude": lat,
         "longitude": lon,
@@ -91,13 +203,15 @@ def get_feature_vector(
     return x_input.values[0], FEATURES
 
 
+@instrumentation.timed("historical_averages")
 def get_historical_averages(lat: float, lon: float) -> Dict:
     """
     Returns historical average stats for the region
     from the training dataset
     """
+    region = region_for(lat, lon)
     try:
-        training_data = _load_training_data()
+        training_data = _load_training_data(region)
         
         if training_data.empty:
             return {
@@ -105,30 +219,31 @@ def get_historical_averages(lat: float, lon: float) -> Dict:
                 "max_magnitude": 5.1,
                 "avg_depth": 18.0,
                 "total_events": 0,
-                "note": "No regional history — using India baseline"
+                "note": f"No regional history — using {region.label} baseline"
             }
         
         # Filter training data for nearby region (±2 degrees)
-        nearby = training_data[
-            (training_data['latitude'].between(lat - 2, lat + 2)) &
-            (training_data['longitude'].between(lon - 2, lon + 2))
-        ]
+        lats = training_data['latitude']
+        lons = training_data['longitude']
+        nearby = (lats >= lat - 2) & (lats <= lat + 2) & (lons >= lon - 2) & (lons <= lon + 2)
+        count = int(np.count_nonzero(nearby))
         
-        if len(nearby) == 0:
+        if count == 0:
             return {
                 "avg_magnitude": 3.2,
                 "max_magnitude": 5.1,
                 "avg_depth": 18.0,
                 "total_events": 0,
-                "note": "No regional history — using India baseline"
+                "note": f"No regional history — using {region.label} baseline"
             }
         
+        magnitudes = training_data['magnitude'][nearby]
         return {
-            "avg_magnitude": round(float(nearby['magnitude'].mean()), 2),
-            "max_magnitude": round(float(nearby['magnitude'].max()), 2),
-            "avg_depth": round(float(nearby['depth_km'].mean()), 2),
-            "total_events": int(len(nearby)),
-            "note": f"Based on {len(nearby)} historical events in ±2° radius"
+            "avg_magnitude": round(float(np.nanmean(magnitudes, dtype=np.float64)), 2),
+            "max_magnitude": round(float(np.nanmax(magnitudes)), 2),
+            "avg_depth": round(float(np.nanmean(training_data['depth_km'][nearby], dtype=np.float64)), 2),
+            "total_events": count,
+            "note": f"Based on {count} historical events in ±2° radius"
         }
     except Exception as e:
         return {
@@ -140,8 +255,9 @@ def get_historical_averages(lat: float, lon: float) -> Dict:
         }
 
 
+@instrumentation.timed("enrich_recent_events")
 def _enrich_recent_events(
-    recent_events: List[Dict],
+    recent_events: List[Dict], region: Optional[Region] = None
 ) -> List[Dict]:
     if not recent_events:
         return []
@@ -155,7 +271,7 @@ def _enrich_recent_events(
     for idx, row in events_df.iterrows():
         zone = row.get("seismic_zone")
         if pd.isna(zone):
-            zone = assign_seismic_zone(row["latitude"], row["longitude"])
+            zone = assign_seismic_zone(row["latitude"], row["longitude"], region)
         seismic_zones.append(int(zone))
 
         if idx == 0:
@@ -171,10 +287,11 @@ def _enrich_recent_events(
     return events_df.to_dict(orient="records")
 
 
+@instrumentation.timed("context_features")
 def _context_features(
-    lat: float, lon: float, depth_km: float, recent_events: List[Dict]
+    lat: float, lon: float, depth_km: float, recent_events: List[Dict], region: Optional[Region] = None
 ) -> Dict[str, float]:
-    zone = assign_seismic_zone(lat, lon)
+    zone = assign_seismic_zone(lat, lon, region)
     month = datetime.utcnow().month
 
     if not recent_events:
@@ -194,11 +311,9 @@ def _context_features(
     events_df = events_df.sort_values("timestamp")
 
     prev_magnitude = float(events_df.iloc[-1]["magnitude"])
-    days_since_last = (
-        datetime.utcnow() - events_df.iloc[-1]["timestamp"].to_pydatetime()
-    ).total_seconds() / 86400
+    now = pd.Timestamp.now(tz="UTC")
+    days_since_last = (now - events_df.iloc[-1]["timestamp"]).total_seconds() / 86400
 
-    now = pd.Timestamp.utcnow()
     window_7d = events_df[events_df["timestamp"] >= now - pd.Timedelta(days=7)]
     window_30d = events_df[events_df["timestamp"] >= now - pd.Timedelta(days=30)]
 
@@ -218,40 +333,91 @@ def _context_features(
     }
 
 
+def _serving_context(
+    lat: float,
+    lon: float,
+    depth_km: float,
+    recent_events: Optional[List[Dict]] = None,
+    region: Optional[Region] = None,
+    at: Optional[pd.Timestamp] = None,
+) -> Tuple[Dict[str, float], Optional[np.ndarray]]:
+    """
+    Context features and LSTM input sequence for a prediction. Uses the
+    region's server-side event state as of ``at`` (default: now) unless the
+    client shipped its own history.
+    """
+    region = region or region_for(lat, lon)
+    if recent_events:
+        recent_events = _enrich_recent_events(recent_events, region)
+        context = _context_features(lat, lon, depth_km, recent_events, region)
+        sequence = None
+        if len(recent_events) >= SEQUENCE_LENGTH:
+            sequence = pd.DataFrame(recent_events)[LSTM_FEATURES].tail(SEQUENCE_LENGTH).values
+        return context, sequence
+
+    state = get_event_state(region)
+    with instrumentation.span("event_state_context"):
+        context = state.context(lat, lon, at)
+    sequence = state.sequence(int(context["seismic_zone"]), SEQUENCE_LENGTH)
+    return context, sequence
+
+
+@instrumentation.timed("predict_event")
 def predict_event(
     lat: float,
     lon: float,
     depth_km: float,
     recent_events: Optional[List[Dict]] = None,
+    mode: str = "full",
+    at: Optional[pd.Timestamp] = None,
+    models: Optional[ModelSet] = None,
 ) -> Dict[str, float]:
-    recent_events = _enrich_recent_events(recent_events or [])
-    context = _context_features(lat, lon, depth_km, recent_events)
-    xgb = _load_xgb()
-    lstm = _load_lstm()
-    fusion = _load_fusion()
+    """
+    Magnitude for one event. ``mode="fast"`` serves the distilled student
+    model (numpy only, no LSTM or fusion inference) and falls back to the
+    full ensemble when the active version has no student. The request is
+    served by the state and models of the region containing (lat, lon);
+    ``at`` is the event time for feeds of observed events (default: now).
+    Callers that also inspect the models pass their ``models`` snapshot.
+    """
+    region = region_for(lat, lon)
+    context, sequence = _serving_context(lat, lon, depth_km, recent_events, region, at)
+    # One snapshot per request, so a concurrent swap cannot mix versions.
+    models = models if models is not None else active_models(region)
+    xgb, lstm, fusion = models.xgb, models.lstm, models.fusion
+    row = {
+        "latitude": lat,
+        "longitude": lon,
+        "depth_km": depth_km,
+        **context,
+    }
+
+    if mode == "fast" and models.student is not None:
+        with instrumentation.span("student_predict"):
+            magnitude = models.student.predict_row(row)
+        return {
+            "predicted_magnitude": magnitude,
+            "confidence": 0.75,
+            "seismic_zone": context["seismic_zone"],
+            "model_version": models.version,
+            "mode": "fast",
+            "region": region.name,
+        }
 
     xgb_pred = None
     if xgb:
-        row = {
-            "latitude": lat,
-            "longitude": lon,
-            "depth_km": depth_km,
-            **context,
-        }
-        x_input = pd.DataFrame([row])[FEATURES].fillna(0.0)
-        xgb_pred = float(xgb.predict(x_input)[0])
+        with instrumentation.span("xgb_predict"):
+            x_input = pd.DataFrame([row])[FEATURES].fillna(0.0)
+            xgb_pred = float(xgb.predict(x_input)[0])
 
     lstm_pred = None
-    if lstm and recent_events:
-        seq = pd.DataFrame(recent_events)[
-            ["latitude", "longitude", "depth_km", "magnitude", "days_since_last_quake", "seismic_zone"]
-        ]
-        seq = seq.tail(10)
-        if len(seq) == 10:
-            lstm_pred = float(lstm.predict(np.array([seq.values]), verbose=0)[0][0])
+    if lstm and sequence is not None:
+        with instrumentation.span("lstm_predict"):
+            lstm_pred = float(lstm.predict(np.array([sequence]), verbose=0)[0][0])
 
     if fusion and xgb_pred is not None and lstm_pred is not None:
-        fused = float(fusion.predict(np.array([[xgb_pred, lstm_pred]]), verbose=0)[0][0])
+        with instrumentation.span("fusion_predict"):
+            fused = float(fusion.predict(np.array([[xgb_pred, lstm_pred]]), verbose=0)[0][0])
         magnitude = fused
         confidence = 0.8
     elif xgb_pred is not None:
@@ -268,4 +434,42 @@ def predict_event(
         "predicted_magnitude": magnitude,
         "confidence": confidence,
         "seismic_zone": context["seismic_zone"],
+        "model_version": models.version,
+        "mode": "full",
+        "region": region.name,
     }
+
+
+def predict_batch(
+    x_input: np.ndarray, lstm_pred: Optional[np.ndarray] = None, region: Optional[Region] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Batched magnitude and confidence for rows of ``FEATURES``, applying the
+    same model fallbacks as :func:`predict_event` with the models of
+    ``region`` (default: the active region). ``lstm_pred`` holds one LSTM
+    output per row, NaN where no sequence was available.
+    """
+    n_rows = len(x_input)
+    models = active_models(region)
+    xgb, fusion = models.xgb, models.fusion
+
+    magnitude = np.zeros(n_rows, dtype=np.float32)
+    confidence = np.zeros(n_rows, dtype=np.float32)
+    if lstm_pred is None:
+        lstm_pred = np.full(n_rows, np.nan, dtype=np.float32)
+    has_lstm = ~np.isnan(lstm_pred)
+
+    if xgb:
+        with instrumentation.span("xgb_predict_batch"):
+            xgb_pred = xgb.predict(pd.DataFrame(x_input, columns=FEATURES)).astype(np.float32)
+        magnitude[:] = xgb_pred
+        confidence[:] = 0.7
+        if fusion and has_lstm.any():
+            with instrumentation.span("fusion_predict_batch"):
+                pairs = np.column_stack([xgb_pred[has_lstm], lstm_pred[has_lstm]])
+                magnitude[has_lstm] = fusion.predict(pairs, batch_size=4096, verbose=0).reshape(-1)
+            confidence[has_lstm] = 0.8
+    else:
+        magnitude[has_lstm] = lstm_pred[has_lstm]
+        confidence[has_lstm] = 0.65
+    return magnitude, confidence
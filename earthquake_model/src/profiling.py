@@ -0,0 +1,214 @@
+"""
+Opt-in sampling profiler for the API and the CLI stages.
+
+A daemon thread wakes every ``interval_s``, reads the stacks of the threads
+being profiled from ``sys._current_frames()`` and counts them. Nothing is
+traced, so unsampled code runs at full speed and sampled code pays only for
+the stack walks. Output is the folded-stack format ("a;b;c 42" per line)
+read by ``flamegraph.pl``, inferno and speedscope.
+
+The API samples a random fraction of requests (``EQ_PROFILE_FRACTION`` or
+``POST /admin/profile/start``). A sampled request is marked in a ContextVar,
+and its thread is sampled only while the request is inside an
+:mod:`src.instrumentation` span. CLI modules take ``--profile`` and write one
+folded file per stage to ``data/cache/profiles/``.
+"""
+from __future__ import annotations
+
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from pathlib import Path
+from types import CodeType, FrameType
+from typing import Callable, Dict, Iterator, Optional, Set, Tuple
+
+PROFILE_DIR = Path("data/cache/profiles")
+DEFAULT_INTERVAL_S = 0.005
+MAX_DEPTH = 128
+
+# Set for the duration of a sampled request; copied into worker threads with the context.
+_SAMPLED: ContextVar[bool] = ContextVar("profile_sampled", default=False)
+
+
+class StackSampler:
+    """Counts folded stacks of the threads returned by ``targets``."""
+
+    def __init__(self, targets: Callable[[], Set[int]], interval_s: float = DEFAULT_INTERVAL_S) -> None:
+        self.targets = targets
+        self.interval_s = interval_s
+        self.counts: Dict[str, int] = {}
+        self.samples = 0
+        self._labels: Dict[int, Tuple[CodeType, str]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "StackSampler":
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _label(self, code: CodeType) -> str:
+        # Keyed by id: hashing a code object hashes its bytecode. The cached
+        # code reference keeps the id from being reused.
+        cached = self._labels.get(id(code))
+        if cached is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+            cached = self._labels[id(code)] = (code, label)
+        return cached[1]
+
+    def _fold(self, frame: Optional[FrameType]) -> str:
+        labels = []
+        while frame is not None and len(labels) < MAX_DEPTH:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        return ";".join(reversed(labels))
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            targets = self.targets()
+            if not targets:
+                continue
+            frames = sys._current_frames()
+            stacks = [self._fold(frames.get(ident)) for ident in targets if ident in frames]
+            with self._lock:
+                for stack in stacks:
+                    self.counts[stack] = self.counts.get(stack, 0) + 1
+                self.samples += len(stacks)
+
+    def folded(self) -> str:
+        with self._lock:
+            items = sorted(self.counts.items())
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+
+class RequestProfiler:
+    """
+    Samples a random ``fraction`` of requests.
+
+    ``begin`` decides per request and marks the request's context. Spans
+    entered in a marked context register their thread until they exit, so an
+    event loop thread is sampled only while it runs a sampled request's span,
+    not while it interleaves other requests.
+    """
+
+    def __init__(self) -> None:
+        self.fraction = 0.0
+        self.sampler: Optional[StackSampler] = None
+        self.sampled_requests = 0
+        self.started_at: Optional[float] = None
+        self._inflight: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.fraction > 0 and self.sampler is not None
+
+    def _targets(self) -> Set[int]:
+        with self._lock:
+            return set(self._inflight)
+
+    def start(self, fraction: float, interval_s: float = DEFAULT_INTERVAL_S, reset: bool = True) -> None:
+        self.stop()
+        if reset or self.sampler is None:
+            self.sampler = StackSampler(self._targets, interval_s)
+            self.sampled_requests = 0
+        self.sampler.interval_s = interval_s
+        self.fraction = fraction
+        self.started_at = time.time()
+        self.sampler.start()
+
+    def stop(self) -> None:
+        """Stop sampling; the collected stacks stay available until the next reset."""
+        self.fraction = 0.0
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    def begin(self) -> Optional[Token]:
+        """Mark the current request as sampled (with probability ``fraction``)."""
+        if self.fraction <= 0 or random.random() >= self.fraction:
+            return None
+        with self._lock:
+            self.sampled_requests += 1
+        return _SAMPLED.set(True)
+
+    def end(self, token: Optional[Token]) -> None:
+        if token is not None:
+            _SAMPLED.reset(token)
+
+    def enter(self) -> Optional[int]:
+        """Register the current thread if it is running a sampled request."""
+        if self.fraction <= 0 or not _SAMPLED.get():
+            return None
+        ident = threading.get_ident()
+        with self._lock:
+            self._inflight[ident] = self._inflight.get(ident, 0) + 1
+        return ident
+
+    def exit(self, ident: Optional[int]) -> None:
+        if ident is None:
+            return
+        with self._lock:
+            remaining = self._inflight.get(ident, 0) - 1
+            if remaining > 0:
+                self._inflight[ident] = remaining
+            else:
+                self._inflight.pop(ident, None)
+
+    def folded(self) -> str:
+        return self.sampler.folded() if self.sampler is not None else ""
+
+    def status(self) -> Dict:
+        sampler = self.sampler
+        return {
+            "active": self.active,
+            "fraction": self.fraction,
+            "interval_ms": sampler.interval_s * 1000 if sampler else DEFAULT_INTERVAL_S * 1000,
+            "started_at": self.started_at,
+            "sampled_requests": self.sampled_requests,
+            "samples": sampler.samples if sampler else 0,
+            "distinct_stacks": len(sampler.counts) if sampler else 0,
+        }
+
+
+REQUEST_PROFILER = RequestProfiler()
+
+
+class StageProfiler:
+    """``--profile`` support for CLI modules: one folded file per ``stage``."""
+
+    def __init__(
+        self, module: str, enabled: bool, directory: Path = PROFILE_DIR, interval_s: float = DEFAULT_INTERVAL_S
+    ) -> None:
+        self.module = module
+        self.enabled = enabled
+        self.directory = directory
+        self.interval_s = interval_s
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        ident = threading.get_ident()
+        sampler = StackSampler(lambda: {ident}, self.interval_s).start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f"{self.module}.{name}.folded"
+            path.write_text(sampler.folded())
+            print(f"   profile {name}: {sampler.samples} samples over {time.perf_counter() - start:.1f}s -> {path}")
@@ -0,0 +1,300 @@
+"""
+Regions served by one deployment: catalog bbox, seismic zone raster and model set.
+
+Regions are data, read from ``src/regions.json`` (or the file named by
+``EQ_REGIONS``). Each region has a root directory with the usual ``data/``
+and ``models/`` layout, so its catalog, features, event state and model cache
+are independent of every other region's. The first region is the default: it
+serves points outside every bbox and normally keeps the legacy layout at the
+deployment root (``"root": "."``).
+
+Requests are routed to the smallest bbox containing their coordinates, so a
+region nested inside a larger one (say the Himalaya inside India) takes the
+events in its box. Offline, a process works on one region: the pipeline's
+``--region`` runs its stages inside that region's root with ``EQ_REGION``
+set, and zone assignment and fetches there use :func:`active_region`.
+
+    python -m src.regions                     # list regions and zone lookup timings
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+REGIONS_PATH = Path(os.environ.get("EQ_REGIONS", Path(__file__).with_name("regions.json")))
+# Region roots are relative to the deployment directory, which region subprocesses get via EQ_HOME.
+HOME = Path(os.environ.get("EQ_HOME", ".")).resolve()
+# Points this close (in cells) to a grid line are looked up against the zone boxes.
+_GRID_LINE_TOL = 1e-6
+
+# (min_lon, min_lat, max_lon, max_lat)
+Box = Tuple[float, float, float, float]
+
+
+@dataclass
+class Region:
+    """
+    One region's definition plus its seismic zone raster.
+
+    The raster is painted from ``zone_boxes`` (higher zones win where boxes
+    overlap) or loaded from a ``zone_raster`` file. In a painted raster the
+    cells a box edge passes through are marked -1; points in them or on grid
+    lines are looked up against the boxes, so it gives exactly the box answer.
+    """
+
+    name: str
+    label: str
+    bbox: Dict[str, float]
+    root: Path
+    models_dir: Path
+    zone_boxes: Dict[int, List[Box]] = field(default_factory=dict)
+    default_zone: int = 2
+    cell_deg: float = 0.5
+    spec: Dict = field(default_factory=dict, repr=False)
+
+    def __post_init__(self) -> None:
+        raster = self.spec.get("zone_raster")
+        if raster:
+            self._load_raster(raster)
+        else:
+            self._paint_raster()
+
+    @property
+    def area(self) -> float:
+        return (self.bbox["maxlatitude"] - self.bbox["minlatitude"]) * (
+            self.bbox["maxlongitude"] - self.bbox["minlongitude"]
+        )
+
+    @property
+    def fingerprint(self) -> str:
+        return hashlib.sha256(json.dumps(self.spec, sort_keys=True).encode()).hexdigest()[:12]
+
+    def path(self, relative) -> Path:
+        """``relative`` (e.g. ``data/processed/features.csv``) inside this region's root."""
+        return self.root / relative
+
+    def contains(self, lat: float, lon: float) -> bool:
+        return (
+            self.bbox["minlatitude"] <= lat <= self.bbox["maxlatitude"]
+            and self.bbox["minlongitude"] <= lon <= self.bbox["maxlongitude"]
+        )
+
+    def _paint_raster(self) -> None:
+        boxes = [(zone, box) for zone in sorted(self.zone_boxes) for box in self.zone_boxes[zone]]
+        cell = self.cell_deg
+        if not boxes:
+            self.lat0 = self.lon0 = 0.0
+            self._set_raster(np.zeros((0, 0), dtype=np.int8))
+            return
+        # One spare cell on every side, so points on the outer box edges stay on the raster.
+        self.lat0 = (math.floor(min(b[1] for _, b in boxes) / cell) - 1) * cell
+        self.lon0 = (math.floor(min(b[0] for _, b in boxes) / cell) - 1) * cell
+        rows = int(math.ceil((max(b[3] for _, b in boxes) - self.lat0) / cell)) + 1
+        cols = int(math.ceil((max(b[2] for _, b in boxes) - self.lon0) / cell)) + 1
+        south = self.lat0 + np.arange(rows) * cell
+        west = self.lon0 + np.arange(cols) * cell
+        north, east = south + cell, west + cell
+
+        raster = np.full((rows, cols), self.default_zone, dtype=np.int8)
+        edge = np.zeros((rows, cols), dtype=bool)
+        # Lower zones first so higher zones win where boxes overlap. Only cell
+        # interiors count: points on cell borders are looked up against the boxes.
+        for zone, (min_lon, min_lat, max_lon, max_lat) in boxes:
+            lat_inside = (south >= min_lat) & (north <= max_lat)
+            lon_inside = (west >= min_lon) & (east <= max_lon)
+            lat_overlaps = (north > min_lat) & (south < max_lat)
+            lon_overlaps = (east > min_lon) & (west < max_lon)
+            inside = lat_inside[:, None] & lon_inside[None, :]
+            overlaps = lat_overlaps[:, None] & lon_overlaps[None, :]
+            raster[inside] = zone
+            edge |= overlaps & ~inside
+        raster[edge] = -1
+        self._set_raster(raster)
+
+    def _set_raster(self, raster: np.ndarray) -> None:
+        self.raster = raster
+        self._rows, self._cols = raster.shape
+        # Nested lists: scalar lookups index these faster than the numpy array.
+        self._cells = raster.tolist()
+
+    def _load_raster(self, spec: Dict) -> None:
+        # A zone map replaces the boxes entirely.
+        self.zone_boxes = {}
+        self.lat0, self.lon0 = float(spec["min_lat"]), float(spec["min_lon"])
+        self.cell_deg = float(spec["cell_deg"])
+        self._set_raster(np.load(self.path(spec["path"])).astype(np.int8))
+
+    def _box_zone(self, lat: float, lon: float) -> int:
+        for zone in sorted(self.zone_boxes, reverse=True):
+            for min_lon, min_lat, max_lon, max_lat in self.zone_boxes[zone]:
+                if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                    return zone
+        return self.default_zone
+
+    def zone(self, lat: float, lon: float) -> int:
+        """Seismic zone at (lat, lon)."""
+        row = (lat - self.lat0) / self.cell_deg
+        col = (lon - self.lon0) / self.cell_deg
+        # Written so NaN coordinates fall through to the default zone.
+        if not (0 <= row < self._rows and 0 <= col < self._cols):
+            return self.default_zone
+        r, c = int(row), int(col)
+        if self.zone_boxes and min(row - r, col - c, r + 1 - row, c + 1 - col) < _GRID_LINE_TOL:
+            return self._box_zone(lat, lon)
+        zone = self._cells[r][c]
+        return zone if zone >= 0 else self._box_zone(lat, lon)
+
+    def zones(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        """Vectorized :meth:`zone` over coordinate arrays (int8)."""
+        shape = np.shape(lats)
+        lats = np.asarray(lats, dtype=np.float64).ravel()
+        lons = np.asarray(lons, dtype=np.float64).ravel()
+        zones = np.full(lats.shape, self.default_zone, dtype=np.int8)
+        with np.errstate(invalid="ignore"):
+            row = (lats - self.lat0) / self.cell_deg
+            col = (lons - self.lon0) / self.cell_deg
+            covered = np.flatnonzero((row >= 0) & (row < self._rows) & (col >= 0) & (col < self._cols))
+        row, col = row[covered], col[covered]
+        r, c = np.floor(row), np.floor(col)
+        zones[covered] = self.raster[r.astype(np.intp), c.astype(np.intp)]
+        exact = zones < 0
+        if self.zone_boxes:
+            on_line = np.minimum(np.minimum(row - r, r + 1 - row), np.minimum(col - c, c + 1 - col))
+            exact[covered[on_line < _GRID_LINE_TOL]] = True
+        if exact.any():
+            zones[exact] = self._box_zones(lats[exact], lons[exact])
+        return zones.reshape(shape)
+
+    def _box_zones(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        zones = np.full(lats.shape, self.default_zone, dtype=np.int8)
+        # Paint lower zones first so higher zones win where boxes overlap.
+        for zone in sorted(self.zone_boxes):
+            for min_lon, min_lat, max_lon, max_lat in self.zone_boxes[zone]:
+                zones[(lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)] = zone
+        return zones
+
+
+def _region(spec: Dict, home: Path) -> Region:
+    name = spec["name"]
+    root = home / spec.get("root", f"regions/{name}")
+    return Region(
+        name=name,
+        label=spec.get("label", name.title()),
+        bbox={k: float(v) for k, v in spec["bbox"].items()},
+        root=root,
+        # Regions that share a model set point "models" at the same directory.
+        models_dir=home / spec["models"] if "models" in spec else root / "models",
+        zone_boxes={int(z): [tuple(map(float, b)) for b in boxes] for z, boxes in spec.get("zone_boxes", {}).items()},
+        default_zone=int(spec.get("default_zone", 2)),
+        cell_deg=float(spec.get("cell_deg", 0.5)),
+        spec=spec,
+    )
+
+
+def load_regions(path: Path = REGIONS_PATH, home: Path = HOME) -> Dict[str, Region]:
+    specs = json.loads(Path(path).read_text())
+    if not specs:
+        raise ValueError(f"No regions defined in {path}")
+    regions: Dict[str, Region] = {}
+    for spec in specs:
+        if spec["name"] in regions:
+            raise ValueError(f"Region {spec['name']!r} is defined twice in {path}")
+        regions[spec["name"]] = _region(spec, home)
+    return regions
+
+
+REGIONS: Dict[str, Region] = load_regions()
+DEFAULT_REGION: Region = next(iter(REGIONS.values()))
+# Smallest first, so nested regions win the overlap.
+_ROUTING = sorted(REGIONS.values(), key=lambda region: region.area)
+
+
+def get_region(name: Optional[str] = None) -> Region:
+    """Region by name (default: the default region); KeyError for unknown names."""
+    if name is None:
+        return DEFAULT_REGION
+    if name not in REGIONS:
+        raise KeyError(f"Unknown region: {name}")
+    return REGIONS[name]
+
+
+_ACTIVE = get_region(os.environ.get("EQ_REGION") or None)
+
+
+def active_region() -> Region:
+    """The region this process works on offline (``EQ_REGION``, default: the default region)."""
+    return _ACTIVE
+
+
+def region_for(lat: float, lon: float) -> Region:
+    """The region serving (lat, lon)."""
+    for region in _ROUTING:
+        if region.contains(lat, lon):
+            return region
+    return DEFAULT_REGION
+
+
+def regions_for(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Vectorized :func:`region_for`: the region name of every point (object array)."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    names = np.full(lats.shape, DEFAULT_REGION.name, dtype=object)
+    unrouted = np.ones(lats.shape, dtype=bool)
+    for region in _ROUTING:
+        bbox = region.bbox
+        mask = (
+            unrouted
+            & (lats >= bbox["minlatitude"])
+            & (lats <= bbox["maxlatitude"])
+            & (lons >= bbox["minlongitude"])
+            & (lons <= bbox["maxlongitude"])
+        )
+        names[mask] = region.name
+        unrouted &= ~mask
+    return names
+
+
+def model_regions() -> List[Region]:
+    """One region per distinct model set, in definition order."""
+    owners: Dict[Path, Region] = {}
+    for region in REGIONS.values():
+        owners.setdefault(region.models_dir, region)
+    return list(owners.values())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="List the configured regions")
+    parser.add_argument("--points", type=int, default=100_000, help="Random points for the zone lookup timing")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+    for region in REGIONS.values():
+        bbox = region.bbox
+        lats = rng.uniform(bbox["minlatitude"], bbox["maxlatitude"], args.points)
+        lons = rng.uniform(bbox["minlongitude"], bbox["maxlongitude"], args.points)
+        start = time.perf_counter()
+        region.zones(lats, lons)
+        vectorized = time.perf_counter() - start
+        start = time.perf_counter()
+        for lat, lon in zip(lats[:10_000].tolist(), lons[:10_000].tolist()):
+            region.zone(lat, lon)
+        scalar = (time.perf_counter() - start) / min(args.points, 10_000)
+        edge_share = float((region.raster < 0).mean()) if region.raster.size else 0.0
+        default = " (default)" if region is DEFAULT_REGION else ""
+        print(
+            f"{region.name}{default}: {region.label}, bbox {bbox}, root {region.root}, models {region.models_dir}\n"
+            f"   zone raster {region.raster.shape} at {region.cell_deg} deg, {edge_share:.0%} edge cells; "
+            f"{vectorized / args.points * 1e9:.0f} ns/point vectorized, {scalar * 1e9:.0f} ns/point scalar"
+        )
+
+
+if __name__ == "__main__":
+    main()
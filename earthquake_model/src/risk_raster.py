@@ -0,0 +1,481 @@
+from __future__ import annotations
+
+import argparse
+import json
+import math
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src import instrumentation
+from src.alert_classifier import ALERT_LEVELS, classify_alerts
+from src.feature_engineering import FeatureConfig, assign_seismic_zones, haversine_km_array
+from src.regions import active_region
+from src.train_lstm import FEATURES as LSTM_FEATURES
+from src.train_lstm import SEQUENCE_LENGTH
+from src.train_xgboost import FEATURES
+
+RASTER_PATH = Path("data/processed/risk_raster.npz")
+MAX_TILE_ZOOM = 24
+KM_PER_DEGREE = 111.195
+
+# Column order of the per-zone context table stored alongside the raster.
+ZONE_CONTEXT_FIELDS = [
+    "prev_magnitude",
+    "days_since_last_quake",
+    "quake_count_30d",
+    "avg_magnitude_30d",
+    "max_magnitude_30d",
+    "month",
+]
+
+RASTER_CACHE: Dict[str, object] = {}
+
+
+@dataclass
+class RiskRaster:
+    """
+    Predicted magnitude and alert level over a regular lat/lon grid.
+
+    Row 0 is the southernmost row and column 0 the westernmost column; cell
+    (i, j) is centred on ``min_lat + (i + 0.5) * resolution``,
+    ``min_lon + (j + 0.5) * resolution``.
+    """
+
+    min_lat: float
+    min_lon: float
+    resolution: float
+    depth_km: float
+    as_of: pd.Timestamp
+    magnitude: np.ndarray
+    alert: np.ndarray
+    zone: np.ndarray
+    count_7d: np.ndarray
+    zone_context: Dict[int, Dict[str, float]] = field(default_factory=dict)
+    lstm_by_zone: Dict[int, float] = field(default_factory=dict)
+    version: int = 1
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.magnitude.shape
+
+    def cell_centres(self) -> Tuple[np.ndarray, np.ndarray]:
+        rows, cols = self.shape
+        lats = self.min_lat + (np.arange(rows) + 0.5) * self.resolution
+        lons = self.min_lon + (np.arange(cols) + 0.5) * self.resolution
+        return lats, lons
+
+    def window(
+        self, min_lat: float, max_lat: float, min_lon: float, max_lon: float
+    ) -> Tuple[slice, slice]:
+        """Row/column slices of the cells whose centres fall inside the box."""
+        rows, cols = self.shape
+        r0 = max(0, math.ceil((min_lat - self.min_lat) / self.resolution - 0.5))
+        r1 = min(rows, math.floor((max_lat - self.min_lat) / self.resolution - 0.5) + 1)
+        c0 = max(0, math.ceil((min_lon - self.min_lon) / self.resolution - 0.5))
+        c1 = min(cols, math.floor((max_lon - self.min_lon) / self.resolution - 0.5) + 1)
+        return slice(r0, max(r0, r1)), slice(c0, max(c0, c1))
+
+
+def make_grid(
+    resolution: float, bbox: Optional[Dict[str, float]] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    bbox = bbox or active_region().bbox
+    rows = int(round((bbox["maxlatitude"] - bbox["minlatitude"]) / resolution))
+    cols = int(round((bbox["maxlongitude"] - bbox["minlongitude"]) / resolution))
+    lats = bbox["minlatitude"] + (np.arange(rows) + 0.5) * resolution
+    lons = bbox["minlongitude"] + (np.arange(cols) + 0.5) * resolution
+    return lats, lons
+
+
+def load_catalog(path: Optional[Path] = None) -> pd.DataFrame:
+    """Load the event catalog used as context, sorted by time with zones assigned."""
+    if path is None:
+        path = Path("data/processed/features.csv")
+        if not path.exists():
+            path = Path("data/processed/usgs_india_clean.csv")
+    if not path.exists():
+        raise FileNotFoundError("Missing catalog. Run: python -m src.data_pipeline")
+    df = pd.read_csv(path, parse_dates=["time"])
+    return prepare_catalog(df)
+
+
+def prepare_catalog(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    df["time"] = pd.to_datetime(df["time"], utc=True, format="mixed")
+    df = df.sort_values("time").reset_index(drop=True)
+    df["seismic_zone"] = assign_seismic_zones(
+        df["latitude"].to_numpy(), df["longitude"].to_numpy()
+    ).astype(int)
+    # Gap to the previous event of the same zone, as in build_features.
+    gaps = df.groupby("seismic_zone")["time"].diff().dt.total_seconds() / 86400
+    df["days_since_last_quake"] = gaps.fillna(0.0)
+    return df
+
+
+def zone_context(
+    catalog: pd.DataFrame, zone: int, as_of: pd.Timestamp, config: FeatureConfig
+) -> Dict[str, float]:
+    """Zone-level features for a hypothetical event at ``as_of`` (build_features semantics)."""
+    past = catalog[(catalog["seismic_zone"] == zone) & (catalog["time"] <= as_of)]
+    context = {name: 0.0 for name in ZONE_CONTEXT_FIELDS}
+    context["month"] = float(as_of.month)
+    if past.empty:
+        return context
+    last = past.iloc[-1]
+    context["prev_magnitude"] = float(last["magnitude"])
+    context["days_since_last_quake"] = (as_of - last["time"]).total_seconds() / 86400
+    window = past[past["time"] >= as_of - pd.Timedelta(days=config.window_30d)]
+    context["quake_count_30d"] = float(len(window))
+    if not window.empty:
+        context["avg_magnitude_30d"] = float(window["magnitude"].mean())
+        context["max_magnitude_30d"] = float(window["magnitude"].max())
+    return context
+
+
+def count_nearby(
+    lats: np.ndarray,
+    lons: np.ndarray,
+    events: pd.DataFrame,
+    radius_km: float,
+) -> np.ndarray:
+    """
+    Number of ``events`` within ``radius_km`` of every grid cell.
+
+    Each event only touches the window of rows/columns its radius can reach,
+    so the cost scales with the number of events rather than the grid size.
+    """
+    counts = np.zeros((len(lats), len(lons)), dtype=np.int16)
+    if events.empty or len(lats) == 0 or len(lons) == 0:
+        return counts
+    resolution_lat = lats[1] - lats[0] if len(lats) > 1 else 1.0
+    resolution_lon = lons[1] - lons[0] if len(lons) > 1 else 1.0
+    dlat = radius_km / KM_PER_DEGREE
+    for lat, lon in zip(events["latitude"].to_numpy(), events["longitude"].to_numpy()):
+        r0 = max(0, int(np.searchsorted(lats, lat - dlat - resolution_lat)))
+        r1 = int(np.searchsorted(lats, lat + dlat + resolution_lat))
+        if r1 <= r0:
+            continue
+        widest = max(abs(lat) + dlat, 0.0)
+        dlon = dlat / max(math.cos(math.radians(min(widest, 89.0))), 1e-6)
+        c0 = max(0, int(np.searchsorted(lons, lon - dlon - resolution_lon)))
+        c1 = int(np.searchsorted(lons, lon + dlon + resolution_lon))
+        if c1 <= c0:
+            continue
+        grid_lat, grid_lon = np.meshgrid(lats[r0:r1], lons[c0:c1], indexing="ij")
+        within = haversine_km_array(lat, lon, grid_lat, grid_lon) <= radius_km
+        counts[r0:r1, c0:c1] += within.astype(np.int16)
+    return counts
+
+
+def _zone_lstm_predictions(
+    catalog: pd.DataFrame, zones: Iterable[int], as_of: pd.Timestamp
+) -> Dict[int, float]:
+    """One LSTM prediction per zone from its last ``SEQUENCE_LENGTH`` events."""
+    from src.predict import _load_lstm
+
+    lstm = _load_lstm()
+    if lstm is None:
+        return {}
+    zones = list(zones)
+    sequences = []
+    kept = []
+    past = catalog[catalog["time"] <= as_of]
+    for zone in zones:
+        zone_df = past[past["seismic_zone"] == zone].tail(SEQUENCE_LENGTH)
+        if len(zone_df) == SEQUENCE_LENGTH:
+            sequences.append(zone_df[LSTM_FEATURES].to_numpy(dtype=np.float32))
+            kept.append(zone)
+    if not sequences:
+        return {}
+    with instrumentation.span("raster_lstm_predict"):
+        preds = lstm.predict(np.stack(sequences), verbose=0).reshape(-1)
+    return {zone: float(pred) for zone, pred in zip(kept, preds)}
+
+
+def _evaluate_cells(
+    raster: RiskRaster, rows: np.ndarray, cols: np.ndarray
+) -> None:
+    """Run the model stack on the given cells and write the results in place."""
+    from src.predict import predict_batch
+
+    if len(rows) == 0:
+        return
+    lats, lons = raster.cell_centres()
+    zones = raster.zone[rows, cols]
+    context = np.zeros((len(rows), len(ZONE_CONTEXT_FIELDS)), dtype=np.float32)
+    lstm_pred = np.full(len(rows), np.nan, dtype=np.float32)
+    for zone in np.unique(zones):
+        mask = zones == zone
+        ctx = raster.zone_context[int(zone)]
+        context[mask] = [ctx[name] for name in ZONE_CONTEXT_FIELDS]
+        if int(zone) in raster.lstm_by_zone:
+            lstm_pred[mask] = raster.lstm_by_zone[int(zone)]
+
+    columns = {
+        "latitude": lats[rows],
+        "longitude": lons[cols],
+        "depth_km": np.full(len(rows), raster.depth_km),
+        "quake_count_7d": raster.count_7d[rows, cols],
+        "seismic_zone": zones,
+        **{name: context[:, i] for i, name in enumerate(ZONE_CONTEXT_FIELDS)},
+    }
+    x_input = np.column_stack([columns[name] for name in FEATURES]).astype(np.float32)
+    magnitude, _ = predict_batch(x_input, lstm_pred)
+    raster.magnitude[rows, cols] = magnitude.astype(np.float16)
+    raster.alert[rows, cols] = classify_alerts(magnitude, zones)
+
+
+def build_raster(
+    catalog: pd.DataFrame,
+    resolution: float = 0.1,
+    depth_km: float = 10.0,
+    as_of: Optional[pd.Timestamp] = None,
+    bbox: Optional[Dict[str, float]] = None,
+    config: Optional[FeatureConfig] = None,
+) -> RiskRaster:
+    """Evaluate the model stack for a hypothetical event in every grid cell."""
+    config = config or FeatureConfig()
+    bbox = bbox or active_region().bbox
+    as_of = pd.Timestamp(as_of) if as_of is not None else catalog["time"].max()
+    if as_of.tzinfo is None:
+        as_of = as_of.tz_localize("UTC")
+
+    lats, lons = make_grid(resolution, bbox)
+    grid_lat, grid_lon = np.meshgrid(lats, lons, indexing="ij")
+    with instrumentation.span("raster_zones"):
+        zones = assign_seismic_zones(grid_lat, grid_lon)
+    recent = catalog[
+        (catalog["time"] <= as_of)
+        & (catalog["time"] >= as_of - pd.Timedelta(days=config.window_7d))
+    ]
+    with instrumentation.span("raster_count_7d"):
+        count_7d = count_nearby(lats, lons, recent, config.radius_km)
+
+    present = sorted(int(z) for z in np.unique(zones))
+    raster = RiskRaster(
+        min_lat=bbox["minlatitude"],
+        min_lon=bbox["minlongitude"],
+        resolution=resolution,
+        depth_km=depth_km,
+        as_of=as_of,
+        magnitude=np.zeros(zones.shape, dtype=np.float16),
+        alert=np.zeros(zones.shape, dtype=np.int8),
+        zone=zones,
+        count_7d=count_7d,
+        zone_context={zone: zone_context(catalog, zone, as_of, config) for zone in present},
+        lstm_by_zone=_zone_lstm_predictions(catalog, present, as_of),
+    )
+    rows, cols = np.indices(zones.shape)
+    with instrumentation.span("raster_evaluate"):
+        _evaluate_cells(raster, rows.ravel(), cols.ravel())
+    return raster
+
+
+def update_raster(
+    raster: RiskRaster,
+    catalog: pd.DataFrame,
+    new_events: pd.DataFrame,
+    config: Optional[FeatureConfig] = None,
+) -> Tuple[RiskRaster, pd.DataFrame, int]:
+    """
+    Fold ``new_events`` into the raster, re-evaluating only affected cells.
+
+    A cell is affected when a new event lands in its zone (the zone-level
+    context changes) or when its 7-day / radius count changes. Zones without
+    new events keep the context of their last refresh; rebuild the raster
+    periodically to advance their clock. Returns the updated raster, the
+    merged catalog and the number of cells re-evaluated. Events already in
+    ``catalog`` (same time and location) are skipped, so overlapping feed
+    snapshots can be folded in repeatedly.
+    """
+    config = config or FeatureConfig()
+    if not new_events.empty:
+        new_events = prepare_catalog(new_events)
+        known = pd.MultiIndex.from_frame(catalog[["time", "latitude", "longitude"]])
+        incoming = pd.MultiIndex.from_frame(new_events[["time", "latitude", "longitude"]])
+        new_events = new_events[~incoming.isin(known)]
+    if new_events.empty:
+        return raster, catalog, 0
+    catalog = prepare_catalog(pd.concat([catalog, new_events], ignore_index=True))
+    as_of = max(raster.as_of, new_events["time"].max())
+
+    affected_zones = sorted(int(z) for z in new_events["seismic_zone"].unique())
+    for zone in affected_zones:
+        raster.zone_context[zone] = zone_context(catalog, zone, as_of, config)
+    raster.lstm_by_zone.update(_zone_lstm_predictions(catalog, affected_zones, as_of))
+
+    lats, lons = raster.cell_centres()
+    recent = catalog[
+        (catalog["time"] <= as_of)
+        & (catalog["time"] >= as_of - pd.Timedelta(days=config.window_7d))
+    ]
+    with instrumentation.span("raster_count_7d"):
+        count_7d = count_nearby(lats, lons, recent, config.radius_km)
+    changed = np.isin(raster.zone, affected_zones) | (count_7d != raster.count_7d)
+    raster.count_7d = count_7d
+    raster.as_of = as_of
+    raster.version += 1
+
+    rows, cols = np.nonzero(changed)
+    with instrumentation.span("raster_evaluate"):
+        _evaluate_cells(raster, rows, cols)
+    return raster, catalog, int(len(rows))
+
+
+def save_raster(raster: RiskRaster, path: Path = RASTER_PATH) -> Path:
+    meta = {
+        "min_lat": raster.min_lat,
+        "min_lon": raster.min_lon,
+        "resolution": raster.resolution,
+        "depth_km": raster.depth_km,
+        "as_of": raster.as_of.isoformat(),
+        "zone_context": {str(k): v for k, v in raster.zone_context.items()},
+        "lstm_by_zone": {str(k): v for k, v in raster.lstm_by_zone.items()},
+        "version": raster.version,
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("wb") as fh:
+        np.savez_compressed(
+            fh,
+            magnitude=raster.magnitude,
+            alert=raster.alert,
+            zone=raster.zone,
+            count_7d=raster.count_7d,
+            meta=np.array(json.dumps(meta)),
+        )
+    return path
+
+
+def catalog_path(raster_path: Path = RASTER_PATH) -> Path:
+    """Where ``--update`` keeps the catalog with every folded-in event, next to the raster."""
+    return raster_path.with_name(f"{raster_path.stem}_catalog.csv")
+
+
+def load_raster(path: Path = RASTER_PATH) -> RiskRaster:
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data["meta"]))
+        return RiskRaster(
+            min_lat=meta["min_lat"],
+            min_lon=meta["min_lon"],
+            resolution=meta["resolution"],
+            depth_km=meta["depth_km"],
+            as_of=pd.Timestamp(meta["as_of"]),
+            magnitude=data["magnitude"],
+            alert=data["alert"],
+            zone=data["zone"],
+            count_7d=data["count_7d"],
+            zone_context={int(k): v for k, v in meta["zone_context"].items()},
+            lstm_by_zone={int(k): v for k, v in meta["lstm_by_zone"].items()},
+            version=meta["version"],
+        )
+
+
+def get_raster(path: Path = RASTER_PATH) -> Optional[RiskRaster]:
+    """Cached :func:`load_raster` that reloads when the file on disk changes."""
+    if not path.exists():
+        return None
+    mtime = path.stat().st_mtime_ns
+    cached = RASTER_CACHE.get(str(path))
+    if cached is not None and cached[0] == mtime:
+        instrumentation.record_cache("risk_raster", hit=True)
+        return cached[1]
+    instrumentation.record_cache("risk_raster", hit=False)
+    raster = load_raster(path)
+    RASTER_CACHE[str(path)] = (mtime, raster)
+    return raster
+
+
+def raster_region(
+    raster: RiskRaster,
+    min_lat: float,
+    max_lat: float,
+    min_lon: float,
+    max_lon: float,
+    stride: int = 1,
+) -> Dict:
+    """JSON-ready sub-rectangle of the raster, optionally decimated by ``stride``."""
+    rows, cols = raster.window(min_lat, max_lat, min_lon, max_lon)
+    stride = max(1, int(stride))
+    rows = slice(rows.start, rows.stop, stride)
+    cols = slice(cols.start, cols.stop, stride)
+    magnitude = raster.magnitude[rows, cols].astype(np.float64)
+    alert = raster.alert[rows, cols]
+    lats, lons = raster.cell_centres()
+    return {
+        "as_of": raster.as_of.isoformat(),
+        "version": raster.version,
+        "resolution": raster.resolution * stride,
+        "depth_km": raster.depth_km,
+        "latitudes": np.round(lats[rows], 4).tolist(),
+        "longitudes": np.round(lons[cols], 4).tolist(),
+        "alert_levels": list(ALERT_LEVELS),
+        "predicted_magnitude": np.round(magnitude, 2).tolist(),
+        "alert_level": alert.tolist(),
+    }
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(min_lat, max_lat, min_lon, max_lon) of a Web Mercator slippy-map tile; ValueError if it does not exist."""
+    if not 0 <= z <= MAX_TILE_ZOOM:
+        raise ValueError(f"Tile zoom must be between 0 and {MAX_TILE_ZOOM}, got {z}")
+    n = 2 ** z
+    if not (0 <= x < n and 0 <= y < n):
+        raise ValueError(f"Tile {z}/{x}/{y} is outside the zoom {z} grid (0..{n - 1})")
+    min_lon = x / n * 360.0 - 180.0
+    max_lon = (x + 1) / n * 360.0 - 180.0
+    max_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    min_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return min_lat, max_lat, min_lon, max_lon
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the risk raster of the active region")
+    parser.add_argument("--resolution", type=float, default=0.1, help="Cell size in degrees")
+    parser.add_argument("--depth-km", type=float, default=10.0)
+    parser.add_argument("--as-of", default=None, help="Evaluation time (default: latest event)")
+    parser.add_argument("--catalog", type=Path, default=None)
+    parser.add_argument(
+        "--update",
+        type=Path,
+        default=None,
+        help="CSV of new events to fold into the existing raster",
+    )
+    parser.add_argument("--output", type=Path, default=RASTER_PATH)
+    args = parser.parse_args()
+
+    merged_path = catalog_path(args.output)
+    if args.update is not None and args.output.exists():
+        # Earlier updates' events live in the merged catalog, not in the source one.
+        catalog = load_catalog(merged_path if merged_path.exists() else args.catalog)
+        raster = load_raster(args.output)
+        new_events = pd.read_csv(args.update).rename(columns={"depth": "depth_km", "mag": "magnitude"})
+        raster, catalog, changed = update_raster(raster, catalog, new_events)
+        if changed or not merged_path.exists():
+            catalog.to_csv(merged_path, index=False)
+        print(f"Re-evaluated {changed} of {raster.magnitude.size} cells")
+    else:
+        catalog = load_catalog(args.catalog)
+        # A rebuild starts from the source catalog again.
+        merged_path.unlink(missing_ok=True)
+        raster = build_raster(
+            catalog,
+            resolution=args.resolution,
+            depth_km=args.depth_km,
+            as_of=pd.Timestamp(args.as_of) if args.as_of else None,
+        )
+    path = save_raster(raster, args.output)
+    rows, cols = raster.shape
+    levels = np.bincount(raster.alert.ravel(), minlength=len(ALERT_LEVELS))
+    print(f"Saved {rows}x{cols} risk raster (as of {raster.as_of}) to {path}")
+    print("   " + ", ".join(f"{name}: {count}" for name, count in zip(ALERT_LEVELS, levels)))
+    for stage, stats in instrumentation.snapshot()["stages"].items():
+        if stage.startswith("raster_") or stage.endswith("_batch"):
+            print(f"   {stage}: {stats['mean_s'] * stats['count']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Sliding-window sequence builder shared by the LSTM and fusion trainers."""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+@dataclass
+class SequenceSet:
+    """
+    Per-zone windows over a catalog without copying them.
+
+    ``values`` holds the feature rows once, grouped by zone and sorted by time,
+    as float32. ``windows`` is a strided view over it where ``windows[s]`` is
+    the ``length`` rows starting at ``s``; ``starts`` lists only the starts
+    whose window stays inside one zone, so sample ``i`` is
+    ``windows[starts[i]]`` with target ``targets[i]``. ``rows`` is the
+    positional index in the source frame of each sample's target row, for
+    aligning other per-row predictions with the samples.
+    """
+
+    values: np.ndarray
+    starts: np.ndarray
+    targets: np.ndarray
+    rows: np.ndarray
+    length: int
+
+    @property
+    def windows(self) -> np.ndarray:
+        return sliding_window_view(self.values, (self.length, self.values.shape[1]))[:, 0]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @property
+    def window_nbytes(self) -> int:
+        """Bytes the windows would take if every one were materialized."""
+        return len(self) * self.length * self.values.shape[1] * self.values.itemsize
+
+    def subset(self, index: np.ndarray) -> "SequenceSet":
+        """Samples at ``index``, sharing the same feature rows."""
+        return SequenceSet(self.values, self.starts[index], self.targets[index], self.rows[index], self.length)
+
+    def split(self, test_size: float = 0.2, seed: int = 42) -> Tuple["SequenceSet", "SequenceSet"]:
+        """Random train/test split of the samples (same role as ``train_test_split``)."""
+        order = np.random.default_rng(seed).permutation(len(self))
+        n_test = int(np.ceil(len(self) * test_size))
+        return self.subset(np.sort(order[n_test:])), self.subset(np.sort(order[:n_test]))
+
+    def materialize(self) -> Tuple[np.ndarray, np.ndarray]:
+        """All windows as one contiguous float32 array, plus targets."""
+        return self.windows[self.starts], self.targets
+
+    def batches(
+        self, batch_size: int = 32, shuffle: bool = False, seed: Optional[int] = None
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Yield (windows, targets) batches, copying only one batch at a time."""
+        windows = self.windows
+        order = np.arange(len(self))
+        if shuffle:
+            np.random.default_rng(seed).shuffle(order)
+        for begin in range(0, len(order), batch_size):
+            index = order[begin : begin + batch_size]
+            yield windows[self.starts[index]], self.targets[index]
+
+    def dataset(self, batch_size: int = 32, shuffle: bool = False, seed: Optional[int] = None):
+        """Streaming ``tf.data.Dataset`` of batches with prefetching."""
+        import tensorflow as tf
+
+        epoch = [0]
+
+        def generate():
+            # A fresh shuffle each time Keras restarts the generator (every epoch).
+            epoch[0] += 1
+            yield from self.batches(batch_size, shuffle, None if seed is None else seed + epoch[0])
+
+        signature = (
+            tf.TensorSpec(shape=(None, self.length, self.values.shape[1]), dtype=tf.float32),
+            tf.TensorSpec(shape=(None,), dtype=tf.float32),
+        )
+        n_batches = -(-len(self) // batch_size)
+        dataset = tf.data.Dataset.from_generator(generate, output_signature=signature)
+        return dataset.apply(tf.data.experimental.assert_cardinality(n_batches)).prefetch(
+            tf.data.AUTOTUNE
+        )
+
+
+def build_sequence_set(
+    df: pd.DataFrame,
+    features: Sequence[str],
+    length: int,
+    target: str = "magnitude",
+    group: str = "seismic_zone",
+    order_by: str = "time",
+) -> SequenceSet:
+    """
+    Index every ``length``-row window inside each ``group`` (ordered by
+    ``order_by``) whose next row supplies the target.
+    """
+    zones = df[group].to_numpy()
+    if order_by in df:
+        # Stable: by zone, then time, ties kept in file order.
+        order = np.lexsort((df[order_by].to_numpy(), zones))
+    else:
+        order = np.argsort(zones, kind="stable")
+    zones = zones[order]
+
+    values = np.ascontiguousarray(df[list(features)].to_numpy(dtype=np.float32)[order])
+    target_values = df[target].to_numpy(dtype=np.float32)[order]
+
+    # Sample j (target at sorted row j) needs the ``length`` rows before it in its zone.
+    boundaries = np.flatnonzero(zones[1:] != zones[:-1]) + 1
+    zone_start = np.zeros(len(order), dtype=np.int64)
+    if len(order):
+        zone_start[boundaries] = boundaries
+        zone_start = np.maximum.accumulate(zone_start)
+    target_rows = np.flatnonzero(np.arange(len(order)) - zone_start >= length)
+
+    return SequenceSet(
+        values=values,
+        starts=target_rows - length,
+        targets=target_values[target_rows],
+        rows=order[target_rows],
+        length=length,
+    )
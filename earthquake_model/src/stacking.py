@@ -0,0 +1,208 @@
+"""
+Cached out-of-fold base-model predictions for training the fusion head.
+
+Base predictions are computed once per (feature store, XGBoost model, LSTM
+model) and stored in the feature store under
+``data/processed/base_predictions/<key>.npz``, where the key hashes the three
+files' contents plus the fold setup. They are aligned to the LSTM's per-zone
+sequence samples: entry ``i`` pairs both base models' predictions for the
+event at feature-store row ``rows[i]``. Retraining a base model changes its
+file hash, so the next fusion run recomputes instead of reusing stale
+predictions.
+
+With ``folds > 1`` every prediction is out-of-fold: fold models with the
+base models' recorded training settings are fit on the other folds, so the
+fusion head learns from predictions as unseen as the ones it gets at serving
+time. Folds are contiguous blocks of time, and rows whose inputs carry a
+held-out target (see :func:`time_folds`) are left out of the fit set.
+``folds=0`` uses the trained base models directly (in-sample, faster).
+
+    python -m src.stacking --folds 5
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.catalog import read_catalog
+from src.feature_engineering import FeatureConfig
+from src.sequences import SequenceSet
+from src.train_lstm import SEQUENCE_LENGTH, build_model, sequence_set
+from src.train_xgboost import FEATURES, N_ESTIMATORS, PARAMS
+
+FEATURES_PATH = Path("data/processed/features.csv")
+CACHE_DIR = Path("data/processed/base_predictions")
+XGB_PATH = Path("models/xgb_model.json")
+LSTM_PATH = Path("models/lstm_model.keras")
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(features_path: Path, xgb_path: Path, lstm_path: Path, folds: int) -> Dict[str, str]:
+    hashes = {
+        "features": file_digest(features_path),
+        "xgb_model": file_digest(xgb_path),
+        "lstm_model": file_digest(lstm_path),
+        "folds": f"{folds}-time",
+    }
+    hashes["key"] = hashlib.sha256(json.dumps(hashes, sort_keys=True).encode()).hexdigest()[:16]
+    return hashes
+
+
+def _recorded(metrics_path: Path) -> Dict:
+    return json.loads(metrics_path.read_text()) if metrics_path.exists() else {}
+
+
+def time_folds(
+    df: pd.DataFrame, samples: SequenceSet, folds: int, gap: int = SEQUENCE_LENGTH
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Contiguous time-ordered folds: (fit mask over ``df`` rows, scored sample index) pairs.
+
+    A held-out event's magnitude is an input of later events: the
+    ``prev_magnitude`` and 30-day statistics of its zone, and the LSTM windows
+    of the next ``gap`` events in its zone. Those rows are purged from the fit
+    set too, so no fold model has seen a scored target through its inputs.
+    """
+    times = pd.to_datetime(df["time"], utc=True).to_numpy("datetime64[ns]")
+    zones = df["seismic_zone"].to_numpy()
+    embargo = np.timedelta64(FeatureConfig().window_30d, "D")
+    zone_rows = {zone: np.flatnonzero(zones == zone) for zone in np.unique(zones)}
+    zone_rows = {zone: rows[np.argsort(times[rows], kind="stable")] for zone, rows in zone_rows.items()}
+    order = np.argsort(times[samples.rows], kind="stable")
+    for score_idx in np.array_split(order, folds):
+        score_rows = samples.rows[score_idx]
+        excluded = np.zeros(len(df), dtype=bool)
+        excluded[score_rows] = True
+        end = times[score_rows].max()
+        excluded |= (times > end) & (times <= end + embargo)
+        for zone in np.unique(zones[score_rows]):
+            rows = zone_rows[zone]
+            after = np.searchsorted(times[rows], end, side="right")
+            excluded[rows[after : after + gap]] = True
+        yield ~excluded, np.sort(score_idx)
+
+
+def _xgb_oof(df: pd.DataFrame, samples: SequenceSet, folds: int, xgb_path: Path) -> np.ndarray:
+    from xgboost import XGBRegressor
+
+    recorded = _recorded(xgb_path.with_name("xgb_metrics.json"))
+    params = recorded.get("params", PARAMS)
+    n_estimators = recorded.get("n_estimators", N_ESTIMATORS)
+    X = df[FEATURES].fillna(0.0).to_numpy(dtype=np.float32)
+    y = df["magnitude"].to_numpy(dtype=np.float32)
+    # Folds over the aligned samples' rows so every fold model is blind to the rows it scores.
+    predictions = np.empty(len(samples), dtype=np.float32)
+    for fit_rows, score_idx in time_folds(df, samples, folds):
+        model = XGBRegressor(n_estimators=n_estimators, **params)
+        model.fit(X[fit_rows], y[fit_rows])
+        predictions[score_idx] = model.predict(X[samples.rows[score_idx]])
+    return predictions
+
+
+def _lstm_oof(df: pd.DataFrame, samples: SequenceSet, folds: int, lstm_path: Path) -> np.ndarray:
+    recorded = _recorded(lstm_path.with_name("lstm_metrics.json"))
+    epochs = int(recorded.get("epochs", 10))
+    batch_size = int(recorded.get("batch_size", 32))
+    predictions = np.empty(len(samples), dtype=np.float32)
+    for fit_rows, score_idx in time_folds(df, samples, folds):
+        fit_idx = np.flatnonzero(fit_rows[samples.rows])
+        model = build_model()
+        model.fit(
+            samples.subset(fit_idx).dataset(batch_size, shuffle=True, seed=42),
+            epochs=epochs,
+            shuffle=False,
+            verbose=0,
+        )
+        predictions[score_idx] = model.predict(
+            samples.subset(score_idx).dataset(4096), verbose=0
+        ).reshape(-1)
+    return predictions
+
+
+def compute_base_predictions(
+    df: pd.DataFrame, folds: int, xgb_path: Path = XGB_PATH, lstm_path: Path = LSTM_PATH
+) -> Dict[str, np.ndarray]:
+    """Base predictions aligned to the LSTM's per-zone sequence samples."""
+    samples = sequence_set(df)
+    if folds > 1:
+        xgb_pred = _xgb_oof(df, samples, folds, xgb_path)
+        lstm_pred = _lstm_oof(df, samples, folds, lstm_path)
+    else:
+        from tensorflow.keras.models import load_model
+        from xgboost import XGBRegressor
+
+        xgb = XGBRegressor()
+        xgb.load_model(xgb_path)
+        xgb_pred = xgb.predict(df[FEATURES].fillna(0.0).values)[samples.rows]
+        lstm_pred = load_model(lstm_path).predict(samples.dataset(4096), verbose=0).reshape(-1)
+    return {
+        "rows": samples.rows,
+        "xgb_pred": np.asarray(xgb_pred, dtype=np.float32),
+        "lstm_pred": np.asarray(lstm_pred, dtype=np.float32),
+        "target": samples.targets,
+        "seismic_zone": df["seismic_zone"].to_numpy()[samples.rows].astype(np.int8),
+    }
+
+
+def load_base_predictions(
+    folds: int = 5,
+    features_path: Path = FEATURES_PATH,
+    xgb_path: Path = XGB_PATH,
+    lstm_path: Path = LSTM_PATH,
+    cache_dir: Path = CACHE_DIR,
+    refresh: bool = False,
+) -> Dict[str, np.ndarray]:
+    """
+    Cached base predictions for the current feature store and base models,
+    computing (and replacing any stale cache entries) on a miss.
+    """
+    hashes = cache_key(features_path, xgb_path, lstm_path, folds)
+    path = cache_dir / f"{hashes['key']}.npz"
+    if path.exists() and not refresh:
+        with np.load(path) as cached:
+            print(f"Base predictions: cache hit {path}")
+            return dict(cached)
+
+    print(f"Base predictions: computing ({'%d-fold out-of-fold' % folds if folds > 1 else 'in-sample'})")
+    start = time.perf_counter()
+    df = read_catalog(features_path).to_frame()
+    predictions = compute_base_predictions(df, folds, xgb_path, lstm_path)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    for stale in cache_dir.glob("*.npz"):
+        stale.unlink()
+        stale.with_suffix(".json").unlink(missing_ok=True)
+    np.savez(path, **predictions)
+    meta = {**hashes, "samples": int(len(predictions["rows"])), "duration_s": time.perf_counter() - start}
+    path.with_suffix(".json").write_text(json.dumps(meta, indent=2))
+    print(f"   {meta['samples']} samples in {meta['duration_s']:.1f}s -> {path}")
+    return predictions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Precompute cached base-model predictions for fusion")
+    parser.add_argument("--folds", type=int, default=5, help="Out-of-fold folds (0 = in-sample)")
+    parser.add_argument("--refresh", action="store_true", help="Recompute even on a cache hit")
+    args = parser.parse_args()
+    for path in (FEATURES_PATH, XGB_PATH, LSTM_PATH):
+        if not path.exists():
+            raise FileNotFoundError(f"Missing {path}. Run feature engineering and train XGBoost and LSTM first.")
+    load_base_predictions(args.folds, refresh=args.refresh)
+
+
+if __name__ == "__main__":
+    main()
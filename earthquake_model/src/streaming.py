@@ -0,0 +1,355 @@
+"""
+Out-of-core training input: the feature store read in chunks.
+
+``data/processed/features.csv`` is written in time order by
+``build_features``, which lets every reader here work one chunk at a time:
+XGBoost through an external-memory ``DataIter``, Keras through prefetching
+``tf.data`` pipelines, and a time-based train/validation split whose cutoff is
+estimated from a bounded sample of timestamps.
+"""
+from __future__ import annotations
+
+import time
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import xgboost
+
+from src.sequences import SequenceSet, build_sequence_set
+
+FEATURES_PATH = Path("data/processed/features.csv")
+CACHE_DIR = Path("data/cache")
+DEFAULT_CHUNK_ROWS = 100_000
+PARTS = ("train", "val")
+
+
+class RowRate:
+    """Rows-per-second counter for a streaming pass."""
+
+    def __init__(self, label: str) -> None:
+        self.label = label
+        self.rows = 0
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+
+    def add(self, rows: int) -> None:
+        self.rows += int(rows)
+
+    def stop(self) -> None:
+        """Freeze the elapsed time, e.g. at the end of the pass being measured."""
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    @property
+    def rate(self) -> float:
+        elapsed = (self.end or time.perf_counter()) - self.start
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def report(self) -> str:
+        line = f"   {self.label}: {self.rows} rows at {self.rate:,.0f} rows/s"
+        print(line)
+        return line
+
+
+def iter_chunks(
+    path: Path = FEATURES_PATH,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    usecols: Optional[Sequence[str]] = None,
+) -> Iterator[pd.DataFrame]:
+    """Feature-store chunks with ``time`` parsed as UTC timestamps."""
+    if not path.exists():
+        raise FileNotFoundError(
+            "Missing features. Run: python -m src.feature_engineering"
+        )
+    columns = None if usecols is None else list(dict.fromkeys(["time", *usecols]))
+    for chunk in pd.read_csv(path, chunksize=chunk_rows, usecols=columns):
+        chunk["time"] = pd.to_datetime(chunk["time"], utc=True, format="mixed")
+        yield chunk
+
+
+def time_cutoff(
+    path: Path = FEATURES_PATH,
+    val_fraction: float = 0.2,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    sample_size: int = 100_000,
+    seed: int = 42,
+) -> pd.Timestamp:
+    """
+    Timestamp splitting the store into the oldest ``1 - val_fraction`` of rows
+    (train) and the newest ``val_fraction`` (validation).
+
+    The quantile comes from a uniform reservoir of at most ``sample_size``
+    timestamps, so memory does not grow with the catalog.
+    """
+    rng = np.random.default_rng(seed)
+    keys = np.empty(0)
+    times = np.empty(0, dtype=np.int64)
+    for chunk in iter_chunks(path, chunk_rows, usecols=[]):
+        stamps = chunk["time"].dropna().dt.tz_convert(None).to_numpy("datetime64[ns]").view(np.int64)
+        keys = np.concatenate([keys, rng.random(len(stamps))])
+        times = np.concatenate([times, stamps])
+        if len(keys) > sample_size:
+            # Keeping the smallest random keys is a uniform sample of everything seen.
+            keep = np.argpartition(keys, sample_size)[:sample_size]
+            keys, times = keys[keep], times[keep]
+    if len(times) == 0:
+        raise ValueError("Feature store is empty")
+    return pd.Timestamp(int(np.quantile(times, 1.0 - val_fraction)), tz="UTC")
+
+
+def part_mask(times: pd.Series, cutoff: pd.Timestamp, part: str) -> np.ndarray:
+    """Rows of ``part`` ("train": before ``cutoff``, "val": from it on)."""
+    if part not in PARTS:
+        raise ValueError(f"part must be one of {PARTS}")
+    before = (times < cutoff).to_numpy()
+    return before if part == "train" else ~before
+
+
+def _row_time(line: bytes) -> pd.Timestamp:
+    return pd.Timestamp(line.split(b",", 1)[0].decode()).tz_convert("UTC")
+
+
+def last_time(path: Path = FEATURES_PATH) -> pd.Timestamp:
+    """Timestamp of the newest row, read from the end of the file."""
+    with path.open("rb") as handle:
+        size = handle.seek(0, 2)
+        handle.seek(max(0, size - 65536))
+        lines = [line for line in handle.read().splitlines() if line.strip()]
+    if len(lines) < 2 and size <= 65536:
+        raise ValueError("Feature store is empty")
+    return _row_time(lines[-1])
+
+
+def last_time_before(
+    cutoff: pd.Timestamp, path: Path = FEATURES_PATH, chunk_rows: int = DEFAULT_CHUNK_ROWS
+) -> pd.Timestamp:
+    """Newest row before ``cutoff``: the ``trained_through`` watermark of a time-split model."""
+    latest = None
+    for chunk in iter_chunks(path, chunk_rows, usecols=[]):
+        times = chunk["time"][part_mask(chunk["time"], cutoff, "train")]
+        if len(times):
+            latest = times.max()
+        if len(times) < len(chunk):
+            break  # the store is time-ordered, so later chunks are all after the cutoff
+    if latest is None:
+        raise ValueError("No rows before the time cutoff to train on")
+    return latest
+
+
+def offset_after(path: Path, when: pd.Timestamp) -> int:
+    """
+    Byte offset of the first row newer than ``when``, found by bisecting the
+    time-ordered file, so finding new events costs O(log n) reads.
+    """
+    with path.open("rb") as handle:
+        header_end = len(handle.readline())
+        size = handle.seek(0, 2)
+
+        def line_start(pos: int) -> int:
+            # First line starting at or after ``pos``.
+            if pos <= header_end:
+                return header_end
+            handle.seek(pos - 1)
+            handle.readline()
+            return handle.tell()
+
+        lo, hi = header_end, size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = line_start(mid)
+            if start >= size:
+                hi = mid
+                continue
+            handle.seek(start)
+            if _row_time(handle.readline()) > when:
+                hi = mid
+            else:
+                lo = mid + 1
+        return line_start(lo)
+
+
+def read_since(
+    when: pd.Timestamp, path: Path = FEATURES_PATH, usecols: Optional[Sequence[str]] = None
+) -> pd.DataFrame:
+    """Rows newer than ``when``; only the tail of the file is read."""
+    with path.open("rb") as handle:
+        header = handle.readline().decode().strip().split(",")
+        handle.seek(offset_after(path, when))
+        df = pd.read_csv(handle, header=None, names=header, usecols=usecols)
+    df["time"] = pd.to_datetime(df["time"], utc=True, format="mixed")
+    return df
+
+
+class FeatureChunkIter(xgboost.DataIter):
+    """Feeds one split of the feature store to XGBoost chunk by chunk."""
+
+    def __init__(
+        self,
+        features: Sequence[str],
+        cutoff: pd.Timestamp,
+        part: str = "train",
+        path: Path = FEATURES_PATH,
+        chunk_rows: int = DEFAULT_CHUNK_ROWS,
+        target: str = "magnitude",
+        cache_dir: Path = CACHE_DIR,
+        weight: Optional[Callable[[pd.DataFrame], np.ndarray]] = None,
+    ) -> None:
+        """``weight`` maps a chunk (features and target) to per-row sample weights."""
+        self.features = list(features)
+        self.cutoff = cutoff
+        self.part = part
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.target = target
+        self.weight = weight
+        # ExtMemQuantileDMatrix reads the data several times; the rate covers the first pass.
+        self.rate = RowRate(f"xgboost {part} input")
+        self._first_pass = True
+        self._chunks: Optional[Iterator[pd.DataFrame]] = None
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        super().__init__(cache_prefix=str(cache_dir / f"xgb_{part}"))
+
+    def next(self, input_data) -> bool:
+        if self._chunks is None:
+            self._chunks = iter_chunks(self.path, self.chunk_rows, [*self.features, self.target])
+        for chunk in self._chunks:
+            chunk = chunk[part_mask(chunk["time"], self.cutoff, self.part)]
+            if chunk.empty:
+                continue
+            input_data(
+                data=chunk[self.features].fillna(0.0).to_numpy(dtype=np.float32),
+                label=chunk[self.target].to_numpy(dtype=np.float32),
+                weight=None if self.weight is None else self.weight(chunk),
+            )
+            if self._first_pass:
+                self.rate.add(len(chunk))
+            return True
+        if self._first_pass:
+            self.rate.stop()
+            self._first_pass = False
+        return False
+
+    def reset(self) -> None:
+        self._chunks = None
+
+
+def iter_sequence_chunks(
+    features: Sequence[str],
+    length: int,
+    path: Path = FEATURES_PATH,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    extra_columns: Sequence[str] = (),
+) -> Iterator[Tuple[SequenceSet, pd.DataFrame]]:
+    """
+    Per-zone sequences chunk by chunk, identical to building them over the
+    whole store at once.
+
+    The last ``length`` rows of every zone are carried into the next chunk so
+    windows spanning a chunk boundary are kept. Yields each chunk's samples
+    with the frame they index (``samples.rows`` are positions in it).
+    """
+    columns = list(dict.fromkeys([*features, "magnitude", "seismic_zone", *extra_columns]))
+    carried: Optional[pd.DataFrame] = None
+    for chunk in iter_chunks(path, chunk_rows, columns):
+        n_carried = 0 if carried is None else len(carried)
+        frame = chunk if carried is None else pd.concat([carried, chunk], ignore_index=True)
+        samples = build_sequence_set(frame, features, length)
+        samples = samples.subset(np.flatnonzero(samples.rows >= n_carried))
+        if len(samples):
+            yield samples, frame
+        order = np.lexsort((frame["time"].to_numpy(), frame["seismic_zone"].to_numpy()))
+        carried = frame.iloc[order].groupby("seismic_zone", sort=False).tail(length)
+
+
+def sequence_dataset(
+    features: Sequence[str],
+    length: int,
+    cutoff: pd.Timestamp,
+    part: str = "train",
+    batch_size: int = 32,
+    path: Path = FEATURES_PATH,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    shuffle_buffer: int = 0,
+    rate: Optional[RowRate] = None,
+):
+    """
+    ``tf.data`` pipeline of (window, target) batches for one time split.
+
+    Samples are assigned to a split by the time of their target event, and at
+    most one chunk of windows plus the shuffle buffer is held in memory.
+    """
+    import tensorflow as tf
+
+    def generate():
+        for samples, frame in iter_sequence_chunks(features, length, path, chunk_rows):
+            mask = part_mask(frame["time"].iloc[samples.rows], cutoff, part)
+            if mask.any():
+                windows, targets = samples.subset(np.flatnonzero(mask)).materialize()
+                if rate is not None:
+                    rate.add(len(targets))
+                yield windows, targets
+
+    signature = (
+        tf.TensorSpec(shape=(None, length, len(features)), dtype=tf.float32),
+        tf.TensorSpec(shape=(None,), dtype=tf.float32),
+    )
+    dataset = tf.data.Dataset.from_generator(generate, output_signature=signature).unbatch()
+    if shuffle_buffer:
+        dataset = dataset.shuffle(shuffle_buffer, reshuffle_each_iteration=True)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def append_rows(path: Path, rows: np.ndarray) -> None:
+    """Append float32 rows to a raw on-disk array (see ``open_rows``)."""
+    with path.open("ab") as handle:
+        handle.write(np.ascontiguousarray(rows, dtype=np.float32).tobytes())
+
+
+def open_rows(path: Path, n_columns: int) -> np.ndarray:
+    """Read-only memory map of a raw float32 array written by ``append_rows``."""
+    if not path.exists() or path.stat().st_size == 0:
+        return np.empty((0, n_columns), dtype=np.float32)
+    return np.memmap(path, dtype=np.float32, mode="r").reshape(-1, n_columns)
+
+
+def array_dataset(
+    x: np.ndarray,
+    y: np.ndarray,
+    batch_size: int = 32,
+    shuffle: bool = False,
+    seed: int = 42,
+    block_rows: int = DEFAULT_CHUNK_ROWS,
+):
+    """
+    ``tf.data`` batches over (possibly memory-mapped) arrays, reading one
+    block at a time; shuffling permutes blocks and rows inside each block.
+    """
+    import tensorflow as tf
+
+    epoch = [0]
+
+    def generate():
+        epoch[0] += 1
+        rng = np.random.default_rng(seed + epoch[0])
+        blocks: List[int] = list(range(0, len(x), block_rows))
+        if shuffle:
+            rng.shuffle(blocks)
+        for begin in blocks:
+            block_x = np.asarray(x[begin : begin + block_rows])
+            block_y = np.asarray(y[begin : begin + block_rows])
+            order = rng.permutation(len(block_x)) if shuffle else np.arange(len(block_x))
+            for start in range(0, len(order), batch_size):
+                index = order[start : start + batch_size]
+                yield block_x[index], block_y[index]
+
+    signature = (
+        tf.TensorSpec(shape=(None, x.shape[1]), dtype=tf.float32),
+        tf.TensorSpec(shape=(None,), dtype=tf.float32),
+    )
+    n_batches = sum(-(-min(block_rows, len(x) - begin) // batch_size) for begin in range(0, len(x), block_rows))
+    dataset = tf.data.Dataset.from_generator(generate, output_signature=signature)
+    return dataset.apply(tf.data.experimental.assert_cardinality(n_batches)).prefetch(
+        tf.data.AUTOTUNE
+    )
@@ -0,0 +1,156 @@
+"""
+Dependency-light runtime for the distilled student model.
+
+The student is a shallow gradient-boosted tree ensemble exported as flat
+node arrays in one JSON file. Evaluating it needs only numpy, so the same
+artifact runs in the API's "fast" mode and on IoT gateways that cannot carry
+TensorFlow or XGBoost.
+"""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+STUDENT_PATH = Path("models/student_model.json")
+
+
+class StudentModel:
+    """
+    Tree ensemble over flat arrays: node ``i`` splits on ``feature[i]`` at
+    ``threshold[i]`` (``x < threshold`` goes to ``left[i]``, otherwise
+    ``right[i]``; missing values follow ``missing[i]``) or, when
+    ``feature[i] < 0``, is a leaf worth ``value[i]``. The prediction is
+    ``base_score`` plus one leaf value per tree.
+    """
+
+    def __init__(
+        self,
+        features: Sequence[str],
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        missing: np.ndarray,
+        value: np.ndarray,
+        roots: np.ndarray,
+        base_score: float,
+        max_depth: int,
+        meta: Dict | None = None,
+    ) -> None:
+        self.features = list(features)
+        self.feature = np.asarray(feature, dtype=np.int16)
+        self.threshold = np.asarray(threshold, dtype=np.float32)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.missing = np.asarray(missing, dtype=np.int32)
+        self.value = np.asarray(value, dtype=np.float32)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.base_score = float(base_score)
+        self.max_depth = int(max_depth)
+        self.meta = meta or {}
+        self._is_leaf = self.feature < 0
+        self._split_feature = np.where(self._is_leaf, 0, self.feature)
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.feature, self.threshold, self.left, self.right, self.missing, self.value, self.roots)
+        return int(sum(a.nbytes for a in arrays))
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Magnitudes for rows of ``features`` (2-D array)."""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), self.n_trees)).copy()
+        # Every tree advances one level per step; leaves stay put.
+        for _ in range(self.max_depth):
+            x = X[rows, self._split_feature[node]]
+            step = np.where(x < self.threshold[node], self.left[node], self.right[node])
+            step = np.where(np.isnan(x), self.missing[node], step)
+            node = np.where(self._is_leaf[node], node, step)
+        return self.base_score + self.value[node].sum(axis=1)
+
+    def predict_row(self, row: Dict[str, float]) -> float:
+        x = np.array([[row.get(name, 0.0) or 0.0 for name in self.features]], dtype=np.float32)
+        return float(self.predict(x)[0])
+
+    def to_dict(self) -> Dict:
+        return {
+            "format": "tree-ensemble/v1",
+            "features": self.features,
+            "base_score": self.base_score,
+            "max_depth": self.max_depth,
+            "roots": self.roots.tolist(),
+            "feature": self.feature.tolist(),
+            "threshold": self.threshold.tolist(),
+            "left": self.left.tolist(),
+            "right": self.right.tolist(),
+            "missing": self.missing.tolist(),
+            "value": self.value.tolist(),
+            "meta": self.meta,
+        }
+
+    def save(self, path: Path = STUDENT_PATH) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_dict(), separators=(",", ":")))
+
+    @classmethod
+    def load(cls, path: Path = STUDENT_PATH) -> "StudentModel":
+        data = json.loads(Path(path).read_text())
+        return cls(
+            features=data["features"],
+            feature=data["feature"],
+            threshold=data["threshold"],
+            left=data["left"],
+            right=data["right"],
+            missing=data["missing"],
+            value=data["value"],
+            roots=data["roots"],
+            base_score=data["base_score"],
+            max_depth=data["max_depth"],
+            meta=data.get("meta"),
+        )
+
+
+def from_xgboost(booster, features: Sequence[str], meta: Dict | None = None) -> StudentModel:
+    """Flatten a trained XGBoost booster into a :class:`StudentModel`."""
+    trees = booster.trees_to_dataframe()
+    offsets: Dict[str, int] = {node_id: i for i, node_id in enumerate(trees["ID"])}
+    # Boosters fit on plain arrays name their features f0, f1, ...
+    index = {name: i for i, name in enumerate(features)}
+    index.update({f"f{i}": i for i in range(len(features))})
+    is_leaf = (trees["Feature"] == "Leaf").to_numpy()
+
+    def children(column: str) -> List[int]:
+        return [offsets[c] if isinstance(c, str) else -1 for c in trees[column]]
+
+    left = np.where(is_leaf, -1, children("Yes"))
+    right = np.where(is_leaf, -1, children("No"))
+    missing = np.where(is_leaf, -1, children("Missing"))
+    feature = np.where(is_leaf, -1, [index.get(f, -1) for f in trees["Feature"]])
+    learner = json.loads(booster.save_config())["learner"]
+    # Recent XGBoost versions store base_score as a bracketed vector string.
+    base_score = float(str(learner["learner_model_param"]["base_score"]).strip("[]"))
+    depth = int(learner["gradient_booster"]["tree_train_param"]["max_depth"])
+    roots = np.flatnonzero(trees["Node"].to_numpy() == 0)
+    return StudentModel(
+        features=features,
+        feature=feature,
+        threshold=trees["Split"].fillna(0.0).to_numpy(),
+        left=left,
+        right=right,
+        missing=missing,
+        value=np.where(is_leaf, trees["Gain"].to_numpy(), 0.0),
+        roots=roots,
+        base_score=base_score,
+        max_depth=depth,
+        meta=meta,
+    )
@@ -0,0 +1,365 @@
+from __future__ import annotations
+
+import argparse
+import math
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.feature_engineering import haversine_km_array
+from src.regions import DEFAULT_REGION, Region, region_for
+
+KM_PER_DEGREE = 111.195
+POPULATION_PATH = Path("data/processed/population_grid.csv")
+_PLACE_PREFIX = re.compile(r"^\s*\d+(\.\d+)?\s*km\s+[NSEW]{1,3}\s+of\s+", re.IGNORECASE)
+
+
+def shaking_radius_km(magnitude: float) -> float:
+    """
+    Radius of noticeable shaking for a magnitude.
+
+    Coarse log-linear rule of thumb (M4 ~ 10 km, M5 ~ 32 km, M6 ~ 100 km,
+    M7 ~ 316 km), clipped to [10, 500] km. Replace with an attenuation model
+    for production use.
+    """
+    return float(min(500.0, max(10.0, 10 ** (0.5 * magnitude - 1.0))))
+
+
+class GeoGridIndex:
+    """
+    Point index on a fixed lat/lon grid for radius queries.
+
+    Points live in struct-of-arrays form sorted by cell key
+    (``row * n_cols + col``), so the cells a query circle touches in one grid
+    row form one contiguous slice found with two binary searches. Inserts,
+    updates and removals go to a small delta dict and a tombstone mask and are
+    merged into the sorted arrays once the delta grows past ``compact_ratio``
+    of the base (or ``min_compact`` points), so bulk loads stay O(n log n) and
+    single updates O(1).
+    """
+
+    def __init__(
+        self, cell_deg: float = 0.1, compact_ratio: float = 0.005, min_compact: int = 4096
+    ) -> None:
+        self.cell_deg = cell_deg
+        self.n_cols = int(math.ceil(360.0 / cell_deg))
+        self.compact_ratio = compact_ratio
+        self.min_compact = min_compact
+        self._ids = np.empty(0, dtype=object)
+        self._lat = np.empty(0, dtype=np.float32)
+        self._lon = np.empty(0, dtype=np.float32)
+        self._weight = np.empty(0, dtype=np.float64)
+        self._keys = np.empty(0, dtype=np.int64)
+        self._alive = np.empty(0, dtype=bool)
+        self._slot_of: Dict[object, int] = {}
+        self._delta: Dict[object, Tuple[float, float, float]] = {}
+        self._delta_arrays: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return int(self._alive.sum()) + len(self._delta)
+
+    def __contains__(self, point_id: object) -> bool:
+        return point_id in self._delta or (
+            point_id in self._slot_of and self._alive[self._slot_of[point_id]]
+        )
+
+    def _cell_keys(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        rows = np.floor((np.asarray(lats, dtype=np.float64) + 90.0) / self.cell_deg).astype(np.int64)
+        cols = np.floor((np.asarray(lons, dtype=np.float64) + 180.0) / self.cell_deg).astype(np.int64)
+        return rows * self.n_cols + np.clip(cols, 0, self.n_cols - 1)
+
+    def bulk_load(
+        self,
+        ids: Sequence[object],
+        lats: Sequence[float],
+        lons: Sequence[float],
+        weights: Optional[Sequence[float]] = None,
+    ) -> None:
+        """Replace the index contents with the given points."""
+        with self._lock:
+            self._delta = {}
+            self._delta_arrays = None
+            self._rebuild(
+                np.asarray(ids, dtype=object),
+                np.asarray(lats, dtype=np.float32),
+                np.asarray(lons, dtype=np.float32),
+                np.ones(len(ids)) if weights is None else np.asarray(weights, dtype=np.float64),
+            )
+
+    def _rebuild(
+        self, ids: np.ndarray, lats: np.ndarray, lons: np.ndarray, weights: np.ndarray
+    ) -> None:
+        keys = self._cell_keys(lats, lons)
+        order = np.argsort(keys, kind="stable")
+        self._ids = ids[order]
+        self._lat = lats[order]
+        self._lon = lons[order]
+        self._weight = weights[order]
+        self._keys = keys[order]
+        self._alive = np.ones(len(order), dtype=bool)
+        self._slot_of = {point_id: slot for slot, point_id in enumerate(self._ids.tolist())}
+
+    def upsert_many(
+        self,
+        ids: Iterable[object],
+        lats: Iterable[float],
+        lons: Iterable[float],
+        weights: Optional[Iterable[float]] = None,
+    ) -> None:
+        ids = list(ids)
+        weights = [1.0] * len(ids) if weights is None else list(weights)
+        with self._lock:
+            for point_id, lat, lon, weight in zip(ids, lats, lons, weights):
+                slot = self._slot_of.get(point_id)
+                if slot is not None:
+                    self._alive[slot] = False
+                self._delta[point_id] = (float(lat), float(lon), float(weight))
+            self._delta_arrays = None
+            self._maybe_compact()
+
+    def upsert(self, point_id: object, lat: float, lon: float, weight: float = 1.0) -> None:
+        self.upsert_many([point_id], [lat], [lon], [weight])
+
+    def remove_many(self, ids: Iterable[object]) -> int:
+        removed = 0
+        with self._lock:
+            for point_id in ids:
+                if self._delta.pop(point_id, None) is not None:
+                    self._delta_arrays = None
+                    removed += 1
+                slot = self._slot_of.get(point_id)
+                if slot is not None and self._alive[slot]:
+                    self._alive[slot] = False
+                    removed += 1
+        return removed
+
+    def remove(self, point_id: object) -> bool:
+        return self.remove_many([point_id]) > 0
+
+    def _maybe_compact(self) -> None:
+        if len(self._delta) > max(self.min_compact, self.compact_ratio * len(self._keys)):
+            self.compact()
+
+    def compact(self) -> None:
+        """Merge the delta into the sorted arrays and drop tombstones."""
+        with self._lock:
+            alive = self._alive
+            delta_ids = list(self._delta)
+            delta = np.array(list(self._delta.values()), dtype=np.float64).reshape(-1, 3)
+            self._rebuild(
+                np.concatenate([self._ids[alive], np.array(delta_ids, dtype=object)]),
+                np.concatenate([self._lat[alive], delta[:, 0].astype(np.float32)]),
+                np.concatenate([self._lon[alive], delta[:, 1].astype(np.float32)]),
+                np.concatenate([self._weight[alive], delta[:, 2]]),
+            )
+            self._delta = {}
+            self._delta_arrays = None
+
+    def _delta_view(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Cached (ids, [lat, lon, weight] rows) view of the pending delta."""
+        if self._delta_arrays is None:
+            self._delta_arrays = (
+                np.array(list(self._delta), dtype=object),
+                np.array(list(self._delta.values()), dtype=np.float64).reshape(-1, 3),
+            )
+        return self._delta_arrays
+
+    def _candidate_slots(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        dlat = radius_km / KM_PER_DEGREE
+        widest = min(abs(lat) + dlat, 89.0)
+        dlon = min(180.0, dlat / max(math.cos(math.radians(widest)), 1e-6))
+        row0 = int(math.floor((lat - dlat + 90.0) / self.cell_deg))
+        row1 = int(math.floor((lat + dlat + 90.0) / self.cell_deg))
+        col0 = max(0, int(math.floor((lon - dlon + 180.0) / self.cell_deg)))
+        col1 = min(self.n_cols - 1, int(math.floor((lon + dlon + 180.0) / self.cell_deg)))
+        row_base = np.arange(row0, row1 + 1, dtype=np.int64) * self.n_cols
+        starts = np.searchsorted(self._keys, row_base + col0, side="left")
+        stops = np.searchsorted(self._keys, row_base + col1, side="right")
+        spans = [np.arange(a, b) for a, b in zip(starts, stops) if b > a]
+        if not spans:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(spans)
+
+    def _search(
+        self, lat: float, lon: float, radius_km: float
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Base slots and delta rows within the radius, with their distances."""
+        slots = self._candidate_slots(lat, lon, radius_km)
+        distances = np.empty(0)
+        if len(slots):
+            slots = slots[self._alive[slots]]
+            distances = haversine_km_array(lat, lon, self._lat[slots], self._lon[slots])
+            within = distances <= radius_km
+            slots, distances = slots[within], distances[within]
+        rows = np.empty(0, dtype=np.int64)
+        delta_distances = np.empty(0)
+        if self._delta:
+            _, values = self._delta_view()
+            delta_distances = haversine_km_array(lat, lon, values[:, 0], values[:, 1])
+            rows = np.nonzero(delta_distances <= radius_km)[0]
+            delta_distances = delta_distances[rows]
+        return slots, distances, rows, delta_distances
+
+    def query(self, lat: float, lon: float, radius_km: float) -> List[object]:
+        """Ids of all points within ``radius_km`` of (lat, lon)."""
+        with self._lock:
+            slots, _, rows, _ = self._search(lat, lon, radius_km)
+            ids = self._ids[slots].tolist()
+            if len(rows):
+                ids += self._delta_view()[0][rows].tolist()
+            return ids
+
+    def count(self, lat: float, lon: float, radius_km: float) -> int:
+        with self._lock:
+            slots, _, rows, _ = self._search(lat, lon, radius_km)
+            return int(len(slots) + len(rows))
+
+    def weight_within(self, lat: float, lon: float, radius_km: float) -> float:
+        """Sum of point weights (e.g. population) within ``radius_km``."""
+        with self._lock:
+            slots, _, rows, _ = self._search(lat, lon, radius_km)
+            total = float(self._weight[slots].sum())
+            if len(rows):
+                total += float(self._delta_view()[1][rows, 2].sum())
+            return total
+
+    def nearest(self, lat: float, lon: float, max_km: float = 500.0) -> Optional[object]:
+        """Closest point id within ``max_km`` (searches outwards by doubling)."""
+        radius = max(self.cell_deg * KM_PER_DEGREE, 10.0)
+        with self._lock:
+            while True:
+                slots, distances, rows, delta_distances = self._search(lat, lon, min(radius, max_km))
+                if len(slots) or len(rows):
+                    best_base = distances.min() if len(slots) else np.inf
+                    best_delta = delta_distances.min() if len(rows) else np.inf
+                    if best_base <= best_delta:
+                        return self._ids[slots[int(np.argmin(distances))]]
+                    return self._delta_view()[0][rows[int(np.argmin(delta_distances))]]
+                if radius >= max_km:
+                    return None
+                radius *= 2
+
+
+TARGETING_CACHE: Dict[str, object] = {}
+
+
+def _region_from_place(place: str) -> str:
+    return _PLACE_PREFIX.sub("", str(place)).strip()
+
+
+def _region_index(region: Region) -> Optional[Tuple[GeoGridIndex, np.ndarray, List[str]]]:
+    key = f"regions:{region.name}"
+    if key in TARGETING_CACHE:
+        return TARGETING_CACHE[key]
+    from src.predict import _load_training_data
+
+    data = _load_training_data(region)
+    result = None
+    if not data.empty and "place" in data:
+        # Region names are derived once per distinct place, not once per event.
+        rows = np.flatnonzero(np.asarray(data.place_code) >= 0)
+        names = [_region_from_place(p) for p in data.places]
+        index = GeoGridIndex(cell_deg=0.5)
+        index.bulk_load(range(len(rows)), data["latitude"][rows], data["longitude"][rows])
+        result = (index, np.asarray(data.place_code[rows]), names)
+    TARGETING_CACHE[key] = result
+    return result
+
+
+def region_name(lat: float, lon: float, max_km: float = 150.0, default: Optional[str] = None) -> str:
+    """
+    Name of the region around (lat, lon) from the nearest catalogued place of
+    the serving region, else ``default`` (that region's label).
+    """
+    region = region_for(lat, lon)
+    default = default or region.label
+    regions = _region_index(region)
+    if regions is None:
+        return default
+    index, codes, names = regions
+    nearest = index.nearest(lat, lon, max_km=max_km)
+    return names[codes[nearest]] if nearest is not None else default
+
+
+def _population_index() -> Optional[GeoGridIndex]:
+    if "population" in TARGETING_CACHE:
+        return TARGETING_CACHE["population"]
+    index = None
+    if POPULATION_PATH.exists():
+        cells = pd.read_csv(POPULATION_PATH)
+        index = GeoGridIndex(cell_deg=0.25)
+        index.bulk_load(
+            range(len(cells)),
+            cells["latitude"].to_numpy(),
+            cells["longitude"].to_numpy(),
+            cells["population"].to_numpy(),
+        )
+    TARGETING_CACHE["population"] = index
+    return index
+
+
+def population_within(lat: float, lon: float, radius_km: float) -> Optional[int]:
+    """Population of the grid cells within ``radius_km``, if a population grid is installed."""
+    index = _population_index()
+    if index is None:
+        return None
+    return int(round(index.weight_within(lat, lon, radius_km)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the device targeting index")
+    parser.add_argument("--devices", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--cell-deg", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    bbox = DEFAULT_REGION.bbox
+    # Devices clustered around a few hundred towns rather than spread uniformly.
+    towns_lat = rng.uniform(bbox["minlatitude"], bbox["maxlatitude"], 400)
+    towns_lon = rng.uniform(bbox["minlongitude"], bbox["maxlongitude"], 400)
+    town = rng.integers(0, 400, args.devices)
+    lats = towns_lat[town] + rng.normal(0, 0.3, args.devices)
+    lons = towns_lon[town] + rng.normal(0, 0.3, args.devices)
+    ids = [f"device-{i}" for i in range(args.devices)]
+
+    index = GeoGridIndex(cell_deg=args.cell_deg)
+    start = time.perf_counter()
+    index.bulk_load(ids, lats, lons)
+    print(f"Bulk load: {args.devices} devices in {time.perf_counter() - start:.2f}s")
+
+    for magnitude in (4.0, 5.0, 6.0, 7.0):
+        radius = shaking_radius_km(magnitude)
+        timings = []
+        hits = 0
+        for _ in range(args.queries):
+            q_lat = rng.uniform(bbox["minlatitude"], bbox["maxlatitude"])
+            q_lon = rng.uniform(bbox["minlongitude"], bbox["maxlongitude"])
+            t0 = time.perf_counter()
+            hits += index.count(q_lat, q_lon, radius)
+            timings.append(time.perf_counter() - t0)
+        timings.sort()
+        print(
+            f"   M{magnitude:.0f} (R={radius:.0f} km): p50 {timings[len(timings) // 2] * 1e3:.3f} ms  "
+            f"p99 {timings[int(len(timings) * 0.99)] * 1e3:.3f} ms  avg hits {hits / args.queries:.0f}"
+        )
+
+    batch = min(50_000, args.devices)
+    moved = rng.choice(args.devices, batch, replace=False)
+    start = time.perf_counter()
+    index.upsert_many([ids[i] for i in moved], lats[moved] + 0.01, lons[moved] + 0.01)
+    print(f"Update: {batch} devices in {time.perf_counter() - start:.2f}s")
+    start = time.perf_counter()
+    index.remove_many([ids[i] for i in moved[: batch // 2]])
+    print(f"Remove: {batch // 2} devices in {time.perf_counter() - start:.2f}s ({len(index)} remain)")
+
+
+if __name__ == "__main__":
+    main()
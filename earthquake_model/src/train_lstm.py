@@ -1,13 +1,18 @@
+import argparse
 import json
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, Optional, Tuple
 
 import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
 from tensorflow.keras import Sequential
 from tensorflow.keras.layers import Dense, LSTM
 
+from src import streaming
+from src.catalog import read_catalog
+from src.profiling import StageProfiler
+from src.sequences import SequenceSet, build_sequence_set
+
 SEQUENCE_LENGTH = 10
 FEATURES = [
     "latitude",
@@ -19,48 +24,138 @@ FEATURES = [
 ]
 
 
+def sequence_set(df: pd.DataFrame) -> SequenceSet:
+    """Per-zone windows of the last ``SEQUENCE_LENGTH`` events and the next magnitude."""
+    return build_sequence_set(df, FEATURES, SEQUENCE_LENGTH)
+
+
 def build_sequences(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
-    sequences: List[np.ndarray] = []
-    targets: List[float] = []
+    return sequence_set(df).materialize()
 
-    for _, zone_df in df.groupby("seismic_zone"):
-        zone_df = zone_df.sort_values("time")
-        data = zone_df[FEATURES].values
-        for idx in range(SEQUENCE_LENGTH, len(data)):
-            sequences.append(data[idx - SEQUENCE_LENGTH : idx])
-            targets.append(zone_df.iloc[idx]["magnitude"])
 
-    return np.array(sequences), np.array(targets)
+def build_model() -> Sequential:
+    model = Sequential(
+        [
+            LSTM(32, input_shape=(SEQUENCE_LENGTH, len(FEATURES))),
+            Dense(16, activation="relu"),
+            Dense(1),
+        ]
+    )
+    model.compile(optimizer="adam", loss="mse", metrics=["mae"])
+    return model
 
 
 def main() -> None:
-    input_path = Path("data/processed/features.csv")
+    parser = argparse.ArgumentParser(description="Train the LSTM sequence model")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read the feature store in chunks through tf.data (time-based split)",
+    )
+    parser.add_argument("--chunk-rows", type=int, default=streaming.DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--shuffle-buffer", type=int, default=10_000)
+    parser.add_argument(
+        "--features",
+        type=Path,
+        default=Path("data/processed/features.csv"),
+        help="Feature store for in-memory training, e.g. data/processed/features_declustered.csv",
+    )
+    parser.add_argument("--profile", action="store_true", help="Write a sampling profile per stage")
+    args = parser.parse_args()
+    profiler = StageProfiler("train_lstm", args.profile)
+
+    model = build_model()
+
+    if args.stream:
+        with profiler.stage("train_streaming"):
+            train_streaming(model, args.epochs, args.batch_size, args.chunk_rows, args.shuffle_buffer)
+        return
+
+    input_path = args.features
     if not input_path.exists():
         raise FileNotFoundError(
             "Missing features. Run: python -m src.feature_engineering"
         )
 
-    df = pd.read_csv(input_path, parse_dates=["time"])
-    sequences, targets = build_sequences(df)
-    if len(sequences) == 0:
+    with profiler.stage("load"):
+        df = read_catalog(input_path).to_frame()
+        samples = sequence_set(df)
+    if len(samples) == 0:
         raise ValueError("Not enough data to build LSTM sequences")
+    print(
+        f"{len(samples)} sequences; feature rows {samples.values.nbytes / 1e6:.1f} MB, "
+        f"windows if materialized {samples.window_nbytes / 1e6:.1f} MB"
+    )
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        sequences, targets, test_size=0.2, random_state=42
+    # Windows are copied one batch at a time from the shared feature rows, never all at once.
+    train_set, test_set = samples.split(test_size=0.2, seed=42)
+    fit_set, val_set = train_set.split(test_size=0.2, seed=43)
+    with profiler.stage("fit"):
+        history = model.fit(
+            fit_set.dataset(args.batch_size, shuffle=True, seed=42),
+            validation_data=val_set.dataset(args.batch_size),
+            epochs=args.epochs,
+            shuffle=False,  # the dataset reshuffles itself every epoch
+        )
+    with profiler.stage("evaluate"):
+        eval_loss, eval_mae = model.evaluate(test_set.dataset(args.batch_size), verbose=0)
+    _save(
+        model,
+        history,
+        eval_loss,
+        eval_mae,
+        {
+            "batch_size": args.batch_size,
+            "trained_through": df["time"].max().isoformat(),
+        },
     )
 
-    model = Sequential(
-        [
-            LSTM(32, input_shape=(SEQUENCE_LENGTH, len(FEATURES))),
-            Dense(16, activation="relu"),
-            Dense(1),
-        ]
+
+def train_streaming(model, epochs: int, batch_size: int, chunk_rows: int, shuffle_buffer: int) -> None:
+    """
+    Train from the feature store chunk by chunk: sequences whose target event
+    precedes the time cutoff train the model, newer ones validate it.
+    """
+    cutoff = streaming.time_cutoff(chunk_rows=chunk_rows)
+    print(f"Time split: training on events before {cutoff}")
+    rate = streaming.RowRate("lstm training input")
+    train_data = streaming.sequence_dataset(
+        FEATURES,
+        SEQUENCE_LENGTH,
+        cutoff,
+        "train",
+        batch_size,
+        chunk_rows=chunk_rows,
+        shuffle_buffer=shuffle_buffer,
+        rate=rate,
+    )
+    val_data = streaming.sequence_dataset(
+        FEATURES, SEQUENCE_LENGTH, cutoff, "val", batch_size, chunk_rows=chunk_rows
+    )
+    # Shuffling happens in the pipeline's buffer, not in Keras.
+    history = model.fit(train_data, validation_data=val_data, epochs=epochs, shuffle=False)
+    rate.report()
+    input_rate = rate.rate
+    eval_loss, eval_mae = model.evaluate(val_data, verbose=0)
+    _save(
+        model,
+        history,
+        eval_loss,
+        eval_mae,
+        {
+            "split": "time",
+            "cutoff": cutoff.isoformat(),
+            "input_rows_per_s": input_rate,
+            "batch_size": batch_size,
+            # Validation targets were not fit, so they stay in src.incremental's changeset.
+            "trained_through": streaming.last_time_before(cutoff, chunk_rows=chunk_rows).isoformat(),
+        },
     )
-    model.compile(optimizer="adam", loss="mse", metrics=["mae"])
 
-    history = model.fit(X_train, y_train, validation_split=0.2, epochs=10, batch_size=32)
-    eval_loss, eval_mae = model.evaluate(X_test, y_test, verbose=0)
 
+def _save(model, history, eval_loss: float, eval_mae: float, extra: Optional[Dict] = None) -> None:
     models_dir = Path("models")
     models_dir.mkdir(exist_ok=True)
     model.save(models_dir / "lstm_model.keras")
@@ -69,6 +164,7 @@ def main() -> None:
         "loss": float(eval_loss),
         "mae": float(eval_mae),
         "epochs": len(history.history.get("loss", [])),
+        **(extra or {}),
     }
     (models_dir / "lstm_metrics.json").write_text(json.dumps(metrics, indent=2))
 
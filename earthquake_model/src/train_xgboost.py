@@ -1,14 +1,20 @@
+import argparse
 import json
 from pathlib import Path
+from typing import Dict, Optional, Union
 
 import joblib
 import numpy as np
-import pandas as pd
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 from sklearn.model_selection import train_test_split
+import xgboost
 from xgboost import XGBRegressor
 
-from src.alert_classifier import classify_alert
+from src import streaming
+from src.catalog import read_catalog
+from src.drift import ProfileAccumulator, feature_profile
+from src.profiling import StageProfiler
+from src.alert_classifier import ALERT_LEVELS, classify_alert, classify_alerts
 
 FEATURES = [
     "latitude",
@@ -25,14 +31,169 @@ FEATURES = [
 ]
 
 
+PARAMS = {
+    "max_depth": 6,
+    "learning_rate": 0.05,
+    "subsample": 0.8,
+    "colsample_bytree": 0.8,
+    "objective": "reg:squarederror",
+    "random_state": 42,
+}
+N_ESTIMATORS = 300
+HIGH = ALERT_LEVELS.index("HIGH")
+
+
+def high_events(magnitudes: np.ndarray, zones: np.ndarray) -> np.ndarray:
+    """Rows whose observed magnitude is a HIGH alert in their zone; what ``high_weight`` up-weights."""
+    return classify_alerts(magnitudes, zones) == HIGH
+
+
+def _streaming_high_weight(high_weight: Union[float, str], cutoff, chunk_rows: int) -> float:
+    """Resolve a tuned ``high_weight``; "auto" is the non-HIGH/HIGH ratio of the training rows."""
+    if high_weight != "auto":
+        return float(high_weight)
+    high = total = 0
+    for chunk in streaming.iter_chunks(chunk_rows=chunk_rows, usecols=["magnitude", "seismic_zone"]):
+        chunk = chunk[streaming.part_mask(chunk["time"], cutoff, "train")]
+        high += int(high_events(chunk["magnitude"].to_numpy(), chunk["seismic_zone"].to_numpy()).sum())
+        total += len(chunk)
+    return (total - high) / high if high else 1.0
+
+
+def train_streaming(
+    chunk_rows: int,
+    params: Optional[Dict] = None,
+    n_estimators: int = N_ESTIMATORS,
+    val_fraction: float = 0.2,
+    high_weight: Union[float, str] = 1.0,
+) -> None:
+    """
+    Train from the feature store chunk by chunk through XGBoost external memory.
+
+    Rows before the time cutoff train the model, newer rows validate it, and
+    validation metrics are accumulated per chunk. ``high_weight`` up-weights
+    HIGH events as in the in-memory path.
+    """
+    cutoff = streaming.time_cutoff(val_fraction=val_fraction, chunk_rows=chunk_rows)
+    print(f"Time split: training on events before {cutoff}")
+
+    high_weight = _streaming_high_weight(high_weight, cutoff, chunk_rows)
+    weight = None
+    if high_weight != 1.0:
+        weight = lambda chunk: np.where(
+            high_events(chunk["magnitude"].to_numpy(), chunk["seismic_zone"].to_numpy()), high_weight, 1.0
+        ).astype(np.float32)
+    train_iter = streaming.FeatureChunkIter(FEATURES, cutoff, "train", chunk_rows=chunk_rows, weight=weight)
+    dtrain = xgboost.ExtMemQuantileDMatrix(train_iter)
+    train_iter.rate.report()
+    input_rate = train_iter.rate.rate
+    params = {**(params or PARAMS), "tree_method": "hist"}
+    params["seed"] = params.pop("random_state", 42)
+    train_rate = streaming.RowRate(f"xgboost training ({n_estimators} rounds)")
+    booster = xgboost.train(params, dtrain, num_boost_round=n_estimators)
+    train_rate.add(dtrain.num_row())
+    train_rate.report()
+
+    val_rate = streaming.RowRate("validation")
+    n = 0
+    squared = absolute = 0.0
+    matches = 0
+    # The drift reference for src.incremental is built from the training rows on the same pass.
+    profile = ProfileAccumulator()
+    for chunk in streaming.iter_chunks(chunk_rows=chunk_rows, usecols=[*FEATURES, "magnitude"]):
+        train = streaming.part_mask(chunk["time"], cutoff, "train")
+        if train.any():
+            profile.add(chunk[train])
+        chunk = chunk[~train]
+        if chunk.empty:
+            continue
+        y = chunk["magnitude"].to_numpy()
+        preds = booster.inplace_predict(chunk[FEATURES].fillna(0.0).to_numpy(dtype=np.float32))
+        squared += float(((preds - y) ** 2).sum())
+        absolute += float(np.abs(preds - y).sum())
+        matches += int((classify_alerts(preds) == classify_alerts(y)).sum())
+        n += len(chunk)
+        val_rate.add(len(chunk))
+    val_rate.report()
+    if n == 0:
+        raise ValueError("No rows after the time cutoff to validate on")
+
+    models_dir = Path("models")
+    models_dir.mkdir(exist_ok=True)
+    booster.save_model(models_dir / "xgb_model.json")
+    model = XGBRegressor()
+    model.load_model(models_dir / "xgb_model.json")
+    joblib.dump(model, models_dir / "xgb_model.joblib")
+
+    metrics = {
+        "rmse": float(np.sqrt(squared / n)),
+        "mae": absolute / n,
+        "alert_accuracy": matches / n,
+        "split": "time",
+        "cutoff": cutoff.isoformat(),
+        "train_rows": int(dtrain.num_row()),
+        "val_rows": n,
+        "input_rows_per_s": input_rate,
+        "params": params,
+        "n_estimators": n_estimators,
+        "high_weight": high_weight,
+        # Watermark and reference distribution for src.incremental: only the
+        # training part was fit, so validation rows are still part of the next changeset.
+        "trained_through": streaming.last_time_before(cutoff, chunk_rows=chunk_rows).isoformat(),
+        "feature_profile": profile.profile(),
+    }
+    (models_dir / "xgb_metrics.json").write_text(json.dumps(metrics, indent=2))
+
+    print(f"✅ XGBoost Regressor trained from the streaming feature store!")
+    print(f"   RMSE: {metrics['rmse']:.3f}")
+    print(f"   MAE: {metrics['mae']:.3f}")
+    print(f"   Alert Level Accuracy: {metrics['alert_accuracy']:.3f}")
+
+
 def main() -> None:
-    input_path = Path("data/processed/features.csv")
+    parser = argparse.ArgumentParser(description="Train the XGBoost magnitude regressor")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read the feature store in chunks through XGBoost external memory (time-based split)",
+    )
+    parser.add_argument("--chunk-rows", type=int, default=streaming.DEFAULT_CHUNK_ROWS)
+    parser.add_argument(
+        "--params",
+        type=Path,
+        default=None,
+        help="best_params.json from src.tune_xgboost to train with instead of the defaults",
+    )
+    parser.add_argument(
+        "--features",
+        type=Path,
+        default=Path("data/processed/features.csv"),
+        help="Feature store for in-memory training, e.g. data/processed/features_declustered.csv",
+    )
+    parser.add_argument("--profile", action="store_true", help="Write a sampling profile per stage")
+    args = parser.parse_args()
+    profiler = StageProfiler("train_xgboost", args.profile)
+    params, n_estimators = dict(PARAMS), N_ESTIMATORS
+    tuned = json.loads(args.params.read_text()) if args.params else None
+    if tuned:
+        params.update(tuned["params"], tree_method="hist")
+        n_estimators = tuned["n_estimators"]
+        print(f"Using tuned parameters {tuned['key']}: {n_estimators} trees, {tuned['params']}")
+    if args.stream:
+        with profiler.stage("train_streaming"):
+            train_streaming(
+                args.chunk_rows, params, n_estimators, high_weight=tuned.get("high_weight", 1.0) if tuned else 1.0
+            )
+        return
+
+    input_path = args.features
     if not input_path.exists():
         raise FileNotFoundError(
             "Missing features. Run: python -m src.feature_engineering"
         )
 
-    df = pd.read_csv(input_path)
+    with profiler.stage("load"):
+        df = read_catalog(input_path).to_frame()
     X = df[FEATURES].fillna(0.0)
     
     # Target is magnitude (regression problem)
@@ -42,31 +203,31 @@ def main() -> None:
         X, y, test_size=0.2, random_state=42
     )
 
-    # Calculate scale_pos_weight to emphasize HIGH magnitude events
-    # Count events above 5.5 (HIGH threshold) vs below
-    high_events = (y_train >= 5.5).sum()
-    non_high_events = (y_train < 5.5).sum()
-    scale_pos_weight = non_high_events / high_events if high_events > 0 else 1.0
-
-    model = XGBRegressor(
-        n_estimators=300,
-        max_depth=6,
-        learning_rate=0.05,
-        subsample=0.8,
-        colsample_bytree=0.8,
-        objective="reg:squarederror",
-        random_state=42,
-    )
-    model.fit(X_train, y_train)
+    # Calculate scale_pos_weight to emphasize HIGH events, using the same
+    # zone-aware HIGH definition as src.tune_xgboost
+    high = high_events(y_train, X_train["seismic_zone"].to_numpy())
+    high_count = int(high.sum())
+    scale_pos_weight = (len(high) - high_count) / high_count if high_count > 0 else 1.0
 
-    preds = model.predict(X_test)
-    rmse = float(np.sqrt(mean_squared_error(y_test, preds)))
-    mae = float(mean_absolute_error(y_test, preds))
-    
-    # Calculate accuracy by alert level
-    y_test_labels = [classify_alert(m) for m in y_test]
-    pred_labels = [classify_alert(m) for m in preds]
-    accuracy = sum(1 for a, b in zip(y_test_labels, pred_labels) if a == b) / len(y_test)
+    # Tuned configurations may up-weight HIGH events instead of leaving the ratio unused.
+    sample_weight = None
+    if tuned and tuned.get("high_weight", 1.0) != 1.0:
+        high_weight = scale_pos_weight if tuned["high_weight"] == "auto" else float(tuned["high_weight"])
+        sample_weight = np.where(high, high_weight, 1.0)
+
+    model = XGBRegressor(n_estimators=n_estimators, **params)
+    with profiler.stage("fit"):
+        model.fit(X_train, y_train, sample_weight=sample_weight)
+
+    with profiler.stage("evaluate"):
+        preds = model.predict(X_test)
+        rmse = float(np.sqrt(mean_squared_error(y_test, preds)))
+        mae = float(mean_absolute_error(y_test, preds))
+
+        # Calculate accuracy by alert level
+        y_test_labels = [classify_alert(m) for m in y_test]
+        pred_labels = [classify_alert(m) for m in preds]
+        accuracy = sum(1 for a, b in zip(y_test_labels, pred_labels) if a == b) / len(y_test)
 
     models_dir = Path("models")
     models_dir.mkdir(exist_ok=True)
@@ -77,7 +238,13 @@ def main() -> None:
         "rmse": rmse,
         "mae": mae,
         "alert_accuracy": float(accuracy),
-        "scale_pos_weight": float(scale_pos_weight)
+        "scale_pos_weight": float(scale_pos_weight),
+        "params": params,
+        "n_estimators": n_estimators,
+        "train_rows": int(len(X_train)),
+        # Watermark and reference distribution for src.incremental.
+        "trained_through": df["time"].max().isoformat(),
+        "feature_profile": feature_profile(X_train.assign(magnitude=y_train)),
     }
     (models_dir / "xgb_metrics.json").write_text(json.dumps(metrics, indent=2))
 